@@ -148,6 +148,45 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory by default; set REDIS_CACHE_URL to share the cache between processes
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.environ.get("REDIS_CACHE_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_CACHE_URL"],
+    }
+
+# Meal and food responses get ETags from the cache invalidation generations,
+# which only hold across processes when the cache is shared
+MEAL_RESPONSE_ETAGS = bool(os.environ.get("REDIS_CACHE_URL"))
+
+# Celery workers push job events to the web processes through the Redis of
+# CELERY_BROKER_URL by default; set JOB_EVENTS_REDIS_URL to use another one, or
+# to an empty string to fan them out in-process when everything runs in one
+JOB_EVENTS_REDIS_URL = os.environ.get("JOB_EVENTS_REDIS_URL")
+
+# ComfyUI backends jobs are dispatched to, comma separated in COMFYUI_SERVERS
+COMFYUI_SERVERS = [
+    server.strip()
+    for server in os.environ.get("COMFYUI_SERVERS", "127.0.0.1:8188").split(",")
+    if server.strip()
+]
+
+# Seconds the outputs of a job are reused for identical prompts, 0 disables it,
+# and the most results kept before the least recently used are dropped
+WORKFLOW_RESULT_CACHE_TTL = 7 * 24 * 60 * 60
+WORKFLOW_RESULT_CACHE_SIZE = 10000
+
+# Seconds to keep cached meal and food responses, 0 disables the cache
+MEAL_RESPONSE_CACHE_TIMEOUT = 60 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -190,4 +229,6 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
\ No newline at end of file
+CELERY_BROKER_URL = 'redis://localhost:6379/0'
+# Task modules outside the tasks.py of the apps
+CELERY_IMPORTS = ["utils.derivatives"]
\ No newline at end of file
@@ -5,6 +5,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls.i18n import i18n_patterns
 
+from utils.derivatives import serve_derivative
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('djoser.urls')),
@@ -16,6 +18,7 @@ urlpatterns = [
     path('api/', include("meal.urls")),
     path('api/cui/', include('job.urls')),  # Include the Job app's URLs
     path('api/', include("pushNotification.urls")),
+    path('api/media/derivative/', serve_derivative, name='media-derivative'),
 
 ]
 
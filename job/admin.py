@@ -2,8 +2,12 @@ from django.contrib import admin
 from django.utils.html import format_html
 from job.models.Dataset import Character, Dataset, DatasetImage
 from job.models.Job import Job
+from job.models.JobLogEntry import JobLogEntry
 from job.models.Workflow import Workflow
+from job.models.MediaBlob import MediaBlob
+from job.models.WorkflowResult import WorkflowResult
 from job.models.WorkflowRunner import WorkflowRunner
+from utils.derivatives import thumbnail_url
 
 
 # Register Workflow and WorkflowRunner
@@ -25,7 +29,7 @@ class DatasetImageInline(admin.StackedInline):
     def image_preview(self, obj):
         if obj.image:
             return format_html(
-                f'<img src="{obj.image.url}" style="width: 150px; height: auto;" />'
+                f'<img src="{thumbnail_url(obj.image)}" style="width: 150px; height: auto;" />'
             )
         return "No Image"
 
@@ -75,7 +79,7 @@ class DatasetImageAdmin(admin.ModelAdmin):
     def image_preview(self, obj):
         if obj.image:
             return format_html(
-                f'<img src="{obj.image.url}" style="width: 100px; height: auto;" />'
+                f'<img src="{thumbnail_url(obj.image)}" style="width: 100px; height: auto;" />'
             )
         return "No Image"
 
@@ -119,19 +123,40 @@ class CharacterAdmin(admin.ModelAdmin):
     def image_preview(self, obj):
         if obj.image:
             return format_html(
-                f'<img src="{obj.image.url}" style="width: 100px; height: auto;" />'
+                f'<img src="{thumbnail_url(obj.image)}" style="width: 100px; height: auto;" />'
             )
         return "No Image"
 
     image_preview.short_description = "Image Preview"
 @admin.register(Job)
 class JobAdmin(admin.ModelAdmin):
-    list_display = ['id', 'workflow', 'status', 'user', 'runtime', 'dataset']
+    list_display = ['id', 'workflow', 'status', 'user', 'runtime', 'backend', 'dataset']
     search_fields = ['workflow__name', 'user__username']
-    list_filter = ['status', 'dataset']
+    list_filter = ['status', 'backend', 'dataset']
 
     def dataset(self, obj):
         """Show the dataset associated with the job."""
         return obj.datasets.first().name if obj.datasets.exists() else "No Dataset"
 
     dataset.short_description = "Dataset"
+
+
+@admin.register(JobLogEntry)
+class JobLogEntryAdmin(admin.ModelAdmin):
+    list_display = ["job", "seq", "level", "type", "created_at"]
+    list_filter = ["level", "type"]
+    raw_id_fields = ["job"]
+
+
+@admin.register(WorkflowResult)
+class WorkflowResultAdmin(admin.ModelAdmin):
+    list_display = ["key", "job", "hits", "created_at", "last_used_at"]
+    search_fields = ["key"]
+    raw_id_fields = ["job"]
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ["name", "size", "ref_count", "created_at"]
+    search_fields = ["sha256", "name"]
+    readonly_fields = ["sha256", "name", "size", "ref_count", "created_at"]
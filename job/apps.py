@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class JobConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'job'
+
+    def ready(self):
+        from utils.derivatives import connect_derivative_signals
+        from utils.media_blobs import connect_blob_signals
+        from utils.workflow_cache import connect_workflow_cache_signals
+
+        # Images of datasets, characters, foods and users get thumbnails
+        connect_derivative_signals()
+        # References to the stored images are counted to collect unused ones
+        connect_blob_signals()
+        # Cached workflow results whose images are deleted are dropped
+        connect_workflow_cache_signals()
@@ -0,0 +1,45 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from utils.derivatives import (
+    IMAGE_FIELDS,
+    generate_derivatives,
+    generate_derivatives_task,
+    missing_derivatives,
+)
+
+
+class Command(BaseCommand):
+    help = "Writes the missing thumbnail and medium derivatives of the images already stored"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="run_async",
+            help="Queue a Celery task per image instead of generating them here",
+        )
+
+    def handle(self, *args, **options):
+        for label, field_name in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            names = (
+                model.objects.exclude(**{field_name: ""})
+                .exclude(**{f"{field_name}__isnull": True})
+                .values_list(field_name, flat=True)
+                .iterator()
+            )
+            done = failed = 0
+            for name in names:
+                if not missing_derivatives(name):
+                    continue
+                try:
+                    if options["run_async"]:
+                        generate_derivatives_task.delay(name)
+                    else:
+                        generate_derivatives(name)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{label} {name}: {str(e)}")
+            self.stdout.write(f"{label}: {done} images done, {failed} failed")
@@ -0,0 +1,90 @@
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, redirect_stdout
+
+from django.core.management.base import BaseCommand
+
+from utils import cui, cui_async
+from utils.fake_cui import FakeComfyUI
+
+
+def run_prompt(pool):
+    """Queue an empty prompt on the pool, wait for it and download its outputs."""
+    with pool.queue_prompt({}) as stream:
+        while True:
+            message = json.loads(stream.recv(timeout=60))
+            if message["type"] == "executing" and message["data"]["node"] is None:
+                break
+    asyncio.run(
+        cui_async.fetch_outputs(stream.prompt_id, stream.connection.server_address)
+    )
+    return stream.connection.server_address
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs jobs from concurrent workers on pools of fake ComfyUI backends that "
+        "each execute one prompt at a time, and reports the throughput per pool size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1,2,4", help="Comma separated pool sizes")
+        parser.add_argument("--jobs", type=int, default=24)
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Celery workers submitting jobs"
+        )
+        parser.add_argument(
+            "--seconds", type=float, default=0.2, help="GPU time of one prompt"
+        )
+
+    def handle(self, *args, **options):
+        steps = 20
+        messages = [
+            {"type": "progress", "data": {"value": step, "max": steps, "prompt_id": ""}}
+            for step in range(1, steps + 1)
+        ]
+        outputs = {
+            "9": {"images": [{"filename": "out.png", "subfolder": "", "type": "output"}]}
+        }
+
+        baseline = None
+        for size in [int(size) for size in options["sizes"].split(",")]:
+            with ExitStack() as stack:
+                servers = [
+                    stack.enter_context(
+                        FakeComfyUI(
+                            messages,
+                            outputs=outputs,
+                            images={"out.png": b"\x89PNG"},
+                            delay=options["seconds"] / steps,
+                            workers=1,
+                        )
+                    )
+                    for _ in range(size)
+                ]
+                stack.enter_context(redirect_stdout(io.StringIO()))
+                stack.callback(self.close_connections)
+                pool = cui.ComfyUIPool([server.address for server in servers])
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(options["workers"]) as executor:
+                    backends = list(
+                        executor.map(lambda _: run_prompt(pool), range(options["jobs"]))
+                    )
+                elapsed = time.perf_counter() - start
+
+            throughput = options["jobs"] / elapsed
+            baseline = baseline or throughput
+            spread = "/".join(str(backends.count(server.address)) for server in servers)
+            self.stdout.write(
+                f"{size} backends  {elapsed:.2f}s  {throughput:.1f} jobs/s  "
+                f"x{throughput / baseline:.1f}  jobs per backend {spread}"
+            )
+
+    def close_connections(self):
+        for comfyui in cui._connections.values():
+            comfyui.close()
+        cui._connections.clear()
@@ -0,0 +1,69 @@
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from utils.job_images import save_output_image
+
+
+def reencode(image_data, base_path):
+    """What run_workflow_task did before saving the bytes, as a baseline."""
+    image = Image.open(io.BytesIO(image_data))
+    image.save(f"{base_path}.png")
+
+
+def persist_job(save, images, directory, results):
+    """Save the outputs of one job in a fresh process and report its CPU time and peak RSS."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu_before = time.process_time()
+    for idx, image_data in enumerate(images):
+        save(image_data, os.path.join(directory, f"job_1_user_1_node_9_img_{idx}"))
+    cpu = time.process_time() - cpu_before
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    results.send((cpu, rss))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares decoding and re-encoding the 4K output images of a job before "
+        "saving them with writing the bytes ComfyUI returned, in CPU time and peak RSS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=4, help="Output images per job")
+        parser.add_argument("--width", type=int, default=3840)
+        parser.add_argument("--height", type=int, default=2160)
+
+    def handle(self, *args, **options):
+        size = (options["width"], options["height"])
+        # Noise, so the PNG is about as hard to compress as a generated image
+        noise = Image.merge("RGB", [Image.effect_noise(size, 64) for _ in range(3)])
+        buffer = io.BytesIO()
+        noise.save(buffer, "PNG", compress_level=4)  # The level ComfyUI saves with
+        image_data = buffer.getvalue()
+        del noise, buffer
+        images = [image_data] * options["images"]
+        self.stdout.write(
+            f"{options['images']} images of {size[0]}x{size[1]}, "
+            f"{len(image_data) / 2**20:.1f} MiB each"
+        )
+
+        # Each run forks so its peak RSS is measured from a fresh high-water mark
+        context = multiprocessing.get_context("fork")
+        for name, save in (("re-encode", reencode), ("bytes", save_output_image)):
+            with tempfile.TemporaryDirectory() as directory:
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=persist_job, args=(save, images, directory, sender)
+                )
+                process.start()
+                cpu, rss = receiver.recv()
+                process.join()
+            self.stdout.write(
+                f"{name:<10} cpu={cpu * 1000:.0f}ms per job  peak_rss=+{rss / 1024:.1f} MiB"
+            )
@@ -0,0 +1,116 @@
+import io
+import time
+from contextlib import redirect_stdout
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from job.models.Dataset import Dataset, DatasetImage
+from job.models.Job import Job
+from job.models.Workflow import Workflow
+from job.models.WorkflowRunner import WorkflowRunner
+from job.views.WorkflowRunnerViewSet import WorkflowRunnerViewSet
+from user.models import User
+
+
+def submit_one_by_one(user, runner, user_image, reference_images):
+    """The job submission of generate_character_samples before batches, as a baseline."""
+    dataset = Dataset.objects.create(name="Baseline", created_by=user)
+    request = Request(
+        APIRequestFactory().post("/", {}, format="json"), parsers=[JSONParser()]
+    )
+    request.user = user
+    view = WorkflowRunnerViewSet()
+    for reference_image in reference_images:
+        request.data["inputs"] = {
+            "user_image": user_image.get_full_image_url(request),
+            "reference_image": reference_image.get_full_image_url(request),
+        }
+        response = view.prepare_and_run_workflow(request, runner)
+        if response.status_code == status.HTTP_201_CREATED:
+            job = Job.objects.get(id=response.data.get("job_id"))
+            job.dataset = dataset
+            job.save()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares submitting the character sample jobs of a reference dataset one "
+        "by one with submitting them as one batch, then rolls back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--references", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create(phone_number="bench", full_name="Bench")
+            workflow = Workflow.objects.create(
+                name="Bench",
+                json_data={
+                    "10": {"class_type": "LoadImage", "inputs": {"image": ""}},
+                    "11": {"class_type": "LoadImage", "inputs": {"image": ""}},
+                },
+                inputs={"10": {"image": "image_url"}, "11": {"image": "image_url"}},
+                outputs={},
+                user=user,
+            )
+            runner = WorkflowRunner.objects.create(
+                workflow=workflow,
+                name="generate_character_sample",
+                input_mapping={
+                    "10": {"image": "user_image"},
+                    "11": {"image": "reference_image"},
+                },
+                created_by=user,
+            )
+            references = Dataset.objects.create(
+                name="face_test", created_by=user, dataset_type="image"
+            )
+            reference_images = DatasetImage.objects.bulk_create(
+                DatasetImage(
+                    name=f"Face {i}", image=f"faces/{i}.png", dataset=references, created_by=user
+                )
+                for i in range(options["references"])
+            )
+            user_image = DatasetImage.objects.create(
+                name="User", image="user.png", created_by=user
+            )
+
+            self.bench(
+                "one by one",
+                lambda: submit_one_by_one(user, runner, user_image, reference_images),
+            )
+
+            client = APIClient()
+            client.force_authenticate(user)
+            self.bench(
+                "batch",
+                lambda: client.post(
+                    "/api/cui/workflow-runners/characters/generate-character-samples/",
+                    {"dataset_image_id": user_image.pk},
+                    format="json",
+                ),
+            )
+
+            transaction.set_rollback(True)
+
+    def bench(self, name, run):
+        with mock.patch("job.views.WorkflowViewSet.group") as group, redirect_stdout(
+            io.StringIO()
+        ), CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+
+        tasks = sum(len(call.args[0]) for call in group.call_args_list)
+        self.stdout.write(
+            f"{name:<12} {elapsed * 1000:.1f}ms queries={len(queries):<5} "
+            f"enqueues={group.call_count:<4} tasks={tasks}"
+        )
@@ -0,0 +1,121 @@
+import io
+import json
+import time
+import uuid
+from contextlib import redirect_stdout
+from unittest import mock
+
+import websocket
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from job.models.Job import Job
+from job.models.Workflow import Workflow
+from user.models import User
+from utils import cui
+from utils.fake_cui import FakeComfyUI
+
+
+def recorded_stream(samplers, steps):
+    """Messages ComfyUI sends for a workflow with the given number of samplers."""
+    messages = [
+        {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 1}}}},
+        {"type": "execution_start", "data": {"prompt_id": ""}},
+        {"type": "execution_cached", "data": {"nodes": [], "prompt_id": ""}},
+    ]
+    for sampler in range(samplers):
+        node = str(sampler + 3)
+        messages.append({"type": "executing", "data": {"node": node, "prompt_id": ""}})
+        for step in range(1, steps + 1):
+            messages.append(
+                {
+                    "type": "progress",
+                    "data": {"value": step, "max": steps, "prompt_id": "", "node": node},
+                }
+            )
+        messages.append(
+            {"type": "executed", "data": {"node": node, "output": {}, "prompt_id": ""}}
+        )
+    return messages
+
+
+def save_per_message(ws, prompt, client_id, job_id):
+    """The log writing get_results did before log entries, as a baseline."""
+    prompt_id = cui.queue_prompt(prompt, client_id)["prompt_id"]
+    job = Job.objects.get(id=job_id)
+    while True:
+        out = ws.recv()
+        job.logs = (job.logs or "") + out + "\n"
+        job.save()
+        message = json.loads(out)
+        if message["type"] == "executing" and message["data"]["node"] is None:
+            if message["data"]["prompt_id"] == prompt_id:
+                return
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a ComfyUI WebSocket message stream from a fake server and compares "
+        "saving the job log text per message with buffered log entries, then rolls back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samplers", type=int, default=10)
+        parser.add_argument("--steps", type=int, default=20)
+        parser.add_argument(
+            "--stream",
+            help="JSON lines file of recorded WebSocket messages to replay instead",
+        )
+
+    def handle(self, *args, **options):
+        if options["stream"]:
+            with open(options["stream"], encoding="utf-8") as file:
+                messages = [json.loads(line) for line in file if line.strip()]
+        else:
+            messages = recorded_stream(options["samplers"], options["steps"])
+        self.stdout.write(f"Replaying {len(messages) + 1} messages")
+
+        with FakeComfyUI(messages) as server, transaction.atomic():
+            user = User.objects.create(phone_number="bench", full_name="Bench")
+            workflow = Workflow.objects.create(
+                name="Bench", json_data={}, inputs={}, outputs={}, user=user
+            )
+            with mock.patch.object(cui, "SERVER_ADDRESS", server.address):
+                job = Job.objects.create(workflow=workflow, user=user)
+                client_id = str(uuid.uuid4())
+                ws = websocket.WebSocket()
+                ws.connect(f"ws://{server.address}/ws?clientId={client_id}")
+                try:
+                    self.bench(
+                        "per message",
+                        lambda: save_per_message(ws, {}, client_id, job.id),
+                        job,
+                    )
+                finally:
+                    ws.close()
+
+                job = Job.objects.create(workflow=workflow, user=user)
+                comfyui = cui.ComfyUIConnection(server.address).start()
+                try:
+                    self.bench(
+                        "buffered", lambda: cui.get_results(comfyui, {}, job.id), job
+                    )
+                finally:
+                    comfyui.close()
+
+            transaction.set_rollback(True)
+
+    def bench(self, name, run, job):
+        with CaptureQueriesContext(connection) as queries, redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+
+        sent = sum(len(query["sql"]) for query in queries)
+        job.refresh_from_db()
+        lines = len((job.logs or "").splitlines()) + job.log_entries.count()
+        self.stdout.write(
+            f"{name:<12} {elapsed * 1000:.1f}ms queries={len(queries):<5} "
+            f"sql_bytes={sent:<10} logged={lines}"
+        )
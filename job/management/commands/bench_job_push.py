@@ -0,0 +1,100 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from job.models.Job import Job
+from job.models.JobLogEntry import JobLogEntry
+from job.models.Workflow import Workflow
+from user.models import User
+from utils.job_events import publish_job_event
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the database queries per connected client per minute of polling "
+        "a running job with following it over the job event stream, then rolls back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=50)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds between the status and log polls of a client",
+        )
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=120,
+            help="Progress updates the job publishes per minute",
+        )
+
+    # Publisher and clients share this process, so no Redis is needed
+    @override_settings(JOB_EVENTS_REDIS_URL="")
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create(phone_number="bench", full_name="Bench")
+            workflow = Workflow.objects.create(
+                name="Bench", json_data={}, inputs={}, outputs={}, user=user
+            )
+            job = Job.objects.create(workflow=workflow, user=user, status="running")
+            JobLogEntry.objects.append(
+                job.id, [("info", "progress", {"value": i}) for i in range(200)]
+            )
+            token = str(RefreshToken.for_user(user).access_token)
+
+            polls_per_minute = 60 / options["poll_interval"]
+            per_poll = self.poll(job, token)
+            self.stdout.write(
+                f"polling  {per_poll} queries per poll, "
+                f"{per_poll * polls_per_minute:.0f} per client per minute"
+            )
+
+            total = self.push(job, token, options["clients"], options["events"])
+            self.stdout.write(
+                f"push     {total} queries for {options['clients']} clients, "
+                f"{total / options['clients']:.1f} per client per minute"
+            )
+
+            transaction.set_rollback(True)
+
+    def poll(self, job, token):
+        """Queries of one polling round of a client: the status and the new log entries."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse("job-get-status", args=[job.id]))
+            client.get(reverse("job-get-logs", args=[job.id]), {"after_seq": 200})
+        return len(queries)
+
+    def push(self, job, token, clients, events):
+        """Queries of clients following the job for a minute of progress updates."""
+
+        async def follow():
+            client = AsyncClient()
+            params = {"ids": str(job.id), "token": token}
+            responses = [
+                await client.get(reverse("job-events"), params) for _ in range(clients)
+            ]
+            for value in range(events):
+                publish_job_event(job.id, "progress", {"percent": value * 100 / events})
+            publish_job_event(job.id, "status", {"status": "completed"})
+
+            async def read(response):
+                return [chunk async for chunk in response.streaming_content]
+
+            streams = await asyncio.gather(*(read(response) for response in responses))
+            return sum(len(stream) for stream in streams)
+
+        with CaptureQueriesContext(connection) as queries:
+            received = async_to_sync(follow)()
+        self.stdout.write(f"         {received} events delivered")
+        return len(queries)
@@ -0,0 +1,81 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from utils import cui, cui_async
+from utils.fake_cui import FakeComfyUI
+
+
+def download(server_address, prompt_id, output_path, results):
+    """Download the outputs of a prompt in a fresh process and report its peak RSS."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    images, _ = asyncio.run(
+        cui_async.fetch_outputs(prompt_id, server_address, output_path)
+    )
+    elapsed = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    results.send((elapsed, rss, sum(len(node_images) for node_images in images.values())))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the peak RSS of a worker downloading the 4K output images of a "
+        "job into memory with streaming them to files, for growing batch sizes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-sizes", default="4,16", help="Comma separated")
+        parser.add_argument("--width", type=int, default=3840)
+        parser.add_argument("--height", type=int, default=2160)
+
+    def handle(self, *args, **options):
+        size = (options["width"], options["height"])
+        noise = Image.merge("RGB", [Image.effect_noise(size, 64) for _ in range(3)])
+        buffer = io.BytesIO()
+        noise.save(buffer, "PNG", compress_level=4)
+        image_data = buffer.getvalue()
+        del noise, buffer
+        self.stdout.write(f"{size[0]}x{size[1]} images, {len(image_data) / 2**20:.1f} MiB each")
+
+        context = multiprocessing.get_context("fork")
+        for batch_size in [int(batch_size) for batch_size in options["batch_sizes"].split(",")]:
+            outputs = {
+                "9": {
+                    "images": [
+                        {"filename": f"{idx}.png", "subfolder": "", "type": "output"}
+                        for idx in range(batch_size)
+                    ]
+                }
+            }
+            images = {f"{idx}.png": image_data for idx in range(batch_size)}
+            with FakeComfyUI(outputs=outputs, images=images) as server:
+                prompt_id = cui.queue_prompt({}, str(uuid.uuid4()), server.address)["prompt_id"]
+                while prompt_id not in cui.get_history(prompt_id, server.address):
+                    time.sleep(0.01)
+
+                for name in ("memory", "files"):
+                    with tempfile.TemporaryDirectory() as directory:
+                        output_path = None
+                        if name == "files":
+                            output_path = os.path.join(directory, "node_{node_id}_img_{idx}")
+                        receiver, sender = context.Pipe(duplex=False)
+                        process = context.Process(
+                            target=download,
+                            args=(server.address, prompt_id, output_path, sender),
+                        )
+                        process.start()
+                        elapsed, rss, count = receiver.recv()
+                        process.join()
+                    self.stdout.write(
+                        f"batch={batch_size:<3} {name:<7} {elapsed * 1000:.0f}ms "
+                        f"images={count:<3} peak_rss=+{rss / 1024:.1f} MiB"
+                    )
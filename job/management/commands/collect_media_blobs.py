@@ -0,0 +1,81 @@
+import os
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from job.models.MediaBlob import MediaBlob, get_grace_period
+from utils.media_blobs import BLOB_DIRECTORY, BLOB_FIELDS, blob_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the stored images nothing references anymore: blobs left at no "
+        "references, e.g. base64 inputs or outputs of failed jobs, and files "
+        "without a blob from interrupted writes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=None,
+            help=(
+                "Seconds an unreferenced blob is kept after it was last stored, for "
+                "the jobs still reading it. Defaults to MEDIA_BLOB_GRACE_PERIOD"
+            ),
+        )
+        parser.add_argument(
+            "--recount",
+            action="store_true",
+            help="Recount the references of every blob from the image fields first",
+        )
+
+    def handle(self, *args, **options):
+        if options["recount"]:
+            self.recount()
+
+        grace = options["grace"] if options["grace"] is not None else get_grace_period()
+        storage = blob_storage()
+        names = list(MediaBlob.objects.unreferenced(grace).values_list("name", flat=True))
+        for name in names:
+            storage.delete(name, grace)
+
+        # Files whose blob row was rolled back, with their derivatives
+        known = set(MediaBlob.objects.values_list("sha256", flat=True))
+        removed = 0
+        for directory, _, files in os.walk(storage.path(BLOB_DIRECTORY)):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                sha256 = file_name.split(".")[0]
+                if sha256 not in known and os.path.getmtime(path) < time.time() - grace:
+                    os.unlink(path)
+                    removed += 1
+
+        self.stdout.write(f"Deleted {len(names)} unreferenced blobs and {removed} stray files")
+
+    def recount(self):
+        # The blob rows are locked before the image fields are read, so a
+        # reference acquired or released meanwhile waits and lands on top of
+        # the recount instead of being overwritten by it
+        with transaction.atomic():
+            blobs = list(MediaBlob.objects.select_for_update().order_by("pk"))
+
+            references = Counter()
+            for label, field_name in BLOB_FIELDS.items():
+                rows = (
+                    apps.get_model(label)
+                    .objects.exclude(**{field_name: ""})
+                    .values(field_name)
+                    .annotate(count=Count("pk"))
+                    .order_by()
+                )
+                for row in rows:
+                    references[row[field_name]] += row["count"]
+
+            for blob in blobs:
+                blob.ref_count = references[blob.name]
+            MediaBlob.objects.bulk_update(blobs, ["ref_count"], batch_size=500)
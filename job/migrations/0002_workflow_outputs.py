@@ -0,0 +1,19 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflow',
+            name='outputs',
+            field=models.JSONField(default={}),
+            preserve_default=False,
+        ),
+    ]
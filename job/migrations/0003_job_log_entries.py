@@ -0,0 +1,33 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0002_workflow_outputs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField()),
+                ('level', models.CharField(choices=[('info', 'Info'), ('warning', 'Warning'), ('error', 'Error')], default='info', max_length=10)),
+                ('type', models.CharField(max_length=50)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_entries', to='job.job')),
+            ],
+            options={
+                'ordering': ['seq'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='joblogentry',
+            constraint=models.UniqueConstraint(fields=('job', 'seq'), name='unique_job_log_seq'),
+        ),
+    ]
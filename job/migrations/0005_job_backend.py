@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0004_job_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='backend',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:27
+
+from django.db import migrations, models
+import utils.media_blobs
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0006_workflow_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.IntegerField(db_index=True, default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=utils.media_blobs.blob_storage, upload_to='characters/'),
+        ),
+        migrations.AlterField(
+            model_name='datasetimage',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=utils.media_blobs.blob_storage, upload_to='dataset_images/'),
+        ),
+    ]
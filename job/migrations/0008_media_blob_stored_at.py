@@ -0,0 +1,19 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0007_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='stored_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from job.models.Job import Job
 from user.models import User
 from django.db import models
 from user.models import User
+from utils.media_blobs import blob_storage
 
 
 class Dataset(models.Model):
@@ -28,6 +29,16 @@ class Dataset(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def temporary_for(cls, user):
+        """The temporary dataset collecting the jobs of a user that have none."""
+        dataset, _ = cls.objects.get_or_create(
+            name=f"Temp Dataset for {user.full_name}",
+            created_by=user,
+            temporary=True,  # Mark this dataset as temporary
+        )
+        return dataset
+
     @property
     def is_job_based(self):
         """Return True if the dataset type is 'job'."""
@@ -49,7 +60,9 @@ class Dataset(models.Model):
 
 class DatasetImage(models.Model):
     name = models.CharField(max_length=255)
-    image = models.ImageField(upload_to="dataset_images/", null=True, blank=True)
+    image = models.ImageField(
+        upload_to="dataset_images/", storage=blob_storage, null=True, blank=True
+    )
     job = models.ForeignKey(
         "Job", related_name="images", null=True, blank=True, on_delete=models.SET_NULL
     )
@@ -76,6 +89,36 @@ class DatasetImage(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def create_many(cls, images):
+        """
+        Insert unsaved images in one query and one transaction, setting their
+        ids. Uploaded files are written to storage before the insert and
+        removed again if it fails, so no row points to a missing file and no
+        file is left without a row. bulk_create sends no signals, so the blob
+        references are counted and the derivatives scheduled here.
+        """
+        from job.models.MediaBlob import MediaBlob
+        from utils.derivatives import schedule_derivatives
+
+        written = []
+        try:
+            for image in images:
+                if image.image and not image.image._committed:
+                    image.image.save(image.image.name, image.image.file, save=False)
+                    written.append(image.image)
+            with transaction.atomic():
+                images = cls.objects.bulk_create(images)
+                MediaBlob.objects.acquire(image.image.name for image in images)
+                for image in images:
+                    if image.image:
+                        schedule_derivatives(image.image.name)
+        except BaseException:
+            for field_file in written:
+                field_file.storage.delete(field_file.name)
+            raise
+        return images
+
     def get_full_image_url(self, request):
         """Returns the full URL for the image."""
         if self.image:
@@ -94,7 +137,7 @@ class Character(models.Model):
         blank=True,
     )  # List of datasets
     image = models.ImageField(
-        upload_to="characters/", null=True, blank=True
+        upload_to="characters/", storage=blob_storage, null=True, blank=True
     )  # Character image
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
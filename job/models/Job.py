@@ -24,6 +24,12 @@ class Job(models.Model):
         null=True, blank=True
     )  # Input data for the job (now JSONField)
     logs = models.TextField(null=True, blank=True)  # Field for logs
+    progress = models.JSONField(
+        null=True, blank=True
+    )  # Executing node, percent and ETA, see utils.job_progress
+    backend = models.CharField(
+        max_length=255, null=True, blank=True
+    )  # ComfyUI server the job ran on
     user = models.ForeignKey(User, on_delete=models.CASCADE)  # Link to the Django user
     dataset = models.ForeignKey('job.Dataset', related_name='jobs', on_delete=models.CASCADE,null=True,blank=True)  # A Job belongs to one Dataset
     def __str__(self):
@@ -0,0 +1,50 @@
+from django.db import models, transaction
+from django.db.models import Max
+
+from job.models.Job import Job
+
+
+class JobLogEntryQuerySet(models.QuerySet):
+    def append(self, job_id, entries):
+        """
+        Append (level, type, payload) entries to the log of a job, numbering
+        them after its last entry. The job row is locked so concurrent writers
+        of one job take turns.
+        """
+        if not entries:
+            return []
+        with transaction.atomic():
+            Job.objects.select_for_update().filter(pk=job_id).exists()
+            last_seq = self.filter(job_id=job_id).aggregate(last=Max("seq"))["last"] or 0
+            return self.bulk_create(
+                JobLogEntry(
+                    job_id=job_id, seq=last_seq + i, level=level, type=type, payload=payload
+                )
+                for i, (level, type, payload) in enumerate(entries, start=1)
+            )
+
+
+class JobLogEntry(models.Model):
+    LEVEL_CHOICES = [
+        ("info", "Info"),
+        ("warning", "Warning"),
+        ("error", "Error"),
+    ]
+
+    job = models.ForeignKey(Job, related_name="log_entries", on_delete=models.CASCADE)
+    seq = models.PositiveIntegerField()  # Position in the log of the job, from 1
+    level = models.CharField(max_length=10, choices=LEVEL_CHOICES, default="info")
+    type = models.CharField(max_length=50)  # ComfyUI message type or "error", "outputs"...
+    payload = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = JobLogEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["seq"]
+        constraints = [
+            models.UniqueConstraint(fields=["job", "seq"], name="unique_job_log_seq")
+        ]
+
+    def __str__(self):
+        return f"Job {self.job_id} #{self.seq} {self.type}"
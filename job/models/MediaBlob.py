@@ -0,0 +1,72 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+
+def get_grace_period():
+    return getattr(settings, "MEDIA_BLOB_GRACE_PERIOD", 24 * 60 * 60)
+
+
+class MediaBlobQuerySet(models.QuerySet):
+    def acquire(self, names):
+        """Count one more reference to the blob of each name, once per occurrence."""
+        self._add_references(names, 1)
+
+    def release(self, names):
+        """
+        Count one reference less to the blob of each name, once per occurrence,
+        and delete the blobs no longer referenced once the transaction commits,
+        unless they were stored again within the grace period. Those are left
+        to collect_media_blobs.
+        """
+        names = [name for name in names if name]
+        self._add_references(names, -1)
+        self.collect(self.filter(name__in=set(names), ref_count__lte=0))
+
+    def unreferenced(self, grace=None):
+        """
+        Blobs nothing references that weren't stored within the last grace
+        seconds. A blob just stored again is about to get a reference, e.g.
+        from the job whose output it is.
+        """
+        if grace is None:
+            grace = get_grace_period()
+        return self.filter(ref_count__lte=0, stored_at__lt=now() - timedelta(seconds=grace))
+
+    def collect(self, blobs):
+        """Delete the files of unreferenced blobs, after the transaction commits."""
+        from utils.media_blobs import blob_storage
+
+        for name in blobs.values_list("name", flat=True):
+            transaction.on_commit(lambda name=name: blob_storage().delete(name))
+
+    def _add_references(self, names, delta):
+        # One UPDATE per distinct number of occurrences rather than per name
+        by_count = {}
+        for name, count in Counter(name for name in names if name).items():
+            by_count.setdefault(count, []).append(name)
+        for count, grouped in by_count.items():
+            self.filter(name__in=grouped).update(ref_count=F("ref_count") + delta * count)
+
+
+class MediaBlob(models.Model):
+    """
+    An image stored once under the sha256 of its bytes, however many
+    DatasetImages, Characters and Foods point to it. See utils.media_blobs.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)  # Its name in the media storage
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    stored_at = models.DateTimeField(default=now)  # Last time its bytes were stored
+
+    objects = MediaBlobQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
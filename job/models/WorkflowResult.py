@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F
+from django.utils.timezone import now
+
+from job.models.Job import Job
+
+
+def get_ttl():
+    return getattr(settings, "WORKFLOW_RESULT_CACHE_TTL", 7 * 24 * 60 * 60)
+
+
+def get_max_entries():
+    return getattr(settings, "WORKFLOW_RESULT_CACHE_SIZE", 10000)
+
+
+class WorkflowResultQuerySet(models.QuerySet):
+    def lookup(self, key):
+        """The completed job whose outputs are cached under a key, or None."""
+        return self.lookup_many([key]).get(key)
+
+    def lookup_many(self, keys):
+        """
+        The completed jobs whose outputs are cached under any of the keys, by
+        key. Entries expire TTL seconds after they are stored, and hits mark
+        their entries as recently used.
+        """
+        ttl = get_ttl()
+        if not ttl:
+            return {}
+        entries = list(
+            self.filter(
+                key__in=set(keys),
+                created_at__gte=now() - timedelta(seconds=ttl),
+                job__status="completed",
+            ).select_related("job")
+        )
+        if entries:
+            self.filter(pk__in=[entry.pk for entry in entries]).update(
+                last_used_at=now(), hits=F("hits") + 1
+            )
+        return {entry.key: entry.job for entry in entries}
+
+    def store(self, key, job):
+        """
+        Cache the outputs of a completed job under a key, then drop expired
+        entries and the least recently used ones beyond the size limit.
+        """
+        ttl = get_ttl()
+        if not ttl:
+            return
+        self.update_or_create(
+            key=key, defaults={"job": job, "created_at": now(), "last_used_at": now()}
+        )
+        self.filter(created_at__lt=now() - timedelta(seconds=ttl)).delete()
+        stale = list(
+            self.order_by("-last_used_at").values_list("pk", flat=True)[get_max_entries():]
+        )
+        if stale:
+            self.filter(pk__in=stale).delete()
+
+
+class WorkflowResult(models.Model):
+    """A completed job whose outputs are reused for identical prompts."""
+
+    key = models.CharField(max_length=64, unique=True)  # See utils.workflow_cache
+    job = models.ForeignKey(Job, related_name="cached_results", on_delete=models.CASCADE)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(db_index=True)
+
+    objects = WorkflowResultQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.key[:12]} -> Job {self.job_id}"
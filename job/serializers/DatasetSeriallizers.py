@@ -1,15 +1,19 @@
 from rest_framework import serializers
 
 from job.models.Dataset import Character, Dataset, DatasetImage
+from utils.derivatives import ImageDerivativesField
 
 
 class DatasetImageSerializer(serializers.ModelSerializer):
+    image_derivatives = ImageDerivativesField(source="image")
+
     class Meta:
         model = DatasetImage
         fields = [
             "id",
             "name",
             "image",
+            "image_derivatives",
             "job",
             "complex_prompt",
             "tag_prompt",
@@ -109,6 +109,32 @@ class RunWorkflowSerializer(serializers.Serializer):
         ),
         help_text="A dictionary of node IDs and their input data (either a string or an image file).",
     )
+    use_cache = serializers.BooleanField(
+        default=True,
+        help_text="Reuse the outputs of an earlier job with the same prompt. Turn off for random seeds.",
+    )
+
+
+class RunWorkflowBatchSerializer(serializers.Serializer):
+    """Serializer to handle the inputs of a batch of jobs of one workflow."""
+
+    MAX_JOBS = 500
+
+    inputs = serializers.ListField(
+        child=serializers.DictField(
+            child=serializers.DictField(child=NodeInputSerializer()),
+        ),
+        min_length=1,
+        max_length=MAX_JOBS,
+        help_text="The inputs of each job, like the inputs of a single run.",
+    )
+    dataset = serializers.IntegerField(
+        required=False, help_text="ID of a dataset of yours to add the jobs to."
+    )
+    use_cache = serializers.BooleanField(
+        default=True,
+        help_text="Reuse the outputs of earlier jobs with the same prompt. Turn off for random seeds.",
+    )
 
 
 class WorkflowCreateSerializer(serializers.ModelSerializer):
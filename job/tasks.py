@@ -1,37 +1,49 @@
-import io
 import os
-import json
-from PIL import Image
 from django.conf import settings
 from django.utils.timezone import now
 from celery import shared_task
 from job.models.Job import Job
 from job.models.Dataset import Dataset, DatasetImage
+from job.models.WorkflowResult import WorkflowResult
 from utils.cui import run_workflow  # Assuming run_workflow function is defined in utils
+from utils.job_events import publish_job_event
+from utils.job_logs import log_job
+from utils.media_blobs import blob_storage
 
 @shared_task(bind=True)
-def run_workflow_task(self, job_id, modified_workflow):
+def run_workflow_task(self, job_id, modified_workflow, cache_key=None):
     """
     Celery task to execute the workflow with user-provided inputs, save the resulting images,
     update the job with those images, and track the job duration.
     If no datasets are associated with the job, create a temporary dataset for the user.
+    With a cache_key, the outputs of the completed job are reused for identical prompts.
     """
     job = Job.objects.get(id=job_id)
     user = job.user  # Get the user associated with the job
     job.status = "running"
     start_time = now()  # Capture the start time
     job.save()
+    publish_job_event(job_id, "status", {"status": job.status})
 
     workflow_outputs = job.workflow.outputs  # Get the workflow outputs
+    stored_images = []  # Blobs of the output images, removed again if the job fails
     additional_logs = {
         "extra_images": [],
         "extra_texts": []
     }
 
     try:
-        # Run the workflow and get images in byte form and texts
-        client_id = str(self.request.id)  # Unique client ID from Celery task
-        images, texts = run_workflow(modified_workflow, job_id, client_id)
+        # Create a directory for the user's images
+        user_dir = os.path.join(settings.MEDIA_ROOT, f"user_{user.id}")
+        os.makedirs(user_dir, exist_ok=True)
+
+        # Run the workflow, streaming its images to the user's directory under
+        # recognizable names with the extension of their format, and get the
+        # paths of the images and the texts
+        output_path = os.path.join(
+            user_dir, f"job_{job_id}_user_{user.id}_node_{{node_id}}_img_{{idx}}"
+        )
+        images, texts = run_workflow(modified_workflow, job_id, output_path)
         job = Job.objects.get(id=job_id)
 
         # Initialize the result data
@@ -65,32 +77,14 @@ def run_workflow_task(self, job_id, modified_workflow):
 
         # If the job has no associated datasets, create a temporary dataset for the user
         if not job.dataset:
-            temp_dataset, created = Dataset.objects.get_or_create(
-                name=f"Temp Dataset for {user.full_name}",
-                created_by=user,
-                temporary=True,  # Mark this dataset as temporary
-            )
-            job.dataset = temp_dataset  # Add the dataset to the job
+            job.dataset = Dataset.temporary_for(user)  # Add the dataset to the job
             job.save()
 
-        # Create a directory for the user's images
-        user_dir = os.path.join(settings.MEDIA_ROOT, f"user_{user.id}")
-        os.makedirs(user_dir, exist_ok=True)
-
         # Process images and associate them with workflow outputs
         filtered_images = {}
+        dataset_images = []
         for node_id, image_list in images.items():
-            for idx, image_data in enumerate(image_list):
-                # Convert image bytes to Image object
-                image = Image.open(io.BytesIO(image_data))
-
-                # Generate a recognizable filename
-                filename = f"job_{job_id}_user_{user.id}_node_{node_id}_img_{idx}.png"
-                file_path = os.path.join(user_dir, filename)
-
-                # Save image to the media directory
-                image.save(file_path)
-
+            for idx, file_path in enumerate(image_list):
                 # Store the relative URL and create the full URL
                 relative_url = os.path.relpath(file_path, settings.MEDIA_ROOT)
                 full_url = os.path.join(settings.MEDIA_URL, relative_url)
@@ -102,8 +96,13 @@ def run_workflow_task(self, job_id, modified_workflow):
 
                     # Use the workflow-determined input name for the image output
                     input_name = workflow_outputs[node_id]['images']
-                    # Create DatasetImage for each image and associate text prompts
-                    dataset_image = DatasetImage.objects.create(
+                    # Move the image into the blob store, where identical
+                    # outputs of other jobs share one file
+                    file_path = blob_storage().store_file(file_path)
+                    stored_images.append(file_path)
+                    full_url = blob_storage().url(file_path)
+                    # Build a DatasetImage for each image and associate text prompts
+                    dataset_image = DatasetImage(
                         job=job,
                         name=f"Generated Image {idx}",
                         image=file_path,
@@ -112,16 +111,12 @@ def run_workflow_task(self, job_id, modified_workflow):
                         complex_prompt=complex_prompt,
                         tag_prompt=tag_prompt,
                     )
-                    result_data[node_id][input_name] = {
-                        "id": f"{dataset_image.id}",  # Add the ID for the output image
-                        "type": "image",
-                        "value": full_url  # Store the full URL of the image
-                    }
+                    dataset_images.append((node_id, input_name, full_url, dataset_image))
 
                     # Add to filtered images
                     if node_id not in filtered_images:
                         filtered_images[node_id] = []
-                    filtered_images[node_id].append(image_data)
+                    filtered_images[node_id].append(file_path)
 
                 else:
                     # Save the image URL to logs for non-workflow outputs
@@ -130,6 +125,15 @@ def run_workflow_task(self, job_id, modified_workflow):
                         "image_url": full_url
                     })
 
+        # Insert the images of all outputs at once, then point the outputs to their ids
+        DatasetImage.create_many([dataset_image for *_, dataset_image in dataset_images])
+        for node_id, input_name, full_url, dataset_image in dataset_images:
+            result_data[node_id][input_name] = {
+                "id": f"{dataset_image.id}",  # Add the ID for the output image
+                "type": "image",
+                "value": full_url  # Store the full URL of the image
+            }
+
         # Handle extra texts not in workflow outputs
         for node_id, text_value in texts.items():
             if node_id not in workflow_outputs:
@@ -150,27 +154,35 @@ def run_workflow_task(self, job_id, modified_workflow):
         job.result_data = result_data
         job.status = "completed"
 
-        # Append the additional logs (extra texts and images)
-        job.logs = (job.logs or "") + "\n" + json.dumps(additional_logs)
+        # Log the outputs the workflow does not declare (extra texts and images)
+        log_job(job_id, "extra_outputs", additional_logs)
 
     except Exception as e:
         job = Job.objects.get(id=job_id)
 
+        # Output images no row references would stay on disk forever
+        blob_storage().discard(stored_images)
+
         # In case of failure, log the error and mark job as failed
         job.status = "failed"
-        job.logs = (job.logs or "") + "Error in saving task results: \n " + str(e) + "\n "
+        log_job(
+            job_id, "error", {"message": f"Error in saving task results: {e}"}, "error"
+        )
 
     finally:
-        # Track the job duration and append to logs in proper JSON format
+        # Track the job duration and log it
         end_time = now()
         job.runtime = end_time - start_time  # Store the duration in 'runtime' field
+        log_job(job_id, "duration", {"duration": str(job.runtime)})
+
+        job.save()  # Save job status and result
 
-        # Append duration to logs in JSON format
-        duration_log = json.dumps({
-            "duration": str(job.runtime)
-        })
-        job.logs = (job.logs or "") + "\n" + duration_log
+        if cache_key and job.status == "completed":
+            WorkflowResult.objects.store(cache_key, job)
 
-        job.save()  # Save job status, result, and logs
+        # Push the outcome to the clients following the job
+        if job.status == "completed":
+            publish_job_event(job_id, "outputs", {"result_data": job.result_data})
+        publish_job_event(job_id, "status", {"status": job.status})
 
     return job_id
\ No newline at end of file
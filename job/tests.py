@@ -1,3 +1,1234 @@
-from django.test import TestCase
+import base64
+import copy
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import websocket
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from job.models.Dataset import Dataset, DatasetImage
+from job.models.Job import Job
+from job.models.JobLogEntry import JobLogEntry
+from job.models.MediaBlob import MediaBlob
+from job.models.Workflow import Workflow
+from job.models.WorkflowResult import WorkflowResult
+from job.models.WorkflowRunner import WorkflowRunner
+from job.tasks import run_workflow_task
+from user.models import User
+from utils import cui
+from utils.cui_async import AsyncComfyUIClient, fetch_outputs
+from utils.derivatives import derivative_name, generate_derivatives, thumbnail_url
+from utils.fake_cui import FakeComfyUI
+from utils.job_events import publish_job_event
+from utils.job_images import read_image_header, save_output_image
+from utils.job_logs import JobLogBuffer, log_job
+from utils.job_progress import JobProgressTracker
+from utils.media_blobs import BLOB_DIRECTORY, blob_name, blob_storage
+from utils.workflow_cache import workflow_cache_key
+
+
+# Job events are fanned out in-process, there is no Redis in tests
+@override_settings(JOB_EVENTS_REDIS_URL="")
+class JobTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number="09120000000", full_name="Tester", password="secret"
+        )
+        self.client.force_authenticate(self.user)
+        self.workflow = Workflow.objects.create(
+            name="Workflow", json_data={}, inputs={}, outputs={}, user=self.user
+        )
+        self.job = Job.objects.create(workflow=self.workflow, user=self.user)
+
+
+class JobConditionalGetTest(JobTestCase):
+    def test_status_is_not_modified_until_the_job_changes(self):
+        url = reverse("job-get-status", args=[self.job.pk])
+        etag = self.client.get(url)["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.job.status = "running"
+        self.job.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"status": "running"})
+
+    def test_result_changes_when_the_job_completes(self):
+        url = reverse("job-get-result", args=[self.job.pk])
+        etag = self.client.get(url)["ETag"]
+
+        self.job.status = "completed"
+        self.job.result_data = {"9": {"images": {"type": "image", "value": "/media/a.png"}}}
+        self.job.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["result_data"], self.job.result_data)
+
+
+class JobLogBufferTest(JobTestCase):
+    def log(self):
+        return list(self.job.log_entries.values_list("seq", "level", "type", "payload"))
+
+    def test_entries_are_appended_in_batches(self):
+        log_job(self.job.id, "status", {"queued": True})
+
+        with mock.patch.object(
+            JobLogEntry.objects, "append", wraps=JobLogEntry.objects.append
+        ) as append:
+            with JobLogBuffer(self.job.id, max_entries=4, max_delay=60) as logs:
+                for step in range(10):
+                    logs.write("progress", {"value": step})
+
+        self.assertEqual(
+            self.log(),
+            [(1, "info", "status", {"queued": True})]
+            + [(step + 2, "info", "progress", {"value": step}) for step in range(10)],
+        )
+        # One append per 4 entries, plus the rest when the buffer closes
+        self.assertEqual(append.call_count, 3)
+
+    def test_entries_are_flushed_when_the_job_fails(self):
+        with self.assertRaises(RuntimeError):
+            with JobLogBuffer(self.job.id, max_delay=60) as logs:
+                logs.write("progress", {"value": 1})
+                raise RuntimeError("Sampler crashed")
+
+        self.assertEqual(self.log(), [(1, "info", "progress", {"value": 1})])
+
+    def test_results_stream_is_logged_without_a_write_per_message(self):
+        messages = [
+            {"type": "progress", "data": {"value": step, "max": 20, "prompt_id": ""}}
+            for step in range(1, 21)
+        ]
+        with FakeComfyUI(messages) as server, mock.patch.object(
+            cui, "SERVER_ADDRESS", server.address
+        ):
+            comfyui = cui.ComfyUIConnection(server.address).start()
+            try:
+                with CaptureQueriesContext(connection) as queries, redirect_stdout(
+                    io.StringIO()
+                ):
+                    cui.get_results(comfyui, {}, self.job.id)
+            finally:
+                comfyui.close()
+
+        log = self.log()
+        self.assertEqual(len(log), 21)
+        self.assertEqual(log[-1][2], "executing")
+        self.assertLess(len(queries), 21)
+
+
+class JobLogEndpointTest(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job.logs = "Legacy log text\n"
+        self.job.save()
+        JobLogEntry.objects.append(
+            self.job.id, [("info", "progress", {"value": step}) for step in range(1, 8)]
+        )
+        log_job(
+            self.job.id,
+            "extra_outputs",
+            {"extra_images": [{"node_id": "9", "image_url": "/media/user_1/a.png"}]},
+        )
+        self.url = reverse("job-get-logs", args=[self.job.pk])
+
+    def test_pollers_only_download_new_entries(self):
+        first = self.client.get(self.url, {"limit": 5}).data
+        self.assertEqual(first["logs"], "Legacy log text\n")
+        self.assertEqual([entry["seq"] for entry in first["entries"]], [1, 2, 3, 4, 5])
+        self.assertTrue(first["has_more"])
+
+        second = self.client.get(self.url, {"after_seq": first["last_seq"]}).data
+        self.assertNotIn("logs", second)
+        self.assertEqual([entry["seq"] for entry in second["entries"]], [6, 7, 8])
+        self.assertFalse(second["has_more"])
+
+        log_job(self.job.id, "duration", {"duration": "0:00:05"})
+        third = self.client.get(self.url, {"after_seq": second["last_seq"]}).data
+        self.assertEqual([entry["type"] for entry in third["entries"]], ["duration"])
+
+        idle = self.client.get(self.url, {"after_seq": third["last_seq"]}).data
+        self.assertEqual((idle["entries"], idle["last_seq"]), ([], 9))
+
+    def test_extra_image_urls_are_absolute(self):
+        entries = self.client.get(self.url, {"after_seq": 7}).data["entries"]
+
+        image = entries[0]["payload"]["extra_images"][0]
+        self.assertEqual(image["image_url"], "http://testserver/media/user_1/a.png")
+
+    def test_tail_returns_the_last_entries(self):
+        response = self.client.get(
+            reverse("job-tail-logs", args=[self.job.pk]), {"lines": 3}
+        )
+
+        self.assertEqual([entry["seq"] for entry in response.data["entries"]], [6, 7, 8])
+        self.assertEqual(response.data["last_seq"], 8)
+        self.assertNotIn("created_at", response.data["entries"][0])
+
+    def test_invalid_after_seq_is_rejected(self):
+        response = self.client.get(self.url, {"after_seq": "latest"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class JobProgressTest(JobTestCase):
+    prompt = {
+        "1": {"class_type": "CheckpointLoaderSimple"},
+        "2": {"class_type": "CLIPTextEncode"},
+        "3": {"class_type": "KSampler"},
+        "4": {"class_type": "SaveImage"},
+    }
+
+    def track(self, messages):
+        tracker = JobProgressTracker(self.job.id, "prompt", self.prompt, min_interval=60)
+        for message in messages:
+            tracker.handle(message)
+        return tracker
+
+    def test_progress_follows_nodes_and_steps(self):
+        tracker = self.track(
+            [
+                {"type": "execution_start", "data": {"prompt_id": "prompt"}},
+                {"type": "execution_cached", "data": {"nodes": ["1", "2"], "prompt_id": "prompt"}},
+                {"type": "executing", "data": {"node": "3", "prompt_id": "prompt"}},
+                {"type": "progress", "data": {"value": 10, "max": 20, "prompt_id": "prompt"}},
+                # Frames of other prompts of the same client are ignored
+                {"type": "progress", "data": {"value": 1, "max": 20, "prompt_id": "other"}},
+            ]
+        )
+
+        state = tracker.state()
+        self.assertEqual((state["node"], state["node_type"]), ("3", "KSampler"))
+        self.assertEqual((state["value"], state["max"], state["nodes_done"]), (10, 20, 2))
+        self.assertEqual(state["percent"], 62.5)
+        self.assertIsNotNone(state["eta_seconds"])
+
+        # Steps within the interval are not written, the node change was
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.progress["node"], "3")
+        self.assertEqual(self.job.progress["value"], 0)
+
+    def test_finished_prompt_is_complete(self):
+        self.track(
+            [
+                {"type": "executing", "data": {"node": "4", "prompt_id": "prompt"}},
+                {"type": "executing", "data": {"node": None, "prompt_id": "prompt"}},
+            ]
+        )
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.progress["percent"], 100)
+        self.assertIsNone(self.job.progress["eta_seconds"])
+
+    def test_progress_endpoint_skips_logs_and_results(self):
+        self.track([{"type": "executing", "data": {"node": "3", "prompt_id": "prompt"}}])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("job-get-progress", args=[self.job.pk]))
+
+        self.assertEqual(response.data["status"], "pending")
+        self.assertEqual(response.data["progress"]["node_type"], "KSampler")
+        job_query = [query["sql"] for query in queries if '"job_job"' in query["sql"]][-1]
+        self.assertNotIn("logs", job_query)
+        self.assertNotIn("result_data", job_query)
+
+
+class JobEventStreamTest(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.url = reverse("job-events")
+
+    async def read(self, response):
+        return "".join([chunk.decode() async for chunk in response.streaming_content])
+
+    def parse(self, body):
+        events = []
+        for block in body.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    async def test_updates_are_pushed_until_the_jobs_finish(self):
+        response = await self.async_client.get(
+            self.url,
+            {"ids": str(self.job.id)},
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        publish_job_event(self.job.id, "status", {"status": "running"})
+        publish_job_event(self.job.id + 1, "status", {"status": "running"})
+        publish_job_event(self.job.id, "progress", {"percent": 50.0})
+        publish_job_event(
+            self.job.id,
+            "outputs",
+            {"result_data": {"9": {"image": {"type": "image", "value": "/media/a.png"}}}},
+        )
+        publish_job_event(self.job.id, "status", {"status": "completed"})
+        events = self.parse(await self.read(response))
+
+        self.assertEqual(
+            [event for event, _ in events],
+            ["status", "status", "progress", "outputs", "status"],
+        )
+        self.assertEqual(events[0][1], {"job": self.job.id, "status": "pending"})
+        self.assertEqual(
+            events[3][1]["result_data"]["9"]["image"]["value"],
+            "http://testserver/media/a.png",
+        )
+        self.assertTrue(all(data["job"] == self.job.id for _, data in events))
+
+    async def test_finished_jobs_get_their_state_and_end_the_stream(self):
+        await Job.objects.filter(pk=self.job.pk).aupdate(
+            status="completed", result_data={}, progress={"percent": 100.0}
+        )
+
+        response = await self.async_client.get(
+            self.url, {"ids": str(self.job.id), "token": self.token}
+        )
+        body = await self.read(response)
+
+        self.assertIn('"status": "completed"', body)
+        self.assertIn("event: outputs", body)
+
+    async def test_stream_ends_when_the_job_finishes_without_events(self):
+        with mock.patch("job.views.JobEventView.HEARTBEAT_SECONDS", 0.05):
+            response = await self.async_client.get(
+                self.url, {"ids": str(self.job.id), "token": self.token}
+            )
+        # As when the worker couldn't publish the status
+        await Job.objects.filter(pk=self.job.pk).aupdate(status="failed")
+        events = [
+            block for block in (await self.read(response)).split("\n\n")
+            if block.startswith("event:")
+        ]
+
+        self.assertEqual(len(events), 2)
+        self.assertIn('"status": "failed"', events[-1])
+
+    async def test_anonymous_clients_are_rejected(self):
+        response = await self.async_client.get(self.url, {"ids": str(self.job.id)})
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_invalid_ids_are_rejected(self):
+        response = await self.async_client.get(
+            self.url, {"ids": "1,latest", "token": self.token}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+def read_prompt(stream):
+    """The messages of a prompt up to the one ending its execution."""
+    messages = []
+    while True:
+        message = json.loads(stream.recv(timeout=5))
+        messages.append(message)
+        if message["type"] == "executing" and message["data"]["node"] is None:
+            return messages
+
+
+class ComfyUIConnectionTest(TestCase):
+    messages = [
+        {"type": "progress", "data": {"value": step, "max": 10, "prompt_id": ""}}
+        for step in range(1, 11)
+    ]
+
+    def test_prompts_in_flight_share_one_socket(self):
+        with FakeComfyUI(self.messages, delay=0.001) as server, redirect_stdout(
+            io.StringIO()
+        ):
+            comfyui = cui.ComfyUIConnection(server.address).start()
+            try:
+                with mock.patch.object(cui, "SERVER_ADDRESS", server.address):
+                    streams = [comfyui.queue_prompt({}) for _ in range(3)]
+                results = [read_prompt(stream) for stream in streams]
+            finally:
+                comfyui.close()
+
+        self.assertEqual(server.connections, 1)
+        for stream, messages in zip(streams, results):
+            self.assertEqual(len(messages), 11)
+            self.assertTrue(
+                all(message["data"]["prompt_id"] == stream.prompt_id for message in messages)
+            )
+
+    def test_dropped_connection_is_reopened(self):
+        with FakeComfyUI(self.messages, delay=0.02) as server, mock.patch.object(
+            cui, "SERVER_ADDRESS", server.address
+        ), redirect_stdout(io.StringIO()):
+            comfyui = cui.ComfyUIConnection(server.address, min_backoff=0.01).start()
+            try:
+                stream = comfyui.queue_prompt({})
+                stream.recv(timeout=5)
+                server.drop_connections()
+                # Frames sent while disconnected are lost, the end isn't
+                messages = read_prompt(stream)
+            finally:
+                comfyui.close()
+
+        self.assertEqual(server.connections, 2)
+        self.assertIsNone(messages[-1]["data"]["node"])
+
+    def test_recovery_skips_prompts_whose_history_fails(self):
+        comfyui = cui.ComfyUIConnection("localhost:0")
+        for prompt_id in ("broken", "finished"):
+            comfyui.queue_for(prompt_id)
+
+        def get_history(prompt_id, server_address):
+            if prompt_id == "broken":
+                raise ValueError("Invalid JSON")
+            return {prompt_id: {}}
+
+        with mock.patch.object(cui, "get_history", side_effect=get_history), redirect_stdout(
+            io.StringIO()
+        ):
+            comfyui.recover()
+
+        self.assertTrue(comfyui.queue_for("broken").empty())
+        done = json.loads(comfyui.queue_for("finished").get_nowait())
+        self.assertIsNone(done["data"]["node"])
+
+    def test_silent_prompt_times_out(self):
+        with FakeComfyUI() as server, redirect_stdout(io.StringIO()):
+            comfyui = cui.ComfyUIConnection(server.address).start()
+            try:
+                stream = cui.PromptStream(comfyui, "never-queued")
+                with self.assertRaises(websocket.WebSocketTimeoutException):
+                    stream.recv(timeout=0.05)
+            finally:
+                comfyui.close()
+
+    def test_worker_reuses_its_connection(self):
+        with FakeComfyUI() as server, mock.patch.object(
+            cui, "SERVER_ADDRESS", server.address
+        ), redirect_stdout(io.StringIO()):
+            comfyui = cui.get_connection()
+            try:
+                self.assertIs(cui.get_connection(), comfyui)
+            finally:
+                comfyui.close()
+                cui._connections.clear()
+
+
+class AsyncComfyUIClientTest(TestCase):
+    outputs = {
+        "9": {"images": [
+            {"filename": f"out_{i}.png", "subfolder": "", "type": "output"} for i in range(8)
+        ]},
+        "12": {"text": ["a cat"]},
+    }
+    images = {f"out_{i}.png": f"image {i}".encode() for i in range(8)}
+
+    def test_outputs_are_downloaded_concurrently(self):
+        with FakeComfyUI(
+            outputs=self.outputs, images=self.images, view_delay=0.1
+        ) as server, redirect_stdout(io.StringIO()):
+            comfyui = cui.ComfyUIConnection(server.address).start()
+            try:
+
+                async def run():
+                    async with AsyncComfyUIClient(server.address, max_downloads=4) as client:
+                        stream = await client.queue_on(comfyui, {})
+                        try:
+                            while json.loads(await stream.recv(timeout=5))["data"]["node"]:
+                                pass
+                        finally:
+                            stream.close()
+                        return await client.get_outputs(stream.prompt_id)
+
+                start = time.perf_counter()
+                images, texts = async_to_sync(run)()
+                elapsed = time.perf_counter() - start
+            finally:
+                comfyui.close()
+
+        self.assertEqual(images["9"], [f"image {i}".encode() for i in range(8)])
+        self.assertEqual((images["12"], texts), ([], {"9": [], "12": ["a cat"]}))
+        self.assertEqual(server.max_active_views, 4)
+        # Two rounds of four downloads instead of eight in a row
+        self.assertLess(elapsed, 0.6)
+
+    def test_get_results_drives_the_async_client(self):
+        job = Job.objects.create(
+            workflow=Workflow.objects.create(
+                name="Workflow",
+                json_data={},
+                inputs={},
+                outputs={},
+                user=User.objects.create_user(
+                    phone_number="09120000000", full_name="Tester", password="secret"
+                ),
+            ),
+            user=User.objects.get(),
+        )
+        with FakeComfyUI(
+            outputs=self.outputs, images=self.images
+        ) as server, mock.patch.object(
+            cui, "SERVER_ADDRESS", server.address
+        ), redirect_stdout(io.StringIO()):
+            comfyui = cui.ComfyUIConnection(server.address).start()
+            try:
+                images, texts = cui.get_results(comfyui, {}, job.id)
+            finally:
+                comfyui.close()
+
+        self.assertEqual(len(images["9"]), 8)
+        self.assertEqual(texts["12"], ["a cat"])
+
+    def test_calls_time_out(self):
+        with FakeComfyUI(
+            outputs=self.outputs, images=self.images, view_delay=0.5
+        ) as server:
+
+            async def run():
+                async with AsyncComfyUIClient(server.address) as client:
+                    await client.get_image("out_0.png", "", "output", timeout=0.05)
+
+            with self.assertRaises(httpx.TimeoutException):
+                async_to_sync(run)()
+
+
+class ComfyUIPoolTest(JobTestCase):
+    messages = ComfyUIConnectionTest.messages
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(redirect_stdout(io.StringIO()))
+        self.addCleanup(self.close_connections)
+
+    def close_connections(self):
+        for comfyui in cui._connections.values():
+            comfyui.close()
+        cui._connections.clear()
+
+    def test_prompts_go_to_the_least_loaded_backend(self):
+        with FakeComfyUI(self.messages, delay=0.02, workers=1) as first, FakeComfyUI(
+            self.messages, delay=0.02, workers=1
+        ) as second:
+            pool = cui.ComfyUIPool([first.address, second.address])
+            streams = [pool.queue_prompt({}) for _ in range(4)]
+            for stream in streams:
+                read_prompt(stream)
+
+        backends = [stream.connection.server_address for stream in streams]
+        self.assertEqual(backends.count(first.address), 2)
+        self.assertEqual(backends.count(second.address), 2)
+
+    def test_unreachable_backend_is_left_out(self):
+        with FakeComfyUI() as down:
+            pass
+        with FakeComfyUI() as up:
+            pool = cui.ComfyUIPool([down.address, up.address], retry_after=60)
+            stream = pool.queue_prompt({})
+            read_prompt(stream)
+
+            self.assertEqual(stream.connection.server_address, up.address)
+            self.assertEqual(pool.queue_depths(), {up.address: 0})
+
+    def test_no_backend_available(self):
+        with FakeComfyUI() as down:
+            pass
+        pool = cui.ComfyUIPool([down.address])
+
+        with self.assertRaises(ConnectionError):
+            pool.queue_prompt({})
+
+    def test_prompt_waiting_in_the_queue_is_not_given_up(self):
+        outputs = {"9": {"images": [{"filename": "out.png", "subfolder": "", "type": "output"}]}}
+        with FakeComfyUI(
+            self.messages, delay=0.05, workers=1, outputs=outputs, images={"out.png": b"image"}
+        ) as server, mock.patch.object(cui, "MESSAGE_TIMEOUT", 0.1):
+            pool = cui.ComfyUIPool([server.address])
+            # Runs for half a second, silently for the prompt queued behind it
+            pool.queue_prompt({})
+            images, _ = cui.get_results(pool, {}, self.job.id)
+
+        self.assertEqual(images, {"9": [b"image"]})
+        self.assertFalse(self.job.log_entries.filter(level="error").exists())
+
+    def test_job_records_its_backend(self):
+        outputs = {"9": {"images": [{"filename": "out.png", "subfolder": "", "type": "output"}]}}
+        with FakeComfyUI(outputs=outputs, images={"out.png": b"image"}) as server:
+            images, _ = cui.get_results(cui.ComfyUIPool([server.address]), {}, self.job.id)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.backend, server.address)
+        self.assertEqual(images, {"9": [b"image"]})
+
+
+class WorkflowResultCacheTest(JobTestCase):
+    prompt = {
+        "3": {"class_type": "KSampler", "inputs": {"seed": 42, "steps": 20}},
+        "9": {"class_type": "SaveImage", "inputs": {"images": ["3", 0]}},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.workflow.json_data = self.prompt
+        self.workflow.outputs = {"9": {"images": "image"}}
+        self.workflow.save()
+        self.url = reverse("workflow-run-workflow", args=[self.workflow.pk])
+
+    def run_workflow(self, **data):
+        with mock.patch("job.views.WorkflowViewSet.run_workflow_task") as task, mock.patch(
+            "job.views.WorkflowViewSet.group"
+        ):
+            with redirect_stdout(io.StringIO()):
+                response = self.client.post(self.url, {"inputs": {}, **data}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return Job.objects.get(pk=response.data["job_id"]), task.s
+
+    def complete(self, job):
+        image = DatasetImage.objects.create(
+            job=job, name="Generated Image 0", image="user_1/out.png", created_by=self.user
+        )
+        job.status = "completed"
+        job.result_data = {
+            "9": {"image": {"id": str(image.id), "type": "image", "value": "/media/out.png"}}
+        }
+        job.save()
+        return image
+
+    def test_identical_prompt_reuses_the_outputs(self):
+        first, enqueue = self.run_workflow()
+        cache_key = enqueue.call_args.args[2]
+        image = self.complete(first)
+        WorkflowResult.objects.store(cache_key, first)
+
+        second, enqueue = self.run_workflow()
+
+        enqueue.assert_not_called()
+        self.assertEqual(second.status, "completed")
+        linked = second.images.get()
+        self.assertNotEqual(linked.pk, image.pk)
+        self.assertEqual(linked.image.name, "user_1/out.png")
+        self.assertEqual(second.result_data["9"]["image"]["id"], str(linked.pk))
+        self.assertEqual(WorkflowResult.objects.get().hits, 1)
+
+    def test_cache_can_be_skipped(self):
+        first, enqueue = self.run_workflow()
+        self.complete(first)
+        WorkflowResult.objects.store(enqueue.call_args.args[2], first)
+
+        second, enqueue = self.run_workflow(use_cache=False)
+
+        enqueue.assert_called_once_with(second.id, self.prompt, None)
+        self.assertEqual(second.status, "pending")
+
+    def test_key_ignores_titles_and_key_order(self):
+        titled = {
+            node_id: {"_meta": {"title": f"Node {node_id}"}, **node}
+            for node_id, node in reversed(list(self.prompt.items()))
+        }
+        outputs = self.workflow.outputs
+
+        self.assertEqual(
+            workflow_cache_key(titled, outputs), workflow_cache_key(self.prompt, outputs)
+        )
+        reseeded = {**self.prompt, "3": {**self.prompt["3"], "inputs": {"seed": 7, "steps": 20}}}
+        self.assertNotEqual(
+            workflow_cache_key(reseeded, outputs), workflow_cache_key(self.prompt, outputs)
+        )
+
+    def test_deleting_a_source_image_drops_the_entry(self):
+        first, enqueue = self.run_workflow()
+        cache_key = enqueue.call_args.args[2]
+        image = self.complete(first)
+        WorkflowResult.objects.store(cache_key, first)
+        image.delete()
+
+        self.assertFalse(WorkflowResult.objects.exists())
+        second, enqueue = self.run_workflow()
+        enqueue.assert_called_once_with(second.id, self.prompt, cache_key)
+
+    def test_entries_expire(self):
+        self.complete(self.job)
+        WorkflowResult.objects.store("key", self.job)
+        WorkflowResult.objects.update(created_at=timezone.now() - timedelta(days=8))
+
+        self.assertIsNone(WorkflowResult.objects.lookup("key"))
+
+    @override_settings(WORKFLOW_RESULT_CACHE_SIZE=2)
+    def test_least_recently_used_entries_are_dropped(self):
+        self.complete(self.job)
+        for key in ("a", "b"):
+            WorkflowResult.objects.store(key, self.job)
+        WorkflowResult.objects.lookup("a")
+        WorkflowResult.objects.store("c", self.job)
+
+        self.assertEqual(
+            sorted(WorkflowResult.objects.values_list("key", flat=True)), ["a", "c"]
+        )
+
+
+class WorkflowTemplateTest(JobTestCase):
+    graph = {
+        "3": {"class_type": "KSampler", "inputs": {"seed": 42, "steps": 20}},
+        "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "", "clip": ["4", 1]}},
+        "9": {"class_type": "SaveImage", "inputs": {"images": ["3", 0]}},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.workflow.json_data = copy.deepcopy(self.graph)
+        self.workflow.inputs = {"3": {"seed": "int"}, "6": {"text": "string"}}
+        self.workflow.save()
+
+    def test_render_patches_copies_of_the_declared_inputs(self):
+        template = cui.get_workflow_template(self.workflow)
+        prompt = template.render(
+            {"6": {"text": "a cat", "clip": ["5", 0]}, "9": {"images": []}}
+        )
+
+        self.assertEqual(prompt["6"]["inputs"], {"text": "a cat", "clip": ["4", 1]})
+        self.assertIs(prompt["9"], template.graph["9"])
+        self.assertIs(prompt["3"], template.graph["3"])
+        self.assertEqual(self.workflow.json_data, self.graph)
+        self.assertEqual(template.render({}), self.graph)
+
+    def test_replace_user_inputs_leaves_the_workflow_untouched(self):
+        prompt = cui.replace_user_inputs(
+            self.workflow.json_data, self.workflow.inputs, {"3": {"seed": 7}}
+        )
+
+        self.assertEqual(prompt["3"]["inputs"]["seed"], 7)
+        self.assertEqual(self.workflow.json_data["3"]["inputs"]["seed"], 42)
+
+    def test_template_is_compiled_again_when_the_workflow_changes(self):
+        template = cui.get_workflow_template(self.workflow)
+        self.assertIs(cui.get_workflow_template(Workflow.objects.get()), template)
+
+        self.workflow.inputs = {"3": {"steps": "int"}}
+        self.workflow.save()
+        recompiled = cui.get_workflow_template(self.workflow)
+
+        self.assertIsNot(recompiled, template)
+        self.assertEqual(recompiled.patch_points, {("3", "steps")})
+
+
+class BatchSubmissionTest(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workflow.json_data = {
+            "10": {"class_type": "LoadImage", "inputs": {"image": ""}},
+            "11": {"class_type": "LoadImage", "inputs": {"image": ""}},
+        }
+        self.workflow.inputs = {"10": {"image": "image_url"}, "11": {"image": "image_url"}}
+        self.workflow.save()
+        self.dataset = Dataset.objects.create(name="Samples", created_by=self.user)
+
+    def submit(self, url, data):
+        with mock.patch("job.views.WorkflowViewSet.group") as group, redirect_stdout(
+            io.StringIO()
+        ), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format="json")
+        return response, group, len(queries)
+
+    def test_batch_is_created_and_enqueued_at_once(self):
+        url = reverse("workflow-run-workflow-batch", args=[self.workflow.pk])
+        batch = [{"10": {"image": f"/media/{i}.png"}} for i in range(3)]
+
+        response, group, _ = self.submit(url, {"inputs": batch, "dataset": self.dataset.pk})
+
+        self.assertEqual(response.status_code, 201)
+        jobs = list(Job.objects.filter(pk__in=response.data["job_ids"]).order_by("pk"))
+        self.assertEqual([job.dataset_id for job in jobs], [self.dataset.pk] * 3)
+        self.assertEqual(jobs[2].input_data, {"10": {"image": "/media/2.png"}})
+        group.assert_called_once()
+        tasks = group.call_args.args[0]
+        self.assertEqual([task.args[0] for task in tasks], response.data["job_ids"])
+        self.assertEqual(tasks[1].args[1]["10"]["inputs"]["image"], "/media/1.png")
+
+    def test_dataset_must_be_yours(self):
+        other = User.objects.create_user(
+            phone_number="09121111111", full_name="Other", password="secret"
+        )
+        dataset = Dataset.objects.create(name="Other", created_by=other)
+        url = reverse("workflow-run-workflow-batch", args=[self.workflow.pk])
+
+        response, group, _ = self.submit(url, {"inputs": [{}], "dataset": dataset.pk})
+
+        self.assertEqual(response.status_code, 404)
+        group.assert_not_called()
+
+    def test_character_samples_cost_the_same_queries_for_any_reference_count(self):
+        WorkflowRunner.objects.create(
+            workflow=self.workflow,
+            name="generate_character_sample",
+            input_mapping={"10": {"image": "user_image"}, "11": {"image": "reference_image"}},
+            created_by=self.user,
+        )
+        references = Dataset.objects.create(
+            name="face_test", created_by=self.user, dataset_type="image"
+        )
+        user_image = DatasetImage.objects.create(
+            name="Me", image="me.png", created_by=self.user
+        )
+        url = "/api/cui/workflow-runners/characters/generate-character-samples/"
+
+        counts = []
+        for references_count in (2, 6):
+            while references.images.count() < references_count:
+                DatasetImage.objects.create(
+                    name="Face", image="face.png", dataset=references, created_by=self.user
+                )
+            response, group, queries = self.submit(url, {"dataset_image_id": user_image.pk})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data["job_ids"]), references_count)
+            self.assertEqual(len(group.call_args.args[0]), references_count)
+            counts.append(queries)
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(
+            Job.objects.filter(dataset_id=response.data["dataset_id"]).count(), 6
+        )
+
+
+def blob_files(media_root):
+    """The names of the files in the blob store, relative to the media root."""
+    return [
+        os.path.relpath(os.path.join(directory, file_name), media_root)
+        for directory, _, files in os.walk(os.path.join(media_root, BLOB_DIRECTORY))
+        for file_name in files
+    ]
+
+
+def encode_png(size=(64, 32)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "red").save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class OutputImageTest(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+    def test_bytes_are_saved_without_decoding(self):
+        png = encode_png()
+        with mock.patch.object(Image.Image, "load", side_effect=AssertionError("decoded")):
+            self.assertEqual(read_image_header(png), ("PNG", (64, 32)))
+            file_path = save_output_image(png, os.path.join(self.media_root, "out"))
+
+        self.assertEqual(file_path, os.path.join(self.media_root, "out.png"))
+        with open(file_path, "rb") as file:
+            self.assertEqual(file.read(), png)
+        self.assertEqual(os.listdir(self.media_root), ["out.png"])
+
+    def test_invalid_bytes_are_rejected(self):
+        with self.assertRaises(ValueError):
+            save_output_image(b"<html>Not found</html>", os.path.join(self.media_root, "out"))
+
+        self.assertEqual(os.listdir(self.media_root), [])
+
+    def run_task(self, outputs, images):
+        with FakeComfyUI(outputs=outputs, images=images) as server:
+            pool = cui.ComfyUIPool([server.address])
+            with mock.patch.object(cui, "get_pool", return_value=pool), redirect_stdout(
+                io.StringIO()
+            ), mock.patch("utils.cui_async.DOWNLOAD_CHUNK_SIZE", 256):
+                try:
+                    run_workflow_task(self.job.id, {})
+                finally:
+                    for comfyui in cui._connections.values():
+                        comfyui.close()
+                    cui._connections.clear()
+
+    def test_task_streams_the_outputs_to_media(self):
+        self.workflow.outputs = {"9": {"images": "image"}}
+        self.workflow.save()
+        png = encode_png()
+        outputs = {
+            "9": {"images": [
+                {"filename": f"{i}.png", "subfolder": "", "type": "output"} for i in range(3)
+            ]}
+        }
+        images = {f"{i}.png": png for i in range(3)}
+
+        self.run_task(outputs, images)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "completed")
+        self.assertEqual(self.job.images.count(), 3)
+        image = self.job.images.get(pk=self.job.result_data["9"]["image"]["id"])
+        # The three identical outputs share one blob
+        self.assertEqual(image.image.name, blob_name(hashlib.sha256(png).hexdigest(), ".png"))
+        with image.image.open("rb") as file:
+            self.assertEqual(file.read(), png)
+        self.assertEqual(blob_files(self.media_root), [image.image.name])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, f"user_{self.user.id}")), [])
+        self.assertEqual(MediaBlob.objects.get(name=image.image.name).ref_count, 3)
+
+    def test_failed_insert_removes_the_outputs(self):
+        self.workflow.outputs = {"9": {"images": "image"}}
+        self.workflow.save()
+        outputs = {
+            "9": {"images": [
+                {"filename": f"{i}.png", "subfolder": "", "type": "output"} for i in range(3)
+            ]}
+        }
+        images = {f"{i}.png": encode_png((8, i + 1)) for i in range(3)}
+
+        with mock.patch.object(DatasetImage.objects, "bulk_create", side_effect=IntegrityError):
+            self.run_task(outputs, images)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "failed")
+        self.assertEqual(blob_files(self.media_root), [])
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_failed_download_removes_the_finished_ones(self):
+        outputs = {
+            "9": {"images": [
+                {"filename": f"{i}.png", "subfolder": "", "type": "output"} for i in range(3)
+            ]}
+        }
+        images = {"0.png": encode_png(), "1.png": b"<html>Error</html>", "2.png": encode_png()}
+
+        with FakeComfyUI(outputs=outputs, images=images) as server:
+            prompt_id = cui.queue_prompt({}, "client", server.address)["prompt_id"]
+            while prompt_id not in cui.get_history(prompt_id, server.address):
+                time.sleep(0.01)
+            with self.assertRaises(ValueError):
+                async_to_sync(fetch_outputs)(
+                    prompt_id, server.address, os.path.join(self.media_root, "{node_id}_{idx}")
+                )
+
+        self.assertEqual(os.listdir(self.media_root), [])
+
+    def test_invalid_download_leaves_no_file(self):
+        outputs = {"9": {"images": [{"filename": "0.png", "subfolder": "", "type": "output"}]}}
+
+        async def download(server):
+            async with AsyncComfyUIClient(server.address) as client:
+                await client.download_image(
+                    "0.png", "", "output", os.path.join(self.media_root, "out")
+                )
+
+        with FakeComfyUI(outputs=outputs, images={"0.png": b"<html>Error</html>"}) as server:
+            with self.assertRaises(ValueError):
+                async_to_sync(download)(server)
+
+        self.assertEqual(os.listdir(self.media_root), [])
+
+
+class ImageDerivativeTest(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        os.makedirs(os.path.join(self.media_root, "dataset_images"))
+        with open(os.path.join(self.media_root, "dataset_images", "big.png"), "wb") as file:
+            file.write(encode_png((2000, 1000)))
+        with mock.patch("utils.derivatives.generate_derivatives_task"):
+            self.image = DatasetImage.objects.create(
+                name="Big", image="dataset_images/big.png", created_by=self.user
+            )
+
+    def test_derivatives_are_scaled_down(self):
+        written = generate_derivatives("dataset_images/big.png")
+
+        self.assertEqual(
+            sorted(written),
+            ["dataset_images/big.png.medium.webp", "dataset_images/big.png.thumb.webp"],
+        )
+        for name, size in (("thumb", (256, 128)), ("medium", (1024, 512))):
+            path = os.path.join(
+                self.media_root, derivative_name("dataset_images/big.png", name, "webp")
+            )
+            with Image.open(path) as derivative:
+                self.assertEqual((derivative.format, derivative.size), ("WEBP", size))
+        self.assertEqual(generate_derivatives("dataset_images/big.png"), [])
+
+    def test_serializer_links_lazy_then_stored_derivatives(self):
+        url = reverse("datasetimage-detail", args=[self.image.pk])
+        thumb = self.client.get(url).data["image_derivatives"]["thumb"]["webp"]
+        self.assertIn("/api/media/derivative/?name=dataset_images%2Fbig.png", thumb)
+
+        generate_derivatives("dataset_images/big.png")
+
+        thumb = self.client.get(url).data["image_derivatives"]["thumb"]["webp"]
+        self.assertTrue(thumb.endswith("/media/dataset_images/big.png.thumb.webp"))
+
+    def test_lazy_view_generates_on_first_request(self):
+        url = reverse("media-derivative")
+        response = self.client.get(
+            url, {"name": "dataset_images/big.png", "size": "medium", "extension": "webp"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        with Image.open(io.BytesIO(b"".join(response.streaming_content))) as derivative:
+            self.assertEqual(derivative.size, (1024, 512))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.media_root, "dataset_images", "big.png.thumb.webp"))
+        )
+
+        for query, status_code in (
+            ({"name": "dataset_images/big.png", "size": "huge", "extension": "webp"}, 400),
+            ({"name": "dataset_images/none.png", "size": "thumb", "extension": "webp"}, 404),
+            ({"name": "../secret.png", "size": "thumb", "extension": "webp"}, 404),
+        ):
+            self.assertEqual(self.client.get(url, query).status_code, status_code)
+
+    def test_originals_of_other_extensions_get_their_own_derivatives(self):
+        with open(os.path.join(self.media_root, "dataset_images", "big.jpg"), "wb") as file:
+            Image.new("RGB", (300, 300)).save(file, "JPEG")
+
+        written = generate_derivatives("dataset_images/big.png")
+        written += generate_derivatives("dataset_images/big.jpg")
+
+        self.assertEqual(len(set(written)), 4)
+        path = os.path.join(self.media_root, "dataset_images", "big.jpg.thumb.webp")
+        with Image.open(path) as derivative:
+            self.assertEqual(derivative.size, (256, 256))
+
+    def test_lazy_view_only_serves_referenced_originals(self):
+        url = reverse("media-derivative")
+        with open(os.path.join(self.media_root, "dataset_images", "loose.png"), "wb") as file:
+            file.write(encode_png((64, 64)))
+        written = generate_derivatives("dataset_images/big.png")
+        thumb = derivative_name("dataset_images/big.png", "thumb", "webp")
+
+        for name in ("dataset_images/loose.png", thumb):
+            query = {"name": name, "size": "thumb", "extension": "webp"}
+            self.assertEqual(self.client.get(url, query).status_code, 404)
+        # Neither got derivatives of its own
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.media_root, "dataset_images"))),
+            sorted(["big.png", "loose.png"] + [os.path.basename(name) for name in written]),
+        )
+
+        self.client.force_authenticate(None)
+        query = {"name": "dataset_images/big.png", "size": "thumb", "extension": "webp"}
+        self.assertEqual(self.client.get(url, query).status_code, 401)
+
+    def test_lazy_view_accepts_admin_sessions(self):
+        self.client.force_authenticate(None)
+        self.client.force_login(self.user)
+        query = {"name": "dataset_images/big.png", "size": "thumb", "extension": "webp"}
+
+        self.assertEqual(self.client.get(reverse("media-derivative"), query).status_code, 200)
+
+    def test_thumbnail_falls_back_to_the_original(self):
+        self.assertIn("/api/media/derivative/", thumbnail_url(self.image.image))
+        with mock.patch("utils.derivatives.derivative_formats", return_value=[]):
+            self.assertEqual(thumbnail_url(self.image.image), self.image.image.url)
+
+    def test_failed_enqueue_is_logged(self):
+        with mock.patch("utils.derivatives.generate_derivatives_task") as task:
+            task.delay.side_effect = OperationalError("No broker")
+            with self.assertLogs("utils.derivatives", "WARNING") as logs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    DatasetImage.objects.create(
+                        name="Copy", image="dataset_images/big.png", created_by=self.user
+                    )
+
+        self.assertIn("dataset_images/big.png", logs.output[0])
+
+    def test_saving_an_image_schedules_its_derivatives(self):
+        with mock.patch("utils.derivatives.generate_derivatives_task") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                DatasetImage.objects.create(
+                    name="Copy", image="dataset_images/big.png", created_by=self.user
+                )
+            task.delay.assert_called_once_with("dataset_images/big.png")
+
+            generate_derivatives("dataset_images/big.png")
+            with self.captureOnCommitCallbacks(execute=True):
+                self.image.save()
+            task.delay.assert_called_once()
+
+
+class DatasetImageBulkTest(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.dataset = Dataset.objects.create(
+            name="Faces", created_by=self.user, dataset_type="image"
+        )
+
+    def uploads(self, count):
+        return [
+            DatasetImage(
+                name=f"Face {i}",
+                image=SimpleUploadedFile(f"face_{i}.png", encode_png((64, i + 1)), "image/png"),
+                dataset=self.dataset,
+                created_by=self.user,
+            )
+            for i in range(count)
+        ]
+
+    def test_images_are_inserted_at_once(self):
+        url = reverse("dataset-add-images", args=[self.dataset.pk])
+        data = [{"name": f"Face {i}", "tag_prompt": "face"} for i in range(16)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(response.data["image_ids"]),
+            sorted(self.dataset.images.values_list("id", flat=True)),
+        )
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "job_datasetimage"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_uploads_are_written_before_the_insert(self):
+        with mock.patch("utils.derivatives.generate_derivatives_task") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                images = DatasetImage.create_many(self.uploads(3))
+
+        self.assertTrue(all(image.pk for image in images))
+        self.assertEqual(
+            sorted(blob_files(self.media_root)), sorted(image.image.name for image in images)
+        )
+        self.assertEqual(task.delay.call_count, 3)
+
+    @override_settings(MEDIA_BLOB_GRACE_PERIOD=0)
+    def test_failed_insert_removes_the_uploads(self):
+        with mock.patch.object(
+            DatasetImage.objects, "bulk_create", side_effect=IntegrityError
+        ), self.assertRaises(IntegrityError):
+            DatasetImage.create_many(self.uploads(3))
+
+        self.assertEqual(blob_files(self.media_root), [])
+        self.assertFalse(self.dataset.images.exists())
+
+
+class MediaBlobTest(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.enterContext(mock.patch("utils.derivatives.generate_derivatives_task"))
+        self.png = encode_png()
+
+    def create_image(self, name="Face"):
+        return DatasetImage.objects.create(
+            name=name,
+            image=SimpleUploadedFile("face.png", self.png, "image/png"),
+            created_by=self.user,
+        )
+
+    def test_identical_uploads_share_a_blob(self):
+        first, second = self.create_image(), self.create_image()
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(blob_files(self.media_root), [first.image.name])
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(self.png).hexdigest())
+        self.assertEqual(blob.size, len(self.png))
+        self.assertEqual(blob.ref_count, 2)
+
+    @override_settings(MEDIA_BLOB_GRACE_PERIOD=0)
+    def test_last_reference_collects_the_blob(self):
+        first, second = self.create_image(), self.create_image()
+        name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(blob_files(self.media_root), [name])
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.image = SimpleUploadedFile("other.png", encode_png((8, 8)), "image/png")
+            second.save()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertEqual(blob_files(self.media_root), [second.image.name])
+
+    def test_blob_stored_again_survives_its_last_reference(self):
+        image = self.create_image()
+        name = image.image.name
+        MediaBlob.objects.update(stored_at=timezone.now() - timedelta(days=2))
+        output = os.path.join(self.media_root, "out.png")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+            # A job storing the same output before the delete runs
+            with open(output, "wb") as file:
+                file.write(self.png)
+            self.assertEqual(blob_storage().store_file(output), name)
+        DatasetImage.create_many([DatasetImage(name="Output", image=name, created_by=self.user)])
+
+        self.assertEqual(blob_files(self.media_root), [name])
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+
+    def test_base64_inputs_are_stored_once(self):
+        workflow = Workflow.objects.create(
+            name="Inputs",
+            json_data={"10": {"class_type": "LoadImage", "inputs": {"image": ""}}},
+            inputs={"10": {"image": "image_url"}},
+            outputs={},
+            user=self.user,
+        )
+        data = {
+            "inputs": {
+                "10": {"image": "data:image/png;base64," + base64.b64encode(self.png).decode()}
+            },
+            "use_cache": False,
+        }
+        url = reverse("workflow-run-workflow", args=[workflow.pk])
+        with mock.patch("job.views.WorkflowViewSet.group"), redirect_stdout(io.StringIO()):
+            for _ in range(3):
+                self.assertEqual(self.client.post(url, data, format="json").status_code, 201)
+
+        self.assertEqual(len(blob_files(self.media_root)), 1)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 0)
+
+    def test_collect_deletes_unreferenced_blobs_after_the_grace_period(self):
+        kept = self.create_image()
+        unused = blob_storage().store([encode_png((8, 8))], ".png")
+        stray = os.path.join(self.media_root, BLOB_DIRECTORY, "ab", "cd", "abcd.png")
+        os.makedirs(os.path.dirname(stray))
+        with open(stray, "wb") as file:
+            file.write(self.png)
+        # Drift, e.g. from an update() that sent no signal
+        MediaBlob.objects.filter(name=kept.image.name).update(ref_count=0)
+
+        with redirect_stdout(io.StringIO()):
+            call_command("collect_media_blobs", "--recount")
+        self.assertEqual(len(blob_files(self.media_root)), 3)
+
+        with redirect_stdout(io.StringIO()):
+            call_command("collect_media_blobs", "--grace", "-1")
+        self.assertEqual(blob_files(self.media_root), [kept.image.name])
+        self.assertFalse(MediaBlob.objects.filter(name=unused).exists())
+        self.assertEqual(MediaBlob.objects.get(name=kept.image.name).ref_count, 1)
@@ -4,6 +4,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from job.views.DataSetViewSet import CharacterViewSet, DatasetImageViewSet, DatasetViewSet
+from job.views.JobEventView import job_events
 from job.views.JobViewSet import JobViewSet
 from job.views.WorkflowRunnerViewSet import WorkflowRunnerViewSet
 from job.views.WorkflowViewSet import WorkflowViewSet
@@ -18,6 +19,8 @@ router.register(r'datasets', DatasetViewSet)
 router.register(r'dataset-images', DatasetImageViewSet)
 router.register(r'characters', CharacterViewSet)
 urlpatterns = [
+    # Before the router, whose job detail route would match it
+    path('jobs/events/', job_events, name='job-events'),
     path('', include(router.urls)),  # All routes for workflows and jobs
 
 ]
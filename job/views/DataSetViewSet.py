@@ -93,12 +93,12 @@ class DatasetViewSet(viewsets.ModelViewSet):
 
         serializer = AddImageToDatasetSerializer(data=request.data, many=True)
         if serializer.is_valid():
-            images_added = []
-            for image_data in serializer.validated_data:
-                dataset_image = DatasetImage.objects.create(
-                    dataset=dataset, created_by=request.user, **image_data
-                )
-                images_added.append(dataset_image)
+            images_added = DatasetImage.create_many(
+                [
+                    DatasetImage(dataset=dataset, created_by=request.user, **image_data)
+                    for image_data in serializer.validated_data
+                ]
+            )
 
             return Response(
                 {
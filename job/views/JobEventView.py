@@ -0,0 +1,124 @@
+# Server-Sent Events stream of job updates, served over ASGI
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from job.models.Job import Job
+from job.serializers.JobSerializers import absolute_result_urls
+from utils.job_events import subscribe_to_jobs
+
+MAX_JOBS = 50
+HEARTBEAT_SECONDS = 15
+FINISHED_STATUSES = ("completed", "failed")
+
+
+def authenticate(request):
+    """
+    Authenticate with the JWT of the Authorization header, or of ?token= since
+    browsers can't set headers on an EventSource.
+    """
+    authentication = JWTAuthentication()
+    try:
+        if "HTTP_AUTHORIZATION" in request.META:
+            result = authentication.authenticate(request)
+            return result[0] if result else None
+        if "token" in request.GET:
+            token = authentication.get_validated_token(request.GET["token"])
+            return authentication.get_user(token)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return None
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def snapshot_events(job, request):
+    """Events bringing a client up to date with the current state of a job."""
+    yield format_event("status", {"job": job["id"], "status": job["status"]})
+    if job["progress"]:
+        yield format_event("progress", {"job": job["id"], **job["progress"]})
+    if job["status"] == "completed":
+        result_data = absolute_result_urls(job["result_data"], request)
+        yield format_event("outputs", {"job": job["id"], "result_data": result_data})
+
+
+def load_jobs(job_ids):
+    return list(
+        Job.objects.filter(pk__in=job_ids).values("id", "status", "progress", "result_data")
+    )
+
+
+async def stream_job_events(request, subscription, jobs, heartbeat):
+    following = set()
+    try:
+        for job in jobs:
+            for event in snapshot_events(job, request):
+                yield event
+            if job["status"] not in FINISHED_STATUSES:
+                following.add(job["id"])
+
+        while following:
+            message = await subscription.get(timeout=heartbeat)
+            if message is None:
+                # Events are lost when publishing fails, so on every heartbeat
+                # finish the jobs the database says are done
+                for job in await sync_to_async(load_jobs)(following):
+                    if job["status"] in FINISHED_STATUSES:
+                        for event in snapshot_events(job, request):
+                            yield event
+                        following.discard(job["id"])
+                if following:
+                    yield ": keepalive\n\n"
+                continue
+
+            job_id, event, data = message["job"], message["event"], message["data"]
+            if event == "outputs":
+                data = {"result_data": absolute_result_urls(data["result_data"], request)}
+            yield format_event(event, {"job": job_id, **data})
+            if event == "status" and data["status"] in FINISHED_STATUSES:
+                following.discard(job_id)
+    finally:
+        await subscription.close()
+
+
+async def job_events(request):
+    """
+    Stream status transitions, progress and finished outputs of the jobs in
+    ?ids=1,2,3 as Server-Sent Events. Each job first gets its current state,
+    then its updates as the Celery task publishes them. The stream ends once
+    every job completed or failed.
+    """
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=401
+        )
+
+    try:
+        job_ids = {int(job_id) for job_id in request.GET.get("ids", "").split(",")}
+    except ValueError:
+        return JsonResponse({"ids": ["Comma separated job ids are required."]}, status=400)
+    if len(job_ids) > MAX_JOBS:
+        return JsonResponse({"ids": [f"At most {MAX_JOBS} jobs can be followed."]}, status=400)
+
+    # Subscribe before reading the current state so no update falls in between
+    subscription = await subscribe_to_jobs(job_ids)
+    try:
+        jobs = await sync_to_async(load_jobs)(job_ids)
+    except Exception:
+        await subscription.close()
+        raise
+
+    response = StreamingHttpResponse(
+        stream_job_events(request, subscription, jobs, HEARTBEAT_SECONDS),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Don't let proxies buffer the stream
+    return response
@@ -2,10 +2,38 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from job.models.Job import Job
 from job.serializers.DatasetSeriallizers import DatasetImageSerializer
-from job.serializers.JobSerializers import JobCreateSerializer, JobSerializer
+from job.serializers.JobSerializers import (
+    JobCreateSerializer,
+    JobLogEntryCompactSerializer,
+    JobLogEntrySerializer,
+    JobSerializer,
+)
+from utils.etag import conditional_etag
+
+
+def job_state_fingerprint(view, request, pk=None):
+    """
+    Status and runtime of a job, read without loading its logs or results.
+    The result data is written in the same save that finishes the job, so
+    both change together.
+    """
+    state = view.get_queryset().filter(pk=pk).values("status", "runtime").first()
+    return state, None
+
+
+def get_int_param(request, name, default, maximum=None):
+    value = request.query_params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: ["A valid integer is required."]})
+    if value < 0:
+        raise ValidationError({name: ["Must not be negative."]})
+    return min(value, maximum) if maximum else value
 
 @extend_schema_view(
     list=extend_schema(summary="List all jobs", tags=["Jobs"]),
@@ -18,6 +46,15 @@ from job.serializers.JobSerializers import JobCreateSerializer, JobSerializer
 class JobViewSet(viewsets.ModelViewSet):
     queryset = Job.objects.all()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "get_progress":
+            return queryset.only("status", "progress")
+        if self.action in ("get_status", "get_result", "get_logs", "tail_logs"):
+            # Polling endpoints don't need the legacy log text of the job
+            queryset = queryset.defer("logs")
+        return queryset
+
     def get_serializer_class(self):
         # Use different serializers for creating and retrieving jobs
         if self.action == "create":
@@ -36,13 +73,24 @@ class JobViewSet(viewsets.ModelViewSet):
     # Custom action to get the job status
     @extend_schema(summary="Get job status", tags=["Jobs"])
     @action(detail=True, methods=["get"], url_path="status")
+    @conditional_etag(job_state_fingerprint)
     def get_status(self, request, pk=None):
         job = self.get_object()
         return Response({"status": job.status}, status=status.HTTP_200_OK)
 
+    @extend_schema(summary="Get job progress", tags=["Jobs"])
+    @action(detail=True, methods=["get"], url_path="progress")
+    def get_progress(self, request, pk=None):
+        """Status and progress of the job, without loading its logs or results."""
+        job = self.get_object()
+        return Response(
+            {"status": job.status, "progress": job.progress}, status=status.HTTP_200_OK
+        )
+
     # Custom action to get the job result
     @extend_schema(summary="Get job result", tags=["Jobs"])
     @action(detail=True, methods=["get"], url_path="result")
+    @conditional_etag(job_state_fingerprint)
     def get_result(self, request, pk=None):
         job = self.get_object()
         return Response({"result_data": job.result_data}, status=status.HTTP_200_OK)
@@ -51,8 +99,47 @@ class JobViewSet(viewsets.ModelViewSet):
     @extend_schema(summary="Get job logs", tags=["Jobs"])
     @action(detail=True, methods=["get"], url_path="log")
     def get_logs(self, request, pk=None):
+        """
+        Log entries of the job after ?after_seq= (all by default), at most
+        ?limit= of them. Pollers pass the last_seq of the previous response
+        to only download new entries. The log text of jobs from before log
+        entries is only returned on the first read.
+        """
+        job = self.get_object()
+        after_seq = get_int_param(request, "after_seq", 0)
+        limit = get_int_param(request, "limit", 500, maximum=1000)
+
+        entries = list(job.log_entries.filter(seq__gt=after_seq)[: limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        data = {
+            "entries": JobLogEntrySerializer(
+                entries, many=True, context={"request": request}
+            ).data,
+            "last_seq": entries[-1].seq if entries else after_seq,
+            "has_more": has_more,
+        }
+        if "after_seq" not in request.query_params:
+            data["logs"] = job.logs
+        return Response(data, status=status.HTTP_200_OK)
+
+    @extend_schema(summary="Get the latest job logs", tags=["Jobs"])
+    @action(detail=True, methods=["get"], url_path="log/tail")
+    def tail_logs(self, request, pk=None):
+        """The last ?lines= log entries of the job (50 by default), oldest first."""
         job = self.get_object()
-        return Response({"logs": job.logs}, status=status.HTTP_200_OK)
+        lines = get_int_param(request, "lines", 50, maximum=500)
+
+        entries = list(job.log_entries.order_by("-seq")[:lines])[::-1]
+        return Response(
+            {
+                "entries": JobLogEntryCompactSerializer(
+                    entries, many=True, context={"request": request}
+                ).data,
+                "last_seq": entries[-1].seq if entries else 0,
+            },
+            status=status.HTTP_200_OK,
+        )
     
     @extend_schema(summary="Get job images", tags=["Jobs"])
     @action(detail=True, methods=["get"], url_path="images")
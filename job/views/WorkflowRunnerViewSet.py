@@ -14,6 +14,7 @@ from job.models.Dataset import Character, Dataset, DatasetImage
 from job.models.Job import Job
 from job.models.WorkflowRunner import WorkflowRunner
 from job.serializers.WorkflowRunnerSerializers import WorkflowRunnerSerializer
+from job.serializers.WorkflowSerializer import RunWorkflowBatchSerializer
 from job.views.WorkflowViewSet import WorkflowViewSet
 
 
@@ -269,8 +270,6 @@ class WorkflowRunnerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        job_ids = []
-
         specialized_runner = self.get_runner("generate_character_sample")
         if not specialized_runner:
             return Response(
@@ -278,29 +277,32 @@ class WorkflowRunnerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        # Iterate over reference images and create jobs
-        for reference_image in reference_images:
-            mapped_inputs = {
-                "user_image": user_image.get_full_image_url(request),
-                "reference_image": reference_image.get_full_image_url(request),
+        # Map the inputs of a job per reference image and submit them as one batch
+        user_image_url = user_image.get_full_image_url(request)
+        serializer = RunWorkflowBatchSerializer(
+            data={
+                "inputs": [
+                    self.map_inputs(
+                        {
+                            "user_image": user_image_url,
+                            "reference_image": reference_image.get_full_image_url(request),
+                        },
+                        specialized_runner.input_mapping,
+                    )
+                    for reference_image in reference_images
+                ]
             }
-            # print(mapped_inputs)
-            request.data["inputs"] = mapped_inputs
-
-            # Prepare and run the workflow using shared logic
-            response = self.prepare_and_run_workflow(request, specialized_runner)
-            print(response)
-
-            if response.status_code == status.HTTP_201_CREATED:
-                job_id = response.data.get("job_id")
-                job_ids.append(job_id)
-
-                # Fetch the job object
-                job = Job.objects.get(id=job_id)
-
-                # Associate the job with the new dataset
-                job.dataset = new_dataset
-                job.save()
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        jobs = WorkflowViewSet()._submit_jobs(
+            request,
+            specialized_runner.workflow,
+            serializer.validated_data["inputs"],
+            dataset=new_dataset,
+        )
+        job_ids = [job.id for job in jobs]
 
         return Response(
             {
@@ -624,6 +626,7 @@ class WorkflowRunnerViewSet(viewsets.ModelViewSet):
             random_seed = random.randint(0, 2**16)
             mapped_inputs["seed"] = str(random_seed)
             warnings.warn(f"Seed not provided. Using random seed: {random_seed}")
+            request.data["use_cache"] = False  # A random seed never repeats
         request.data["inputs"] = mapped_inputs
 
         # Run the workflow and handle the response
@@ -636,8 +639,10 @@ class WorkflowRunnerViewSet(viewsets.ModelViewSet):
             user_image.job = job
             user_image.save()
 
-            job.status = "RUNNING"
-            job.save()
+            # Unless it already completed from the result cache
+            if job.status == "pending":
+                job.status = "RUNNING"
+                job.save()
 
             return Response({"job_id": job_id}, status=status.HTTP_200_OK)
 
@@ -3,19 +3,24 @@ import re
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from celery import group
 from drf_spectacular.utils import extend_schema_view, extend_schema
+from job.models.Dataset import Dataset
 from job.models.Job import Job
 from job.models.Workflow import Workflow
+from job.models.WorkflowResult import WorkflowResult
 from job.serializers.JobSerializers import JobSerializer
 from job.serializers.WorkflowSerializer import (
+    RunWorkflowBatchSerializer,
     RunWorkflowSerializer,
     WorkflowCreateSerializer,
     WorkflowJSONSerializer,
     WorkflowSerializer,
 )
 from job.tasks import run_workflow_task
-from utils.cui import replace_user_inputs
-import os
+from utils.cui import get_workflow_template
+from utils.media_blobs import blob_storage
+from utils.workflow_cache import complete_from_cache, workflow_cache_key
 import base64
 
 import logging
@@ -57,6 +62,47 @@ class WorkflowViewSet(viewsets.ModelViewSet):
         workflow = self.get_object()
         return self._run_workflow_logic(request, workflow)
 
+    @extend_schema(
+        summary="Run a workflow for a batch of inputs",
+        request=RunWorkflowBatchSerializer,
+        responses={201: dict},
+        tags=["Workflows"],
+    )
+    @action(detail=True, methods=["post"], url_path="run-batch")
+    def run_workflow_batch(self, request, pk=None):
+        workflow = self.get_object()
+        serializer = RunWorkflowBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        batch = serializer.validated_data["inputs"]
+        if not all(self._validate_inputs(workflow.inputs, inputs) for inputs in batch):
+            return Response(
+                {"error": "Invalid or missing inputs."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        dataset = None
+        if "dataset" in serializer.validated_data:
+            dataset = Dataset.objects.filter(
+                pk=serializer.validated_data["dataset"], created_by=request.user
+            ).first()
+            if dataset is None:
+                return Response(
+                    {"error": "Dataset not found."}, status=status.HTTP_404_NOT_FOUND
+                )
+
+        jobs = self._submit_jobs(
+            request,
+            workflow,
+            batch,
+            dataset=dataset,
+            use_cache=serializer.validated_data["use_cache"],
+        )
+        return Response(
+            {"job_ids": [job.id for job in jobs]}, status=status.HTTP_201_CREATED
+        )
+
     def _run_workflow_logic(self, request, workflow):
         """The shared logic to run a workflow, used by both regular and specialized workflows."""
         serializer = RunWorkflowSerializer(data=request.data)
@@ -71,25 +117,55 @@ class WorkflowViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            processed_inputs = self._prepare_inputs(workflow, user_inputs, request)
-            print(processed_inputs)
+            [job] = self._submit_jobs(
+                request,
+                workflow,
+                [user_inputs],
+                use_cache=serializer.validated_data["use_cache"],
+            )
+            return Response({"job_id": job.id}, status=status.HTTP_201_CREATED)
 
-            # Create job and run workflow
-            job = Job.objects.create(
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def _submit_jobs(self, request, workflow, batch, dataset=None, use_cache=True):
+        """
+        Create the jobs of a batch of validated inputs in one insert, complete
+        those whose prompt already ran from the result cache, and enqueue the
+        others as one Celery group. Returns the jobs in the order of the batch.
+        """
+        template = get_workflow_template(workflow)
+        processed_batch = [
+            self._prepare_inputs(workflow, user_inputs, request) for user_inputs in batch
+        ]
+        prompts = [template.render(processed_inputs) for processed_inputs in processed_batch]
+
+        jobs = Job.objects.bulk_create(
+            Job(
                 workflow=workflow,
                 input_data=processed_inputs,
                 user=request.user,
                 status="pending",
+                dataset=dataset,
             )
-
-            modified_workflow = replace_user_inputs(
-                workflow.json_data, workflow.inputs, processed_inputs
-            )
-            run_workflow_task.delay(job.id, modified_workflow)
-
-            return Response({"job_id": job.id}, status=status.HTTP_201_CREATED)
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            for processed_inputs in processed_batch
+        )
+
+        # Identical prompts reuse the outputs of the last job that ran them
+        cache_keys = [None] * len(jobs)
+        cached = {}
+        if use_cache:
+            cache_keys = [workflow_cache_key(prompt, workflow.outputs) for prompt in prompts]
+            cached = WorkflowResult.objects.lookup_many(cache_keys)
+
+        tasks = []
+        for job, prompt, cache_key in zip(jobs, prompts, cache_keys):
+            if cache_key in cached:
+                complete_from_cache(job, cached[cache_key])
+            else:
+                tasks.append(run_workflow_task.s(job.id, prompt, cache_key))
+        if tasks:
+            group(tasks).apply_async()
+        return jobs
 
     def _prepare_inputs(self, workflow, user_inputs, request):
         """Prepare inputs for the workflow, processing base64 images, URLs, static paths, or other data."""
@@ -182,34 +258,21 @@ class WorkflowViewSet(viewsets.ModelViewSet):
         return True
 
     def save_base64_image(self, image_base64, user, workflow, request):
-        """Save base64-encoded image to a file and return the full URL."""
-        user_dir = f"media/user_{user.id}/w_{workflow.id}/"
-        if not os.path.exists(user_dir):
-            os.makedirs(user_dir)
-
+        """
+        Save a base64-encoded image to the blob store and return its full URL.
+        An image sent again, e.g. the same reference image for every run,
+        reuses the file stored the first time.
+        """
         # Extract image format (assuming data:image/jpeg;base64,... or similar)
         format, imgstr = image_base64.split(";base64,")
         ext = format.split("/")[-1]  # Extract the file extension (e.g., jpg, png)
 
-        # Generate a unique file name
-        file_name = f"{user.id}_{workflow.id}_{self.generate_random_filename()}.{ext}"
-        file_path = os.path.join(user_dir, file_name)
-
-        # Decode the base64 string and save it as an image file
-        with open(file_path, "wb") as f:
-            f.write(base64.b64decode(imgstr))
+        # Decode the base64 string and store it under the hash of its bytes
+        storage = blob_storage()
+        name = storage.store([base64.b64decode(imgstr)], f".{ext}")
 
         # Get the full URL of the saved image
-        relative_url = f"/media/user_{user.id}/w_{workflow.id}/{file_name}"
-        full_url = request.build_absolute_uri(relative_url)
-
-        return full_url
-
-    def generate_random_filename(self):
-        """Generate a random string for file names."""
-        import uuid
-
-        return str(uuid.uuid4())
+        return request.build_absolute_uri(storage.url(name))
 
     def convert_image_to_base64(self, image_file):
         """Convert the image file to a base64-encoded string."""
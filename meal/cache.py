@@ -0,0 +1,140 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import get_language
+from rest_framework import status
+from rest_framework.response import Response
+
+# Models whose writes can change the responses cached under each namespace
+DEPENDENCIES = {
+    "meals": ("Meal", "Food", "Rate"),
+    "foods": ("Food", "Meal", "Rate"),
+}
+
+
+def get_timeout():
+    return getattr(settings, "MEAL_RESPONSE_CACHE_TIMEOUT", 60 * 60)
+
+
+def generation_key(namespace):
+    return f"meal:generation:{namespace}"
+
+
+def get_generation(namespace):
+    # Starts from the clock rather than 0, so a generation evicted from the
+    # cache never comes back with a value an earlier key or ETag was built from
+    return cache.get_or_set(generation_key(namespace), time.time_ns(), timeout=None)
+
+
+def stats_key(namespace, outcome):
+    return f"meal:stats:{namespace}:{outcome}"
+
+
+def increment(key):
+    # add() is a no-op when the key exists, so concurrent callers can't reset it
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def response_key(namespace, request, dated=False):
+    generation = get_generation(namespace)
+    raw = f"{request.get_host()}:{get_language()}:{request.get_full_path()}"
+    if dated:
+        raw += f":{timezone.now().date()}"
+    digest = hashlib.md5(raw.encode("utf-8")).hexdigest()
+    return f"meal:response:{namespace}:{generation}:{digest}"
+
+
+def cached_response(namespace, dated=False):
+    """
+    Cache the data of successful GET responses of a viewset action under the
+    given namespace. Entries are keyed by host, language and full path, plus
+    today's date for dated actions whose data is relative to it, and are
+    dropped when a model the namespace depends on is written.
+    """
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            timeout = get_timeout()
+            if request.method != "GET" or not timeout:
+                return view_method(self, request, *args, **kwargs)
+
+            key = response_key(namespace, request, dated)
+            data = cache.get(key)
+            if data is not None:
+                increment(stats_key(namespace, "hits"))
+                return Response(data)
+
+            increment(stats_key(namespace, "misses"))
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, timeout)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(model_name):
+    """Drop every cached response that depends on the given model, once committed."""
+    namespaces = [
+        namespace for namespace, models in DEPENDENCIES.items() if model_name in models
+    ]
+
+    def bump():
+        for namespace in namespaces:
+            get_generation(namespace)
+            increment(generation_key(namespace))
+
+    if namespaces:
+        transaction.on_commit(bump)
+
+
+def get_stats():
+    return {
+        namespace: {
+            "hits": cache.get(stats_key(namespace, "hits"), 0),
+            "misses": cache.get(stats_key(namespace, "misses"), 0),
+        }
+        for namespace in DEPENDENCIES
+    }
+
+
+def etags_enabled():
+    # The generations are only bumped in the cache of the process that wrote,
+    # so they can't stand for the data unless every process shares the cache
+    return getattr(settings, "MEAL_RESPONSE_ETAGS", False)
+
+
+def meal_fingerprint(view, request, *args, **kwargs):
+    """
+    Fingerprint of a meal or food response for utils.etag.conditional_etag:
+    the generations invalidate bumps on every Meal, Food and Rate write,
+    deletes included, read from the cache without a query. There is no
+    timestamp that moves on deletes, so no Last-Modified. None, i.e. no
+    ETag, unless MEAL_RESPONSE_ETAGS is set.
+    """
+    if not etags_enabled():
+        return None
+    return [get_generation(namespace) for namespace in DEPENDENCIES], None
+
+
+def dated_meal_fingerprint(view, request, *args, **kwargs):
+    """meal_fingerprint of a response that also depends on today's date."""
+    fingerprinted = meal_fingerprint(view, request, *args, **kwargs)
+    if fingerprinted is None:
+        return None
+    parts, last_modified = fingerprinted
+    return parts + [timezone.now().date()], last_modified
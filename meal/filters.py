@@ -0,0 +1,43 @@
+from datetime import date
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class MealFilterBackend(BaseFilterBackend):
+    """
+    Filter list endpoints by the meal rows belong to:
+
+    - ?date_after=YYYY-MM-DD and ?date_before=YYYY-MM-DD, inclusive meal dates
+    - ?food=<id>
+    - ?user=<id>, on views that set filter_user
+
+    Views set meal_lookup to the path from their model to its meal, "" for
+    meals themselves.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        meal = getattr(view, "meal_lookup", "")
+        filters = {}
+
+        for param, lookup in (("date_after", "gte"), ("date_before", "lte")):
+            if param in params:
+                filters[f"{meal}date__{lookup}"] = self.parse_date(param, params[param])
+        if "food" in params:
+            filters[f"{meal}food"] = self.parse_id("food", params["food"])
+        if "user" in params and getattr(view, "filter_user", False):
+            filters["user"] = self.parse_id("user", params["user"])
+
+        return queryset.filter(**filters)
+
+    def parse_date(self, param, value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({param: ["Use the YYYY-MM-DD format."]})
+
+    def parse_id(self, param, value):
+        if not value.isdigit():
+            raise ValidationError({param: ["A valid integer is required."]})
+        return int(value)
@@ -0,0 +1,91 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from persiantools.jdatetime import JalaliDate
+from rest_framework.test import APIClient
+
+from meal.models import Food, Meal, Rate
+from user.models import User
+from utils.strings.url_names import U
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds meals inside a transaction, reports latency and query counts of "
+        "the calendar endpoints, then rolls everything back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--meals", type=int, default=10000)
+        parser.add_argument("--foods", type=int, default=200)
+        parser.add_argument("--rates-per-meal", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    # Measure the database path rather than the response cache
+    @override_settings(MEAL_RESPONSE_CACHE_TIMEOUT=0)
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options["meals"], options["foods"], options["rates_per_meal"])
+
+            today = JalaliDate.today()
+            client = APIClient()
+            endpoints = [
+                (
+                    "current-month",
+                    reverse(
+                        f"{U.V1_MEAL}-get-meals-for-current-month",
+                        args=[f"{today.year}-{today.month:02d}"],
+                    ),
+                ),
+                (
+                    "current-week",
+                    reverse(f"{U.V1_MEAL}-filter-meals", args=["current_week"]),
+                ),
+                ("upcoming", reverse(f"{U.V1_MEAL}-filter-meals", args=["upcoming"])),
+            ]
+            for name, url in endpoints:
+                self.bench(client, name, url, options["repeat"])
+
+            transaction.set_rollback(True)
+
+    def seed(self, meal_count, food_count, rates_per_meal):
+        users = User.objects.bulk_create(
+            User(phone_number=f"bench{i}", full_name=f"Bench {i}")
+            for i in range(rates_per_meal)
+        )
+        foods = Food.objects.bulk_create(
+            Food(name=f"Bench food {i}") for i in range(food_count)
+        )
+        # Spread the meals around today so every calendar filter has rows
+        first_day = JalaliDate.today().to_gregorian() - timedelta(days=meal_count // 2)
+        meals = Meal.objects.bulk_create(
+            Meal(date=first_day + timedelta(days=i), food=foods[i % food_count])
+            for i in range(meal_count)
+        )
+        Rate.objects.bulk_create(
+            Rate(user=user, meal=meal, rate=(meal.id + user.id) % 5 + 1)
+            for meal in meals
+            for user in users
+        )
+        self.stdout.write(
+            f"Seeded {meal_count} meals, {food_count} foods and "
+            f"{meal_count * rates_per_meal} rates"
+        )
+
+    def bench(self, client, name, url, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - start)
+
+        self.stdout.write(
+            f"{name:<14} rows={len(response.data):<6} queries={len(queries):<4} "
+            f"best={min(timings) * 1000:.1f}ms "
+            f"mean={sum(timings) / len(timings) * 1000:.1f}ms"
+        )
@@ -0,0 +1,139 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from meal.models import Comment, Food, Meal, Rate
+from user.models import User
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a large meal dataset inside a transaction, prints EXPLAIN output "
+        "and timings of the hot meal lookups with and without their indexes, "
+        "then rolls everything back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        # SQLite can only alter tables inside a transaction with foreign key
+        # checks turned off beforehand
+        connection.disable_constraint_checking()
+        try:
+            self.run(options["rows"], options["repeat"])
+        finally:
+            connection.enable_constraint_checking()
+
+    def run(self, rows, repeat):
+        with transaction.atomic():
+            meal, user = self.seed(rows)
+            day = meal.date
+            benchmarks = [
+                (
+                    "meal by date",
+                    Meal,
+                    lambda: Meal.objects.filter(date=day),
+                ),
+                (
+                    "meals of a month",
+                    Meal,
+                    lambda: Meal.objects.filter(
+                        date__range=[day, day + timedelta(days=30)]
+                    ),
+                ),
+                (
+                    "comments of a meal",
+                    Comment,
+                    lambda: Comment.objects.filter(meal=meal).order_by("-updated_at"),
+                ),
+                (
+                    "latest comments",
+                    Comment,
+                    lambda: Comment.objects.order_by("-updated_at")[:5],
+                ),
+                (
+                    "rate of a user for a meal",
+                    Rate,
+                    lambda: Rate.objects.filter(meal=meal, user=user),
+                ),
+            ]
+            for name, model, queryset in benchmarks:
+                self.bench(name, model, queryset, repeat)
+
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        meal_count = max(rows // 10, 1)
+        users = User.objects.bulk_create(
+            User(phone_number=f"bench{i}", full_name=f"Bench {i}") for i in range(100)
+        )
+        food = Food.objects.create(name="Bench food")
+        first_day = date(2000, 1, 1)
+        for start in range(0, meal_count, BATCH_SIZE):
+            Meal.objects.bulk_create(
+                Meal(date=first_day + timedelta(days=i), food=food)
+                for i in range(start, min(start + BATCH_SIZE, meal_count))
+            )
+        meal_ids = list(Meal.objects.values_list("id", flat=True))
+        for start in range(0, rows, BATCH_SIZE):
+            batch = range(start, min(start + BATCH_SIZE, rows))
+            Comment.objects.bulk_create(
+                Comment(user=users[i % 100], meal_id=meal_ids[i % meal_count], text="Bench")
+                for i in batch
+            )
+            Rate.objects.bulk_create(
+                Rate(
+                    user=users[(i // meal_count) % 100],
+                    meal_id=meal_ids[i % meal_count],
+                    rate=i % 5 + 1,
+                )
+                for i in batch
+                if i < meal_count * 100
+            )
+        self.stdout.write(f"Seeded {meal_count} meals, {rows} comments and rates")
+
+        meal = Meal.objects.get(id=meal_ids[meal_count // 2])
+        return meal, Rate.objects.filter(meal=meal).first().user
+
+    def bench(self, name, model, queryset, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        indexes = list(model._meta.indexes)
+        constraints = list(model._meta.constraints)
+        # SQLite drops constraints by rebuilding the table from the model state
+        model._meta.constraints = []
+        try:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(model, index)
+                for constraint in constraints:
+                    editor.remove_constraint(model, constraint)
+        finally:
+            model._meta.constraints = constraints
+        self.report("without indexes", queryset, repeat)
+
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(model, index)
+            for constraint in constraints:
+                editor.add_constraint(model, constraint)
+        self.report("with indexes", queryset, repeat)
+
+    def report(self, label, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset())
+            timings.append(time.perf_counter() - start)
+
+        self.stdout.write(
+            f"  {label}: best={min(timings) * 1000:.2f}ms "
+            f"mean={sum(timings) / len(timings) * 1000:.2f}ms"
+        )
+        for line in queryset().explain().splitlines():
+            self.stdout.write(f"    {line}")
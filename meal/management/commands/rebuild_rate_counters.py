@@ -0,0 +1,70 @@
+from math import isclose
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from meal.cache import invalidate
+from meal.models import Food, Meal, Rate
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the rate_sum/rate_count counters of meals and foods from the rate table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report counters that drifted, without fixing them",
+        )
+
+    def handle(self, *args, **options):
+        rates = Rate.objects.filter(meal__isnull=False).order_by()
+        with transaction.atomic():
+            meal_drift = self.rebuild(
+                Meal, rates.values_list("meal"), options["check"]
+            )
+            food_drift = self.rebuild(
+                Food, rates.values_list("meal__food"), options["check"]
+            )
+            if meal_drift + food_drift and not options["check"]:
+                # bulk_update sends no signals, drop the cached responses once committed
+                invalidate("Rate")
+
+        drift = meal_drift + food_drift
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Rate counters are consistent."))
+        elif options["check"]:
+            self.stdout.write(self.style.WARNING(f"{drift} rate counters drifted."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {drift} drifted rate counters."))
+
+    def rebuild(self, model, grouped_rates, check):
+        totals = {
+            pk: (rate_sum, rate_count)
+            for pk, rate_sum, rate_count in grouped_rates.annotate(
+                Sum("rate"), Count("id")
+            )
+        }
+
+        drifted = []
+        for obj in model.objects.only("rate_sum", "rate_count", "avg_rate").iterator():
+            rate_sum, rate_count = totals.get(obj.pk, (0, 0))
+            avg_rate = rate_sum / rate_count if rate_count else 0
+            if (obj.rate_sum, obj.rate_count) == (rate_sum, rate_count) and isclose(
+                obj.avg_rate, avg_rate
+            ):
+                continue
+
+            self.stdout.write(
+                f"{model.__name__} {obj.pk}: stored {obj.rate_sum}/{obj.rate_count}, "
+                f"actual {rate_sum}/{rate_count}"
+            )
+            obj.rate_sum, obj.rate_count, obj.avg_rate = rate_sum, rate_count, avg_rate
+            drifted.append(obj)
+
+        if drifted and not check:
+            model.objects.bulk_update(
+                drifted, ["rate_sum", "rate_count", "avg_rate"], batch_size=500
+            )
+        return len(drifted)
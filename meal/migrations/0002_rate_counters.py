@@ -0,0 +1,54 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_rate_counters(apps, schema_editor):
+    Rate = apps.get_model("meal", "Rate")
+    Meal = apps.get_model("meal", "Meal")
+    Food = apps.get_model("meal", "Food")
+
+    for model, lookup in ((Meal, "meal"), (Food, "meal__food")):
+        rates = Rate.objects.filter(**{lookup: OuterRef("pk")}).order_by().values(lookup)
+        model.objects.update(
+            rate_sum=Coalesce(Subquery(rates.annotate(total=Sum("rate")).values("total")), 0),
+            rate_count=Coalesce(Subquery(rates.annotate(count=Count("id")).values("count")), 0),
+        )
+        model.objects.update(
+            avg_rate=Coalesce(
+                Cast("rate_sum", models.FloatField()) / NullIf("rate_count", 0), 0.0
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='rate_count',
+            field=models.IntegerField(default=0, verbose_name='rate count'),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='rate_sum',
+            field=models.IntegerField(default=0, verbose_name='rate sum'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='rate_count',
+            field=models.IntegerField(default=0, verbose_name='rate count'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='rate_sum',
+            field=models.IntegerField(default=0, verbose_name='rate sum'),
+        ),
+        migrations.RunPython(fill_rate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:43
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+fill_rate_counters = import_module("meal.migrations.0002_rate_counters").fill_rate_counters
+
+
+def remove_duplicate_rates(apps, schema_editor):
+    """Keep only the latest rate of each user for a meal, then refresh the counters."""
+    Rate = apps.get_model("meal", "Rate")
+    seen = set()
+    duplicates = []
+    rates = Rate.objects.filter(user__isnull=False, meal__isnull=False).order_by(
+        "user", "meal", "-updated_at", "-id"
+    )
+    for pk, user_id, meal_id in rates.values_list("id", "user", "meal").iterator():
+        if (user_id, meal_id) in seen:
+            duplicates.append(pk)
+        else:
+            seen.add((user_id, meal_id))
+
+    for start in range(0, len(duplicates), 500):
+        Rate.objects.filter(id__in=duplicates[start:start + 500]).delete()
+    if duplicates:
+        fill_rate_counters(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal', '0002_rate_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_rates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rate',
+            constraint=models.UniqueConstraint(fields=('user', 'meal'), name='unique_rate1', violation_error_message='user has already rated this meal'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal', '0003_rate_unique_user_meal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['meal', '-updated_at'], name='index_comment1'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-updated_at'], name='index_comment2'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['date'], name='index_meal1'),
+        ),
+    ]
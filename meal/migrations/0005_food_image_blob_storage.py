@@ -0,0 +1,19 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:27
+
+from django.db import migrations, models
+import utils.media_blobs
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal', '0004_meal_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='food',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=utils.media_blobs.blob_storage, upload_to='food_images/', verbose_name='image'),
+        ),
+    ]
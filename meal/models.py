@@ -1,17 +1,89 @@
 from django.utils.timezone import now
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.utils.translation import gettext_lazy as _
 from django_autoutils.model_utils import AbstractModel
 
 from user.models import User
+from utils.media_blobs import blob_storage
 from utils.strings.db_names import D
-
-
-class Food(AbstractModel):
+from utils.strings.field_names import S
+
+
+class RateCounterQuerySet(models.QuerySet):
+    def add_rate(self, rate_delta, count_delta):
+        """
+        Shift the running rate counters of the matched rows by the given deltas
+        in a single UPDATE, recomputing avg_rate from the same counters.
+        """
+        rate_sum = F("rate_sum") + rate_delta
+        rate_count = F("rate_count") + count_delta
+        return self.update(
+            # avg_rate goes first so backends that apply SET clauses in order
+            # still compute it from the counters before this update
+            avg_rate=Coalesce(
+                Cast(rate_sum, models.FloatField()) / NullIf(rate_count, 0), 0.0
+            ),
+            rate_sum=rate_sum,
+            rate_count=rate_count,
+        )
+
+
+class RateCounterMixin:
+    """
+    Models whose rate counters meal.signals keep up to date in SQL. Saving an
+    existing row leaves the counters out, so an instance loaded before a rate
+    was written doesn't put its stale copy back.
+    """
+
+    RATE_COUNTER_FIELDS = ("avg_rate", "rate_sum", "rate_count")
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATE_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class FoodQuerySet(RateCounterQuerySet):
+    def with_stats(self):
+        """
+        Annotate each food with its meal count, so serializers don't need a
+        query per row.
+        """
+        meal_count = (
+            Meal.objects.filter(food=OuterRef("pk"))
+            .order_by()
+            .values("food")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return self.annotate(
+            annotated_meal_count=Coalesce(
+                Subquery(meal_count, output_field=models.IntegerField()), 0
+            ),
+        )
+
+
+class Food(RateCounterMixin, AbstractModel):
     name = models.CharField(_("name"), max_length=255)
-    image = models.ImageField(_("image"), upload_to='food_images/', null=True, blank=True)
+    image = models.ImageField(
+        _("image"), upload_to='food_images/', storage=blob_storage, null=True, blank=True
+    )
     description = models.TextField(_("description"), null=True, blank=True)
     avg_rate = models.FloatField(_("rate"), default=0)
+    rate_sum = models.IntegerField(_("rate sum"), default=0)  # Sum of the rates of all its meals
+    rate_count = models.IntegerField(_("rate count"), default=0)
+
+    objects = FoodQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -22,10 +94,22 @@ class Food(AbstractModel):
         verbose_name_plural = _("foods")
 
 
-class Meal(AbstractModel):
+class MealQuerySet(RateCounterQuerySet):
+    def with_stats(self):
+        """Fetch the food of every meal, with its stats, in one extra query."""
+        return self.prefetch_related(
+            Prefetch("food", queryset=Food.objects.with_stats())
+        )
+
+
+class Meal(RateCounterMixin, AbstractModel):
     date = models.DateField(_("date"))
     food = models.ForeignKey(Food, on_delete=models.PROTECT)
     avg_rate = models.FloatField(_("rate"), default=0)
+    rate_sum = models.IntegerField(_("rate sum"), default=0)
+    rate_count = models.IntegerField(_("rate count"), default=0)
+
+    objects = MealQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.date} {self.food}"
@@ -34,6 +118,18 @@ class Meal(AbstractModel):
         db_table = D.MEAL
         verbose_name = _("meal")
         verbose_name_plural = _("meals")
+        indexes = [
+            # Date lookups and the calendar range filters
+            models.Index(fields=[S.DATE], name=f"{S.INDEX}_{S.MEAL}1"),
+        ]
+
+
+class CommentQuerySet(models.QuerySet):
+    def with_details(self):
+        """Load the user, meal and food of every comment in a fixed number of queries."""
+        return self.select_related("user").prefetch_related(
+            Prefetch("meal", queryset=Meal.objects.with_stats())
+        )
 
 
 class Comment(AbstractModel):
@@ -43,6 +139,8 @@ class Comment(AbstractModel):
     created_at = models.DateTimeField(default=now)  # Auto set on creation
     updated_at = models.DateTimeField(auto_now=True)  # Auto update on save
 
+    objects = CommentQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user} {self.meal}"
 
@@ -50,6 +148,12 @@ class Comment(AbstractModel):
         db_table = D.COMMENT
         verbose_name = _("comment")
         verbose_name_plural = _("comments")
+        indexes = [
+            # Latest comments of a meal
+            models.Index(fields=[S.MEAL, "-updated_at"], name=f"{S.INDEX}_{S.COMMENT}1"),
+            # Latest comments overall
+            models.Index(fields=["-updated_at"], name=f"{S.INDEX}_{S.COMMENT}2"),
+        ]
 
 
 class Rate(AbstractModel):
@@ -58,6 +162,28 @@ class Rate(AbstractModel):
     rate = models.IntegerField(_("rate"), default=5)
     created_at = models.DateTimeField(default=now)  # Auto set on creation
     updated_at = models.DateTimeField(auto_now=True)  # Auto update on save
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_counted_values()
+        return instance
+
+    def remember_counted_values(self):
+        """Keep the stored meal and rate so signals can compute counter deltas."""
+        rate = self.__dict__.get("rate")
+        self._counted_meal_id = self.__dict__.get("meal_id")
+        self._counted_rate = int(rate) if rate is not None else None
+
+    def save(self, *args, **kwargs):
+        # Keep the counter updates done by meal.signals in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return f"{self.meal} {self.rate}"
 
@@ -65,3 +191,10 @@ class Rate(AbstractModel):
         db_table = D.RATE
         verbose_name = _("rate")
         verbose_name_plural = _("rates")
+        constraints = [
+            models.UniqueConstraint(
+                fields=[S.USER, S.MEAL],
+                name=f"{S.UNIQUE}_{S.RATE}1",
+                violation_error_message=_("user has already rated this meal"),
+            )
+        ]
@@ -0,0 +1,39 @@
+from rest_framework.pagination import CursorPagination
+
+
+class LatestCursorPagination(CursorPagination):
+    """
+    Cursor pagination over the most recently updated rows first. The id breaks
+    ties between rows updated at the same time, so pages stay stable while new
+    rows are written.
+    """
+
+    ordering = ("-updated_at", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class OptionalPaginationMixin:
+    """
+    Let clients written before the list endpoints were paginated ask for every
+    row with ?paginate=false.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get("paginate", "").lower() in ("false", "0"):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class LatestListPagination(OptionalPaginationMixin, LatestCursorPagination):
+    pass
+
+
+class MealListPagination(OptionalPaginationMixin, LatestCursorPagination):
+    # Calendar order, walked along the date index
+    ordering = ("date", "id")
+
+
+class FoodListPagination(OptionalPaginationMixin, LatestCursorPagination):
+    ordering = ("id",)
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from user.serializers import PublicUserSerializer
+from utils.derivatives import ImageDerivativesField
 from .models import Food, Meal, Comment, Rate
-from django.db.models import Avg
 
 
 class FoodSerializer(serializers.ModelSerializer):
@@ -9,6 +9,7 @@ class FoodSerializer(serializers.ModelSerializer):
     avg_rate = (
         serializers.SerializerMethodField()
     )  # Add avg_rate as a SerializerMethodField
+    image_derivatives = ImageDerivativesField(source="image")
 
     class Meta:
         model = Food
@@ -16,22 +17,21 @@ class FoodSerializer(serializers.ModelSerializer):
             "id",
             "name",
             "image",
+            "image_derivatives",
             "description",
             "avg_rate",
             "meal_count",
         ]
 
     def get_meal_count(self, obj):
+        # Use the value annotated by Food.objects.with_stats() when available
+        if hasattr(obj, "annotated_meal_count"):
+            return obj.annotated_meal_count
         return Meal.objects.filter(food=obj).count()
 
     def get_avg_rate(self, obj):
-        # Get all the rates for meals that have this food
-        avg_rate = Rate.objects.filter(meal__food=obj).aggregate(Avg("rate"))[
-            "rate__avg"
-        ]
-
-        # Return avg_rate or 0 if no ratings exist
-        return round(avg_rate, 2) if avg_rate else 0
+        # avg_rate is kept up to date from the rate counters by meal.signals
+        return round(obj.avg_rate, 2) if obj.avg_rate else 0
 
 
 class MealSerializer(serializers.ModelSerializer):
@@ -46,9 +46,8 @@ class MealSerializer(serializers.ModelSerializer):
         fields = ["id", "date", "food", "avg_rate"]
 
     def get_avg_rate(self, obj):
-        # Calculate the average rate of all rates associated with this meal
-        avg_rate = Rate.objects.filter(meal=obj).aggregate(Avg("rate"))["rate__avg"]
-        return round(avg_rate, 2) if avg_rate is not None else 0
+        # avg_rate is kept up to date from the rate counters by meal.signals
+        return round(obj.avg_rate, 2) if obj.avg_rate else 0
 
 
 class CreateMealSerializer(serializers.ModelSerializer):
@@ -103,6 +102,54 @@ class CommentDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at", "updated_at", "user", "meal"]
 
 
+class MealCompactSerializer(serializers.ModelSerializer):
+    date = serializers.DateField(format="%Y-%m-%d")
+    avg_rate = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Meal
+        fields = ["id", "date", "food", "avg_rate"]
+
+    def get_avg_rate(self, obj):
+        return round(obj.avg_rate, 2) if obj.avg_rate else 0
+
+
+class CommentCompactSerializer(serializers.ModelSerializer):
+    """Comment with only the id of its meal; the meal is side-loaded once."""
+
+    user = PublicUserSerializer(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ["id", "user", "meal", "text", "created_at", "updated_at"]
+        read_only_fields = ["created_at", "updated_at", "user", "meal"]
+
+
+def serialize_comments(comments, request):
+    """
+    Serialize comments for a list response. With ?compact=true each meal and
+    food is serialized once into an "included" map and comments only carry
+    the meal id; otherwise included is None and meals are embedded.
+    """
+    context = {"request": request}
+    if request.query_params.get("compact") != "true":
+        return CommentDetailSerializer(comments, many=True, context=context).data, None
+
+    meals = {comment.meal_id: comment.meal for comment in comments if comment.meal_id}
+    foods = {meal.food_id: meal.food for meal in meals.values()}
+    included = {
+        "meals": {
+            meal["id"]: meal
+            for meal in MealCompactSerializer(meals.values(), many=True).data
+        },
+        "foods": {
+            food["id"]: food
+            for food in FoodSerializer(foods.values(), many=True, context=context).data
+        },
+    }
+    return CommentCompactSerializer(comments, many=True, context=context).data, included
+
+
 class RateSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
 
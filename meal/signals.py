@@ -1,24 +1,93 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import Rate, Meal, Food
-from django.db.models import Avg
+from .cache import invalidate
+from .models import Comment, Rate, Meal, Food
 
+
+def add_rate_to_meal(meal_id, rate_delta, count_delta):
+    """Shift the rate counters of a meal and of its food by the given deltas."""
+    if meal_id is None or (rate_delta == 0 and count_delta == 0):
+        return
+    Meal.objects.filter(pk=meal_id).add_rate(rate_delta, count_delta)
+    Food.objects.filter(meal=meal_id).add_rate(rate_delta, count_delta)
+
+
+@receiver(pre_save, sender=Rate)
+def remember_unloaded_rate(sender, instance, **kwargs):
+    # Instances that were neither loaded nor created here don't know what the
+    # counters currently hold for them, so look it up once
+    if instance._state.adding or hasattr(instance, "_counted_rate"):
+        return
+    stored = Rate.objects.filter(pk=instance.pk).values("meal_id", "rate").first()
+    instance._counted_meal_id = stored["meal_id"] if stored else None
+    instance._counted_rate = stored["rate"] if stored else None
+
+
+@receiver(post_save, sender=Rate)
+def count_saved_rate(sender, instance, created, **kwargs):
+    rate = int(instance.rate)
+    counted_meal_id = None if created else instance._counted_meal_id
+    counted_rate = None if created else instance._counted_rate
+
+    if counted_meal_id is not None and counted_meal_id == instance.meal_id:
+        add_rate_to_meal(instance.meal_id, rate - counted_rate, 0)
+    else:
+        if counted_meal_id is not None:
+            add_rate_to_meal(counted_meal_id, -counted_rate, -1)
+        add_rate_to_meal(instance.meal_id, rate, 1)
+
+    instance.remember_counted_values()
+
+
+@receiver(post_delete, sender=Rate)
+def uncount_deleted_rate(sender, instance, **kwargs):
+    meal_id = getattr(instance, "_counted_meal_id", instance.meal_id)
+    rate = getattr(instance, "_counted_rate", instance.rate)
+    if rate is not None:
+        add_rate_to_meal(meal_id, -int(rate), -1)
+
+
+@receiver(pre_delete, sender=Meal)
+def uncount_deleted_meal(sender, instance, **kwargs):
+    # The meal's rates are detached from it, so take them out of its food
+    counters = Meal.objects.filter(pk=instance.pk).values("rate_sum", "rate_count").first()
+    if counters:
+        Food.objects.filter(pk=instance.food_id).add_rate(
+            -counters["rate_sum"], -counters["rate_count"]
+        )
+
+
+@receiver(pre_save, sender=Meal)
+def remember_meal_food(sender, instance, **kwargs):
+    # The food whose counters hold the meal's rates, and what they add up to
+    instance._counted_food = None
+    if not instance._state.adding:
+        instance._counted_food = (
+            Meal.objects.filter(pk=instance.pk)
+            .values("food_id", "rate_sum", "rate_count")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Meal)
+def move_rates_to_new_food(sender, instance, **kwargs):
+    counted = instance._counted_food
+    if counted and counted["food_id"] != instance.food_id:
+        Food.objects.filter(pk=counted["food_id"]).add_rate(
+            -counted["rate_sum"], -counted["rate_count"]
+        )
+        Food.objects.filter(pk=instance.food_id).add_rate(
+            counted["rate_sum"], counted["rate_count"]
+        )
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
 @receiver(post_save, sender=Rate)
 @receiver(post_delete, sender=Rate)
-def update_meal_avg_rate(sender, instance, **kwargs):
-    meal = instance.meal
-    if meal:
-        # Calculate the average rate for the meal
-        avg_rate = meal.rate_set.aggregate(Avg('rate'))['rate__avg'] or 0
-        meal.avg_rate = avg_rate
-        meal.save()
-
-        # Update the avg_rate of the associated food
-        update_food_avg_rate(meal.food)
-
-def update_food_avg_rate(food):
-    if food:
-        # Calculate the average rate for the food based on its meals
-        avg_rate = food.meal_set.aggregate(Avg('avg_rate'))['avg_rate__avg'] or 0
-        food.avg_rate = avg_rate
-        food.save()
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate(sender.__name__)
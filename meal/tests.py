@@ -1,3 +1,531 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from persiantools.jdatetime import JalaliDate
+from rest_framework.test import APIClient
+
+from meal.cache import get_generation
+from meal.models import Comment, Food, Meal, Rate
+from user.models import User
+from utils.strings.url_names import U
+
+
+@override_settings(MEAL_RESPONSE_CACHE_TIMEOUT=0)
+class FoodListQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number="09120000000", full_name="Tester", password="secret"
+        )
+        self.day = date(2024, 1, 1)
+
+    def create_foods(self, count):
+        for _ in range(count):
+            food = Food.objects.create(name="Food")
+            for _ in range(2):
+                meal = Meal.objects.create(date=self.day, food=food)
+                Rate.objects.create(user=self.user, meal=meal, rate=4)
+                self.day += timedelta(days=1)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f"{U.V1_FOOD}-list"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data["results"]
+
+    def test_list_query_count_is_constant(self):
+        self.create_foods(2)
+        small_count, _ = self.count_list_queries()
+
+        self.create_foods(20)
+        large_count, data = self.count_list_queries()
+
+        self.assertEqual(len(data), 22)
+        self.assertEqual(small_count, large_count)
+
+    def test_list_stats_match_rates(self):
+        food = Food.objects.create(name="Kebab")
+        meal = Meal.objects.create(date=self.day, food=food)
+        Meal.objects.create(date=self.day + timedelta(days=1), food=food)
+        Rate.objects.create(user=self.user, meal=meal, rate=3)
+        Rate.objects.create(meal=meal, rate=4)
+        Food.objects.create(name="Unrated")
+
+        _, data = self.count_list_queries()
+        stats = {item["name"]: (item["meal_count"], item["avg_rate"]) for item in data}
+
+        self.assertEqual(stats["Kebab"], (2, 3.5))
+        self.assertEqual(stats["Unrated"], (0, 0))
+
+
+@override_settings(MEAL_RESPONSE_CACHE_TIMEOUT=0)
+class MealCalendarQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number="09120000000", full_name="Tester", password="secret"
+        )
+        self.today = JalaliDate.today()
+        self.month = f"{self.today.year}-{self.today.month:02d}"
+        self.day = self.today.replace(day=1).to_gregorian()
+
+    def create_meals(self, count):
+        for _ in range(count):
+            food = Food.objects.create(name="Food")
+            meal = Meal.objects.create(date=self.day, food=food)
+            Rate.objects.create(user=self.user, meal=meal, rate=2)
+            Rate.objects.create(meal=meal, rate=5)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_current_month_query_count_is_constant(self):
+        url = reverse(f"{U.V1_MEAL}-get-meals-for-current-month", args=[self.month])
+        self.create_meals(2)
+        small_count, _ = self.count_queries(url)
+
+        self.create_meals(20)
+        large_count, data = self.count_queries(url)
+
+        self.assertEqual(len(data), 22)
+        self.assertEqual(small_count, large_count)
+        self.assertLessEqual(large_count, 3)
+        self.assertEqual(data[0]["avg_rate"], 3.5)
+        self.assertEqual(data[0]["food"]["meal_count"], 1)
+
+    def test_filter_query_count_is_constant(self):
+        url = reverse(f"{U.V1_MEAL}-filter-meals", args=["all"])
+        self.create_meals(2)
+        small_count, _ = self.count_queries(url)
+
+        self.create_meals(20)
+        large_count, data = self.count_queries(url)
+
+        self.assertEqual(len(data), 22)
+        self.assertEqual(small_count, large_count)
+        self.assertLessEqual(large_count, 3)
+
+
+class RateCounterTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                phone_number=f"0912000000{i}", full_name="Tester", password="secret"
+            )
+            for i in range(3)
+        ]
+        self.food = Food.objects.create(name="Kebab")
+        self.meal = Meal.objects.create(date=date(2024, 1, 1), food=self.food)
+        self.other_meal = Meal.objects.create(date=date(2024, 1, 2), food=self.food)
+
+    def assertCounters(self, obj, rate_sum, rate_count, avg_rate):
+        obj.refresh_from_db()
+        self.assertEqual((obj.rate_sum, obj.rate_count), (rate_sum, rate_count))
+        self.assertAlmostEqual(obj.avg_rate, avg_rate)
+
+    def test_counters_follow_rate_writes(self):
+        first = Rate.objects.create(user=self.users[0], meal=self.meal, rate=4)
+        Rate.objects.create(user=self.users[1], meal=self.meal, rate=1)
+        Rate.objects.create(user=self.users[2], meal=self.other_meal, rate=5)
+        self.assertCounters(self.meal, 5, 2, 2.5)
+        self.assertCounters(self.food, 10, 3, 10 / 3)
+
+        first.rate = "2"
+        first.save()
+        self.assertCounters(self.meal, 3, 2, 1.5)
+
+        loaded = Rate.objects.get(pk=first.pk)
+        loaded.meal = self.other_meal
+        loaded.save()
+        self.assertCounters(self.meal, 1, 1, 1)
+        self.assertCounters(self.other_meal, 7, 2, 3.5)
+        self.assertCounters(self.food, 8, 3, 8 / 3)
+
+        Rate.objects.filter(meal=self.other_meal).delete()
+        self.assertCounters(self.other_meal, 0, 0, 0)
+        self.assertCounters(self.food, 1, 1, 1)
+
+    def test_saving_a_stale_instance_keeps_the_counters(self):
+        meal = Meal.objects.get(pk=self.meal.pk)
+        food = Food.objects.get(pk=self.food.pk)
+        Rate.objects.create(user=self.users[0], meal=self.meal, rate=4)
+
+        meal.date = date(2024, 1, 3)
+        meal.save()
+        food.name = "Chelo kebab"
+        food.save()
+
+        self.assertCounters(meal, 4, 1, 4)
+        self.assertCounters(food, 4, 1, 4)
+        self.assertEqual((meal.date, food.name), (date(2024, 1, 3), "Chelo kebab"))
+
+    def test_changing_meal_food_moves_its_rates(self):
+        Rate.objects.create(user=self.users[0], meal=self.meal, rate=4)
+        Rate.objects.create(user=self.users[1], meal=self.other_meal, rate=2)
+        other_food = Food.objects.create(name="Pizza")
+        admin = User.objects.create_superuser(
+            phone_number="09120000009", full_name="Admin", password="secret"
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        response = client.put(
+            reverse(f"{U.V1_MEAL}-detail", args=[self.meal.pk]),
+            {"food_id": other_food.pk, "date": "2024-01-01"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertCounters(self.food, 2, 1, 2)
+        self.assertCounters(other_food, 4, 1, 4)
+        self.assertCounters(self.meal, 4, 1, 4)
+        out = StringIO()
+        call_command("rebuild_rate_counters", "--check", stdout=out)
+        self.assertIn("Rate counters are consistent.", out.getvalue())
+
+    def test_deleting_meal_removes_its_rates_from_food(self):
+        Rate.objects.create(user=self.users[0], meal=self.meal, rate=4)
+        Rate.objects.create(user=self.users[1], meal=self.other_meal, rate=2)
+
+        self.other_meal.delete()
+
+        self.assertCounters(self.food, 4, 1, 4)
+
+    def test_rebuild_command_fixes_drift(self):
+        Rate.objects.create(user=self.users[0], meal=self.meal, rate=4)
+        Rate.objects.create(user=self.users[1], meal=self.meal, rate=2)
+        Meal.objects.filter(pk=self.meal.pk).update(rate_sum=0, rate_count=7)
+
+        out = StringIO()
+        call_command("rebuild_rate_counters", "--check", stdout=out)
+        self.assertIn("1 rate counters drifted", out.getvalue())
+        self.assertCounters(self.meal, 0, 7, 3)
+
+        generations = [get_generation(namespace) for namespace in ("meals", "foods")]
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_rate_counters", stdout=StringIO())
+        self.assertCounters(self.meal, 6, 2, 3)
+        for namespace, generation in zip(("meals", "foods"), generations):
+            self.assertNotEqual(get_generation(namespace), generation)
+        self.assertCounters(self.food, 6, 2, 3)
+
+    def test_rating_twice_updates_the_same_rate(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        url = reverse(f"{U.V1_MEAL}-rate", args=[self.meal.pk])
+
+        client.post(url, {"rate": 2})
+        response = client.post(url, {"rate": 5})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Rate.objects.filter(meal=self.meal).count(), 1)
+        self.assertCounters(self.meal, 5, 1, 5)
+
+    def test_duplicate_rate_is_rejected(self):
+        Rate.objects.create(user=self.users[0], meal=self.meal, rate=4)
+
+        with self.assertRaises(IntegrityError):
+            Rate.objects.create(user=self.users[0], meal=self.meal, rate=1)
+
+
+class FoodCommentsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number="09120000000", full_name="Tester", password="secret"
+        )
+        self.food = Food.objects.create(name="Kebab")
+        self.url = reverse(f"{U.V1_FOOD}-comments", args=[self.food.pk])
+
+    def create_comments(self, count):
+        meal = Meal.objects.create(date=date(2024, 1, 1), food=self.food)
+        for _ in range(count):
+            Comment.objects.create(user=self.user, meal=meal, text="Tasty")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_query_count_is_constant(self):
+        self.create_comments(2)
+        small_count, _ = self.count_queries(self.url)
+
+        self.create_comments(20)
+        large_count, data = self.count_queries(self.url)
+
+        self.assertEqual(len(data["results"]), 22)
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(data["results"][0]["meal"]["food"]["meal_count"], 2)
+
+    def test_cursor_walks_every_comment_once(self):
+        self.create_comments(5)
+        Comment.objects.update(updated_at=timezone.now())
+
+        seen = []
+        url = f"{self.url}?page_size=2"
+        while url:
+            _, data = self.count_queries(url)
+            seen += [comment["id"] for comment in data["results"]]
+            url = data["next"]
+
+        self.assertEqual(sorted(seen), sorted(Comment.objects.values_list("id", flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_compact_mode_side_loads_meals_and_foods(self):
+        self.create_comments(3)
+        meal = Meal.objects.get()
+
+        _, data = self.count_queries(f"{self.url}?compact=true")
+
+        self.assertEqual(len(data["results"]), 3)
+        self.assertEqual({comment["meal"] for comment in data["results"]}, {meal.pk})
+        self.assertEqual(list(data["included"]["meals"]), [meal.pk])
+        self.assertEqual(data["included"]["meals"][meal.pk]["food"], self.food.pk)
+        self.assertEqual(data["included"]["foods"][self.food.pk]["name"], "Kebab")
+
+    def test_meal_comments_compact_mode(self):
+        self.create_comments(2)
+        meal = Meal.objects.get()
+        url = reverse(f"{U.V1_MEAL}-comments", args=[meal.pk])
+
+        _, full = self.count_queries(url)
+        _, compact = self.count_queries(f"{url}?compact=true")
+
+        self.assertEqual(full[0]["meal"]["food"]["id"], self.food.pk)
+        self.assertEqual(compact["results"][0]["meal"], meal.pk)
+        self.assertIn(self.food.pk, compact["included"]["foods"])
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number="09120000000", full_name="Tester", password="secret"
+        )
+        self.food = Food.objects.create(name="Kebab")
+        self.meal = Meal.objects.create(date=date(2024, 1, 1), food=self.food)
+        self.url = reverse(f"{U.V1_MEAL}-get-meal-by-date", args=["2024-01-01"])
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_second_request_is_served_from_cache(self):
+        _, first = self.get(self.url)
+        query_count, second = self.get(self.url)
+
+        self.assertEqual(query_count, 0)
+        self.assertEqual(first, second)
+
+    def test_writes_invalidate_dependent_responses(self):
+        self.get(self.url)
+        self.get(reverse(f"{U.V1_FOOD}-list"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rate.objects.create(user=self.user, meal=self.meal, rate=4)
+
+        _, meal = self.get(self.url)
+        _, foods = self.get(reverse(f"{U.V1_FOOD}-list"))
+        self.assertEqual(meal["avg_rate"], 4)
+        self.assertEqual(foods["results"][0]["avg_rate"], 4)
+
+    def test_comments_do_not_invalidate_meals(self):
+        self.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.user, meal=self.meal, text="Tasty")
+
+        query_count, _ = self.get(self.url)
+        self.assertEqual(query_count, 0)
+
+    def test_relative_filters_are_cached_per_day(self):
+        url = reverse(f"{U.V1_MEAL}-filter-meals", args=["upcoming"])
+        yesterday = datetime(2023, 12, 31, 12, tzinfo=dt_timezone.utc)
+        with mock.patch("django.utils.timezone.now", return_value=yesterday):
+            _, before = self.get(url)
+        with mock.patch("django.utils.timezone.now", return_value=yesterday + timedelta(days=1)):
+            _, after = self.get(url)
+
+        self.assertEqual(len(before), 1)
+        self.assertEqual(after, [])
+
+    def test_stats_count_hits_and_misses(self):
+        admin = User.objects.create_superuser(
+            phone_number="09120000001", full_name="Admin", password="secret"
+        )
+        self.get(self.url)
+        self.get(self.url)
+
+        self.client.force_authenticate(admin)
+        response = self.client.get(reverse(U.V1_CACHE_STATS))
+
+        self.assertEqual(response.data["meals"], {"hits": 1, "misses": 1})
+
+
+@override_settings(MEAL_RESPONSE_CACHE_TIMEOUT=0, MEAL_RESPONSE_ETAGS=True)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number="09120000000", full_name="Tester", password="secret"
+        )
+        self.food = Food.objects.create(name="Kebab")
+        self.meal = Meal.objects.create(date=date(2024, 1, 1), food=self.food)
+        self.url = reverse(f"{U.V1_FOOD}-list")
+
+    def test_unchanged_data_returns_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+
+        with CaptureQueriesContext(connection) as queries:
+            repeated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated["ETag"], response["ETag"])
+        # The fingerprint comes from the cache, the list is never serialized
+        self.assertEqual(len(queries), 0)
+
+    def test_rating_changes_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rate.objects.create(user=self.user, meal=self.meal, rate=5)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["results"][0]["avg_rate"], 5)
+
+    def test_deleting_a_meal_changes_the_etag(self):
+        url = reverse(f"{U.V1_MEAL}-filter-meals", args=["past"])
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meal.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_etag_depends_on_the_query(self):
+        first = self.client.get(reverse(f"{U.V1_MEAL}-filter-meals", args=["past"]))
+        second = self.client.get(reverse(f"{U.V1_MEAL}-filter-meals", args=["upcoming"]))
+
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_relative_filter_etag_changes_with_the_date(self):
+        url = reverse(f"{U.V1_MEAL}-filter-meals", args=["upcoming"])
+        yesterday = datetime(2023, 12, 31, 12, tzinfo=dt_timezone.utc)
+        with mock.patch("django.utils.timezone.now", return_value=yesterday):
+            etag = self.client.get(url)["ETag"]
+        with mock.patch("django.utils.timezone.now", return_value=yesterday + timedelta(days=1)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    @override_settings(MEAL_RESPONSE_ETAGS=False)
+    def test_no_etag_without_a_shared_cache(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+
+
+@override_settings(MEAL_RESPONSE_CACHE_TIMEOUT=0)
+class ListPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number="09120000000", full_name="Tester", password="secret"
+        )
+        self.other = User.objects.create_user(
+            phone_number="09120000001", full_name="Other", password="secret"
+        )
+        self.client.force_authenticate(self.user)
+        self.kebab = Food.objects.create(name="Kebab")
+        self.rice = Food.objects.create(name="Rice")
+        self.meals = [
+            Meal.objects.create(
+                date=date(2024, 1, 1) + timedelta(days=i),
+                food=self.kebab if i % 2 else self.rice,
+            )
+            for i in range(10)
+        ]
+        for meal in self.meals:
+            Rate.objects.create(user=self.user, meal=meal, rate=4)
+            Comment.objects.create(user=self.other, meal=meal, text="Tasty")
+
+    def walk(self, url, **params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [item["id"] for item in response.data["results"]]
+            pages += 1
+            if not response.data["next"]:
+                return ids, pages
+            response = self.client.get(response.data["next"])
+
+    def test_meals_are_walked_in_date_order(self):
+        ids, pages = self.walk(reverse(f"{U.V1_MEAL}-list"), page_size=3)
+
+        self.assertEqual(ids, [meal.id for meal in self.meals])
+        self.assertEqual(pages, 4)
+
+    def test_meals_filter_by_date_range_and_food(self):
+        ids, _ = self.walk(
+            reverse(f"{U.V1_MEAL}-list"),
+            date_after="2024-01-03",
+            date_before="2024-01-08",
+            food=self.kebab.id,
+        )
+
+        self.assertEqual(ids, [self.meals[i].id for i in (3, 5, 7)])
+
+    def test_comments_and_rates_filter_by_user_and_meal_date(self):
+        url = reverse(f"{U.V1_COMMENT}-list")
+        self.assertEqual(len(self.walk(url, user=self.other.id)[0]), 10)
+        self.assertEqual(self.walk(url, user=self.user.id)[0], [])
+
+        ids, _ = self.walk(reverse(f"{U.V1_RATE}-list"), date_before="2024-01-02")
+        self.assertEqual(
+            sorted(ids),
+            sorted(Rate.objects.filter(meal__in=self.meals[:2]).values_list("id", flat=True)),
+        )
+
+    def test_page_size_is_capped(self):
+        Food.objects.bulk_create(Food(name=f"Food {i}") for i in range(250))
+
+        response = self.client.get(reverse(f"{U.V1_FOOD}-list"), {"page_size": 1000})
+
+        self.assertEqual(len(response.data["results"]), 200)
+
+    def test_legacy_clients_can_opt_out(self):
+        response = self.client.get(reverse(f"{U.V1_RATE}-list"), {"paginate": "false"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 10)
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(reverse(f"{U.V1_MEAL}-list"), {"date_after": "soon"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("date_after", response.data)
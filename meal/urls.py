@@ -12,4 +12,5 @@ router.register('rates', views.RateViewSet,basename=U.V1_RATE)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("cache/stats/", views.cache_stats, name=U.V1_CACHE_STATS),
 ]
@@ -1,6 +1,14 @@
 from rest_framework import viewsets, permissions
 from meal import models
+from meal.cache import cached_response, dated_meal_fingerprint, get_stats, meal_fingerprint
+from meal.filters import MealFilterBackend
 from meal.models import Food, Meal, Comment, Rate
+from meal.pagination import (
+    FoodListPagination,
+    LatestCursorPagination,
+    LatestListPagination,
+    MealListPagination,
+)
 from meal.permissions import IsOwnerOrReadOnly
 from meal.serializers import (
     CommentCreateSerializer,
@@ -10,42 +18,62 @@ from meal.serializers import (
     FoodSerializer,
     MealSerializer,
     RateSerializer,
+    serialize_comments,
 )
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
 from datetime import timedelta
 from persiantools.jdatetime import JalaliDate
+from utils.etag import conditional_etag
 
 
 class FoodViewSet(viewsets.ModelViewSet):
-    queryset = Food.objects.all()
+    queryset = Food.objects.with_stats()
     serializer_class = FoodSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = FoodListPagination
+
+    @conditional_etag(meal_fingerprint)
+    @cached_response("foods")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_etag(meal_fingerprint)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     @action(detail=True, methods=["get"])
     def comments(self, request, pk=None):
         food = self.get_object()
-        meals = Meal.objects.filter(food=food)
-        comments = Comment.objects.filter(meal__in=meals).order_by("-updated_at")
-        serializer = CommentDetailSerializer(
-            comments, many=True, context={"request": request}
-        )
-        return Response(serializer.data)
+        comments = Comment.objects.select_related("user", "meal").filter(meal__food=food)
+        paginator = LatestCursorPagination()
+        page = paginator.paginate_queryset(comments, request, view=self)
+        for comment in page:
+            # Every comment is about this food, which already carries its stats
+            comment.meal.food = food
+        data, included = serialize_comments(page, request)
+        response = paginator.get_paginated_response(data)
+        if included is not None:
+            response.data["included"] = included
+        return response
 
     @action(detail=True, methods=["get"])
+    @conditional_etag(meal_fingerprint)
     def meals(self, request, pk=None):
         food = self.get_object()
-        meals = Meal.objects.filter(food=food)
+        meals = Meal.objects.with_stats().filter(food=food)
         serializer = MealSerializer(meals, many=True, context={"request": request})
         return Response(serializer.data)
 
 
 class MealViewSet(viewsets.ModelViewSet):
-    queryset = Meal.objects.all()
+    queryset = Meal.objects.with_stats()
     serializer_class = MealSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = MealListPagination
+    filter_backends = [MealFilterBackend]
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -55,6 +83,14 @@ class MealViewSet(viewsets.ModelViewSet):
 
         return MealSerializer
 
+    @conditional_etag(meal_fingerprint)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_etag(meal_fingerprint)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -72,26 +108,29 @@ class MealViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=["get"], url_path="filter/(?P<filter>[^/.]+)")
+    @conditional_etag(dated_meal_fingerprint)
+    @cached_response("meals", dated=True)
     def filter_meals(self, request, filter=None):
         now = timezone.now().date()
+        meals = Meal.objects.with_stats()
         if filter == "upcoming":
-            meals = Meal.objects.filter(date__gt=now)
+            meals = meals.filter(date__gt=now)
         elif filter == "past":
-            meals = Meal.objects.filter(date__lt=now)
+            meals = meals.filter(date__lt=now)
         elif filter == "current_week":
             start_of_week = now - timedelta(days=now.weekday())
             end_of_week = start_of_week + timedelta(days=6)
-            meals = Meal.objects.filter(date__range=[start_of_week, end_of_week])
-        else:
-            meals = Meal.objects.all()
+            meals = meals.filter(date__range=[start_of_week, end_of_week])
 
         serializer = MealSerializer(meals, many=True, context={"request": request})
         return Response(serializer.data)
 
     @action(detail=False, methods=["get"], url_path="date/(?P<date>[^/.]+)")
+    @conditional_etag(meal_fingerprint)
+    @cached_response("meals")
     def get_meal_by_date(self, request, date=None):
         try:
-            meal = Meal.objects.get(date=date)
+            meal = Meal.objects.with_stats().get(date=date)
             serializer = self.get_serializer(meal, context={"request": request})
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Meal.DoesNotExist:
@@ -99,6 +138,8 @@ class MealViewSet(viewsets.ModelViewSet):
                 {"error": "Meal not found"}, status=status.HTTP_204_NO_CONTENT
             )
     @action(detail=False, methods=['get'], url_path='current-month/(?P<month>[^/.]+)')
+    @conditional_etag(meal_fingerprint)
+    @cached_response("meals")
     def get_meals_for_current_month(self, request, month=None):
         if month is None:
             return Response({'error': 'Month parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -110,15 +151,19 @@ class MealViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid month parameter format. Use jYYYY-jMM'}, status=status.HTTP_400_BAD_REQUEST)
 
-        meals = Meal.objects.filter(date__range=[start_of_month, end_of_month])
+        meals = Meal.objects.with_stats().filter(
+            date__range=[start_of_month, end_of_month]
+        )
         serializer = self.get_serializer(meals, many=True, context={'request': request})
         return Response(serializer.data)
     @action(detail=True, methods=["get"])
     def comments(self, request, pk=None):
         meal = self.get_object()
-        comments = Comment.objects.filter(meal=meal).order_by("-updated_at")
-        serializer = CommentDetailSerializer(comments, many=True,context={"request": request})
-        return Response(serializer.data)
+        comments = Comment.objects.with_details().filter(meal=meal).order_by("-updated_at")
+        data, included = serialize_comments(comments, request)
+        if included is not None:
+            return Response({"results": data, "included": included})
+        return Response(data)
 
     @action(detail=True, methods=["get", "post", "put", "delete"])
     def rate(self, request, pk=None):
@@ -168,8 +213,12 @@ class MealViewSet(viewsets.ModelViewSet):
 
 
 class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.with_details()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    pagination_class = LatestListPagination
+    filter_backends = [MealFilterBackend]
+    meal_lookup = "meal__"
+    filter_user = True
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -183,14 +232,27 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"], permission_classes=[permissions.IsAdminUser])
     def latest(self, request):
-        latest_comments = Comment.objects.order_by("-updated_at")[:5]
-        serializer = CommentDetailSerializer(latest_comments, many=True, context={'request': request})
-        return Response(serializer.data)
+        latest_comments = Comment.objects.with_details().order_by("-updated_at")[:5]
+        data, included = serialize_comments(latest_comments, request)
+        if included is not None:
+            return Response({"results": data, "included": included})
+        return Response(data)
 
 class RateViewSet(viewsets.ModelViewSet):
-    queryset = Rate.objects.all()
+    queryset = Rate.objects.select_related("user")
     serializer_class = RateSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LatestListPagination
+    filter_backends = [MealFilterBackend]
+    meal_lookup = "meal__"
+    filter_user = True
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """Hit and miss counters of the meal response cache."""
+    return Response(get_stats())
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from utils.derivatives import ImageDerivativesField
 from utils.strings.field_names import S
 from .models import User
 
@@ -17,10 +18,14 @@ class UserCreateSerializer(serializers.ModelSerializer):
 
 class UserSerializer(serializers.ModelSerializer):
     remove_image = serializers.BooleanField(write_only=True, required=False)
+    user_image_derivatives = ImageDerivativesField(source="user_image")
 
     class Meta:
         model = User
-        fields = ("id", "full_name", "phone_number", "user_image", "role", "remove_image")
+        fields = (
+            "id", "full_name", "phone_number", "user_image", "user_image_derivatives",
+            "role", "remove_image",
+        )
 
     def update(self, instance, validated_data):
         # Handle image removal
@@ -31,7 +36,9 @@ class UserSerializer(serializers.ModelSerializer):
         # Update the rest of the fields
         return super().update(instance, validated_data)
 class PublicUserSerializer(serializers.ModelSerializer):
+    user_image_derivatives = ImageDerivativesField(source="user_image")
+
     class Meta:
         model = User
-        fields = ["id", "full_name", "user_image", "role"]  # Exclude 'phone_number' or any other sensitive fields
+        fields = ["id", "full_name", "user_image", "user_image_derivatives", "role"]  # Exclude 'phone_number' or any other sensitive fields
         
@@ -1,16 +1,29 @@
+import asyncio
+import copy
 import io
 import json
 import os
+import queue
+import threading
+import time
 import uuid
+from collections import OrderedDict
 import urllib.request
 import urllib.parse
 import websocket
+from django.conf import settings
 from PIL import Image
 from job.models.Job import Job
+from utils import cui_async
+from utils.job_logs import JobLogBuffer, log_job
+from utils.job_progress import JobProgressTracker
 
 SERVER_ADDRESS = "127.0.0.1:8188"
 client_id = str(uuid.uuid4())
 
+# Seconds a prompt may stay silent before its job checks that ComfyUI still has it
+MESSAGE_TIMEOUT = 60
+
 
 def read_json_from_file(file_path):
     if not os.path.isfile(file_path):
@@ -21,97 +34,309 @@ def read_json_from_file(file_path):
         return json.loads(json_string)
 
 
-def queue_prompt(prompt, client_id):
+def queue_prompt(prompt, client_id, server_address=None):
     p = {"prompt": prompt, "client_id": client_id}
     data = json.dumps(p).encode("utf-8")
-    req = urllib.request.Request(f"http://{SERVER_ADDRESS}/prompt", data=data)
+    req = urllib.request.Request(
+        f"http://{server_address or SERVER_ADDRESS}/prompt", data=data
+    )
     return json.loads(urllib.request.urlopen(req).read())
 
 
-def get_image(filename, subfolder, folder_type):
+def get_image(filename, subfolder, folder_type, server_address=None):
     data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
     url_values = urllib.parse.urlencode(data)
     with urllib.request.urlopen(
-        f"http://{SERVER_ADDRESS}/view?{url_values}"
+        f"http://{server_address or SERVER_ADDRESS}/view?{url_values}"
     ) as response:
         return response.read()
 
 
-def get_history(prompt_id):
+def get_history(prompt_id, server_address=None):
     with urllib.request.urlopen(
-        f"http://{SERVER_ADDRESS}/history/{prompt_id}"
+        f"http://{server_address or SERVER_ADDRESS}/history/{prompt_id}"
     ) as response:
         return json.loads(response.read())
 
 
-def get_results(ws, prompt, client_id, job_id):
-    prompt_id = queue_prompt(prompt, client_id)["prompt_id"]
-    output_images = {}
-    output_texts = {}
+def get_queue(server_address=None, timeout=None):
+    """The prompts running and waiting on a ComfyUI server, from its /queue endpoint."""
+    with urllib.request.urlopen(
+        f"http://{server_address or SERVER_ADDRESS}/queue", timeout=timeout
+    ) as response:
+        queue_state = json.loads(response.read())
+    return queue_state["queue_running"] + queue_state["queue_pending"]
 
-    # Fetch the job instance once at the start
-    job = Job.objects.get(id=job_id)
-    print("starting the loop")
 
-    while True:
+def get_queue_depth(server_address=None, timeout=None):
+    """Prompts running or waiting on a ComfyUI server."""
+    return len(get_queue(server_address, timeout))
+
+
+def is_queued(prompt_id, server_address=None, timeout=None):
+    """Whether a prompt is running or waiting on a ComfyUI server."""
+    # Queue items are [number, prompt_id, prompt, extra_data, outputs_to_execute]
+    return any(item[1] == prompt_id for item in get_queue(server_address, timeout))
+
+
+class PromptStream:
+    """The WebSocket messages of one prompt, routed to it by a ComfyUIConnection."""
+
+    def __init__(self, connection, prompt_id):
+        self.connection = connection
+        self.prompt_id = prompt_id
+        self.messages = connection.queue_for(prompt_id)
+
+    def recv(self, timeout=None):
         try:
-            out = ws.recv()
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            raise websocket.WebSocketTimeoutException(
+                f"No message for prompt {self.prompt_id} in {timeout} seconds"
+            )
+
+    def close(self):
+        self.connection.release(self.prompt_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ComfyUIConnection:
+    """
+    One long-lived WebSocket to the ComfyUI server, shared by every job of a
+    worker process so several prompts can be in flight on it.
+
+    A reader thread routes text frames to the prompt they belong to by their
+    prompt_id; frames arriving before the job asks for them are kept until
+    it does. When the connection drops it reconnects with exponential
+    backoff, and prompts that finished meanwhile are completed from their
+    history, since ComfyUI doesn't resend the frames a client missed.
+    """
+
+    def __init__(self, server_address, min_backoff=0.5, max_backoff=30):
+        self.server_address = server_address
+        self.client_id = str(uuid.uuid4())
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.released = OrderedDict()  # Recently finished prompts, to drop late frames
+        self.ws = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def connect(self):
+        ws = websocket.WebSocket()
+        ws.connect(f"ws://{self.server_address}/ws?clientId={self.client_id}")
+        self.ws = ws
+        print("WebSocket connected...")
+
+    def start(self):
+        # Fail the first job right away if the server is down
+        self.connect()
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.closed = True
+        if self.ws is not None:
+            self.ws.close()
+
+    def run(self):
+        backoff = self.min_backoff
+        while not self.closed:
+            try:
+                if self.ws is None:
+                    self.connect()
+                    backoff = self.min_backoff
+                    self.recover()
+                out = self.ws.recv()
+            except (websocket.WebSocketException, OSError) as e:
+                if self.closed:
+                    break
+                print(f"WebSocket Error: {str(e)}, reconnecting in {backoff}s")
+                self.ws = None
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
             if isinstance(out, str):
-                # Log the message to the console and append to the job logs
+                self.dispatch(out)
+
+    def dispatch(self, out):
+        try:
+            prompt_id = (json.loads(out).get("data") or {}).get("prompt_id")
+        except (ValueError, AttributeError):
+            return
+        # Frames without a prompt, such as queue status, concern no job
+        if prompt_id and prompt_id not in self.released:
+            self.queue_for(prompt_id).put(out)
+
+    def recover(self):
+        """Finish the prompts that completed while the connection was down."""
+        with self.lock:
+            prompt_ids = list(self.queues)
+        for prompt_id in prompt_ids:
+            # This runs on the reader thread every job shares, so a prompt
+            # whose history can't be read is left to time out on its own
+            try:
+                finished = prompt_id in get_history(prompt_id, self.server_address)
+            except Exception as e:
+                print(f"Could not recover prompt {prompt_id}: {str(e)}")
+                continue
+            if finished:
+                done = {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}}
+                self.queue_for(prompt_id).put(json.dumps(done))
+
+    def queue_for(self, prompt_id):
+        with self.lock:
+            return self.queues.setdefault(prompt_id, queue.Queue())
+
+    def release(self, prompt_id):
+        with self.lock:
+            self.queues.pop(prompt_id, None)
+            self.released[prompt_id] = True
+            while len(self.released) > 1000:
+                self.released.popitem(last=False)
+
+    def queue_prompt(self, prompt):
+        """Queue a prompt on this connection and return the stream of its messages."""
+        prompt_id = queue_prompt(prompt, self.client_id, self.server_address)["prompt_id"]
+        return PromptStream(self, prompt_id)
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(server_address=None):
+    """
+    The connection of this process to a ComfyUI server. Forked Celery workers
+    each open their own, since a socket can't be shared across processes.
+    """
+    server_address = server_address or SERVER_ADDRESS
+    key = (os.getpid(), server_address)
+    with _connections_lock:
+        if key not in _connections:
+            _connections[key] = ComfyUIConnection(server_address).start()
+        return _connections[key]
+
+
+class ComfyUIPool:
+    """
+    The ComfyUI backends jobs are spread over. Each prompt is queued on the
+    healthy backend with the fewest prompts running or waiting, and its
+    messages, history and images then all come from that backend. A backend
+    that fails its /queue health check or a submission is left out for
+    retry_after seconds.
+    """
+
+    def __init__(self, server_addresses, retry_after=30, timeout=2):
+        self.server_addresses = list(server_addresses)
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.down_until = {}
+
+    def mark_down(self, server_address, error):
+        print(f"ComfyUI backend {server_address} is down: {str(error)}")
+        self.down_until[server_address] = time.monotonic() + self.retry_after
+
+    def queue_depths(self):
+        """The queue depth of every backend that is up, checking their health."""
+        now = time.monotonic()
+        depths = {}
+        for server_address in self.server_addresses:
+            if self.down_until.get(server_address, 0) > now:
+                continue
+            try:
+                depths[server_address] = get_queue_depth(server_address, self.timeout)
+            except (OSError, ValueError, KeyError) as e:
+                self.mark_down(server_address, e)
+        return depths
+
+    def queue_prompt(self, prompt):
+        """Queue a prompt on the least loaded backend and return the stream of its messages."""
+        # Prompts of this process are queued one at a time, so each sees the last in the depths
+        with self.lock:
+            depths = self.queue_depths()
+            for server_address in sorted(depths, key=depths.get):
+                try:
+                    return get_connection(server_address).queue_prompt(prompt)
+                except (websocket.WebSocketException, OSError, ValueError) as e:
+                    self.mark_down(server_address, e)
+        raise ConnectionError("No ComfyUI backend is available")
+
+
+_pool = None
+
+
+def get_pool():
+    """The pool of the ComfyUI backends in settings.COMFYUI_SERVERS."""
+    global _pool
+    if _pool is None:
+        _pool = ComfyUIPool(settings.COMFYUI_SERVERS)
+    return _pool
+
+
+def get_results(comfyui, prompt, job_id, output_path=None):
+    # comfyui is a ComfyUIConnection, or a ComfyUIPool picking one for the prompt.
+    # With an output_path template, images are streamed to files and their paths returned
+    stream = comfyui.queue_prompt(prompt)
+    prompt_id = stream.prompt_id
+    server_address = stream.connection.server_address
+    Job.objects.filter(pk=job_id).update(backend=server_address)
+
+    progress = JobProgressTracker(job_id, prompt_id, prompt)
+    print("starting the loop")
+
+    # Messages are appended to the job's log entries in batches
+    with stream, JobLogBuffer(job_id) as logs:
+        while True:
+            try:
+                out = stream.recv(timeout=MESSAGE_TIMEOUT)
                 print(f"WebSocket message: {out}")
                 message = json.loads(out)
-
-                # Append log to the job's logs field and save incrementally
-                job.logs = (job.logs or "") + out + "\n"
-                job.save()  # Save the logs incrementally to the database
+                logs.write(message["type"], message.get("data"))
+                progress.handle(message)
 
                 if message["type"] == "executing":
                     data = message["data"]
                     if data["node"] is None and data["prompt_id"] == prompt_id:
                         break  # Execution is done
-            else:
-                print(f"Non-string message received: {out}")
-        except websocket.WebSocketException as e:
-            job.logs = (job.logs or "") + f"WebSocket Error: {str(e)}\n"
-            job.save()
-            print(f"WebSocket Error: {str(e)}\n")
-            break  # Exit the loop on WebSocket error
-
-    # Fetch the job's history after WebSocket execution
-    history = get_history(prompt_id)[prompt_id]
-    print(history)
-
-    # Process output images
-    for node_id in history["outputs"]:
-        node_output = history["outputs"][node_id]
-        images_output = []
-        texts_output = []
-        if "images" in node_output:
-            for image in node_output["images"]:
-                image_data = get_image(
-                    image["filename"], image["subfolder"], image["type"]
-                )
-                images_output.append(image_data)
-        elif "text" in node_output:
-            for text in node_output["text"]:
-                texts_output.append(text)
-
-        output_texts[node_id] = texts_output
-        output_images[node_id] = images_output
+            except websocket.WebSocketTimeoutException as e:
+                # Queue status frames name no prompt, so a prompt waiting behind
+                # others gets no message at all; wait as long as ComfyUI has it
+                try:
+                    if is_queued(prompt_id, server_address, timeout=10):
+                        continue
+                    if prompt_id in get_history(prompt_id, server_address):
+                        break  # Finished, but its last messages were lost
+                except (OSError, ValueError, KeyError) as check_error:
+                    e = check_error
+                logs.write("error", {"message": f"Prompt lost: {str(e)}"}, "error")
+                print(f"Prompt lost: {str(e)}\n")
+                break
+            except websocket.WebSocketException as e:
+                logs.write("error", {"message": f"WebSocket Error: {str(e)}"}, "error")
+                print(f"WebSocket Error: {str(e)}\n")
+                break  # Exit the loop on WebSocket error
 
-    return output_images,output_texts
+    # Fetch the job's history and download its output images concurrently
+    output_images, output_texts = asyncio.run(
+        cui_async.fetch_outputs(prompt_id, server_address, output_path)
+    )
 
+    return output_images,output_texts
 
-def run_workflow(prompt, job_id, client_id):
-    # Start WebSocket connection
-    ws = websocket.WebSocket()
-    ws.connect(f"ws://{SERVER_ADDRESS}/ws?clientId={client_id}")
-    print("WebSocket connected...")
 
+def run_workflow(prompt, job_id, output_path=None):
     try:
-        # Run the image generation process and pass the job ID for logging
-        # print(job_id)
-        images,texts = get_results(ws, prompt, client_id, job_id)
+        # Run the image generation process on the least loaded ComfyUI backend
+        images,texts = get_results(get_pool(), prompt, job_id, output_path)
         job = Job.objects.get(id=job_id)
 
         # Update job output images in the database
@@ -120,14 +345,13 @@ def run_workflow(prompt, job_id, client_id):
         # print("completed")
     except Exception as e:
         job = Job.objects.get(id=job_id)
-        # Log errors in the job logs field
+        # Log errors in the job logs
         job.status = "failed"
-        job.logs = (job.logs or "") + f"Error: {str(e)}\n"
+        log_job(job_id, "error", {"message": f"Error: {str(e)}"}, "error")
         print(f"Error: {str(e)}\n")
         # job.output_images = {"error": str(e)}
     finally:
         job.save()
-        ws.close()
 
     # Display images (optional)
     # for node_id in images:
@@ -138,25 +362,71 @@ def run_workflow(prompt, job_id, client_id):
     return images,texts
 
 
-import json
+
+class WorkflowTemplate:
+    """
+    A workflow graph compiled for building job prompts. The (node_id,
+    input_name) points user inputs may patch are listed once, and a prompt
+    is built by copying only the nodes it patches; the other nodes are
+    shared with the template, so prompts must be treated as read-only.
+    """
+
+    def __init__(self, workflow_data, workflow_inputs):
+        self.graph = copy.deepcopy(workflow_data)
+        self.patch_points = frozenset(
+            (node_id, input_name)
+            for node_id, node_inputs in workflow_inputs.items()
+            if "inputs" in self.graph.get(node_id, {})
+            for input_name in node_inputs
+            if input_name in self.graph[node_id]["inputs"]
+        )
+
+    def render(self, user_inputs):
+        """The prompt with the user-provided {node_id: {input_name: input_value}} in place."""
+        prompt = dict(self.graph)
+        for node_id, node_inputs in user_inputs.items():
+            for input_name, input_value in node_inputs.items():
+                if (node_id, input_name) not in self.patch_points:
+                    continue
+                if prompt[node_id] is self.graph[node_id]:
+                    prompt[node_id] = {
+                        **self.graph[node_id],
+                        "inputs": dict(self.graph[node_id]["inputs"]),
+                    }
+                prompt[node_id]["inputs"][input_name] = input_value
+        return prompt
+
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def get_workflow_template(workflow, max_templates=256):
+    """
+    The compiled template of a workflow, kept per process and compiled again
+    once the workflow is saved with new data.
+    """
+    with _templates_lock:
+        cached = _templates.get(workflow.pk)
+        if cached is not None and cached[0] == workflow.last_modified:
+            _templates.move_to_end(workflow.pk)
+            return cached[1]
+
+    template = WorkflowTemplate(workflow.json_data, workflow.inputs)
+    with _templates_lock:
+        _templates[workflow.pk] = (workflow.last_modified, template)
+        _templates.move_to_end(workflow.pk)
+        while len(_templates) > max_templates:
+            _templates.popitem(last=False)
+    return template
 
 
 def replace_user_inputs(workflow_data, workflow_inputs, user_inputs):
     """
-    Replaces inputs in the workflow with the user-provided data.
+    Returns the workflow with the user-provided data in its inputs, leaving
+    workflow_data untouched.
     workflow_data: The original workflow JSON (already deserialized as a Python dict).
-    workflow_inputs: The mapping of inputs in the workflow {node_id: input_name}.
+    workflow_inputs: The mapping of inputs in the workflow {node_id: {input_name: input_type}}.
     user_inputs: The user-provided inputs for the job {node_id: {input_name: input_value}}.
     """
-    # Loop through each node and its input in the workflow's input mapping
-    for node_id, input_name in workflow_inputs.items():
-        if node_id in workflow_data and "inputs" in workflow_data[node_id]:
-            # If the user has provided inputs for this node
-            if node_id in user_inputs:
-                # Loop through the user-provided input values and assign them
-                for input_name, input_value in user_inputs[node_id].items():
-                    # Replace the corresponding input in the workflow
-                    if input_name in workflow_data[node_id]["inputs"]:
-                        workflow_data[node_id]["inputs"][input_name] = input_value
-
-    return workflow_data
+    return WorkflowTemplate(workflow_data, workflow_inputs).render(user_inputs)
@@ -0,0 +1,167 @@
+import asyncio
+import os
+
+import httpx
+
+from utils import cui
+from utils.job_images import finish_output_file, open_part_file
+
+# Bytes of a streamed download held in memory at a time
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class AsyncPromptStream:
+    """
+    asyncio view of the messages of a prompt on the shared WebSocket of the
+    worker (utils.cui.ComfyUIConnection), waited for in a thread.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.prompt_id = stream.prompt_id
+
+    async def recv(self, timeout=None):
+        return await asyncio.to_thread(self.stream.recv, timeout)
+
+    def close(self):
+        self.stream.close()
+
+
+class AsyncComfyUIClient:
+    """
+    asyncio client for the ComfyUI HTTP API. Requests share a pool of
+    keep-alive connections, image downloads run concurrently up to
+    max_downloads at a time, and every call can override the default
+    timeout in seconds.
+    """
+
+    def __init__(self, server_address=None, max_downloads=4, timeout=30):
+        self.downloads = asyncio.Semaphore(max_downloads)
+        self.http = httpx.AsyncClient(
+            base_url=f"http://{server_address or cui.SERVER_ADDRESS}",
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_downloads + 1),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def request(self, method, url, timeout=None, **kwargs):
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        response = await self.http.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def queue_prompt(self, prompt, client_id, timeout=None):
+        response = await self.request(
+            "POST",
+            "/prompt",
+            json={"prompt": prompt, "client_id": client_id},
+            timeout=timeout,
+        )
+        return response.json()
+
+    async def queue_on(self, connection, prompt, timeout=None):
+        """Queue a prompt on a shared WebSocket connection and stream its messages."""
+        prompt_id = (await self.queue_prompt(prompt, connection.client_id, timeout))[
+            "prompt_id"
+        ]
+        return AsyncPromptStream(cui.PromptStream(connection, prompt_id))
+
+    async def get_history(self, prompt_id, timeout=None):
+        response = await self.request("GET", f"/history/{prompt_id}", timeout=timeout)
+        return response.json()
+
+    async def get_image(self, filename, subfolder, folder_type, timeout=None):
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        async with self.downloads:
+            response = await self.request("GET", "/view", params=params, timeout=timeout)
+        return response.content
+
+    async def download_image(self, filename, subfolder, folder_type, base_path, timeout=None):
+        """
+        Stream an image in chunks to a file at base_path plus the extension of
+        its format, and return the path of the file.
+        """
+        kwargs = {"params": {"filename": filename, "subfolder": subfolder, "type": folder_type}}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        async with self.downloads:
+            file = open_part_file(os.path.dirname(base_path))
+            try:
+                with file:
+                    async with self.http.stream("GET", "/view", **kwargs) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            file.write(chunk)
+            except BaseException:
+                os.unlink(file.name)
+                raise
+        return finish_output_file(file.name, base_path)
+
+    async def get_outputs(self, prompt_id, timeout=None, output_path=None):
+        """
+        The output images and texts of a finished prompt by node id, like
+        utils.cui.get_results returns them, with the images of every node
+        downloaded concurrently. Given an output_path template, each image is
+        streamed to output_path.format(node_id=..., idx=...) plus its extension
+        instead, and its file path takes the place of its bytes.
+        """
+        history = (await self.get_history(prompt_id, timeout))[prompt_id]
+
+        downloads = {}
+        output_texts = {}
+        for node_id, node_output in history["outputs"].items():
+            downloads[node_id] = []
+            output_texts[node_id] = []
+            if "images" in node_output:
+                downloads[node_id] = [
+                    self.get_image(
+                        image["filename"], image["subfolder"], image["type"], timeout
+                    )
+                    if output_path is None
+                    else self.download_image(
+                        image["filename"],
+                        image["subfolder"],
+                        image["type"],
+                        output_path.format(node_id=node_id, idx=idx),
+                        timeout,
+                    )
+                    for idx, image in enumerate(node_output["images"])
+                ]
+            elif "text" in node_output:
+                output_texts[node_id] = list(node_output["text"])
+
+        # Every download settles before an error is raised, so the files of
+        # those that finished can be removed and none appears afterwards
+        results = await asyncio.gather(
+            *(download for node_downloads in downloads.values() for download in node_downloads),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            if output_path is not None:
+                for result in results:
+                    if isinstance(result, str):
+                        os.unlink(result)
+            raise errors[0]
+
+        results = iter(results)
+        output_images = {
+            node_id: [next(results) for _ in node_downloads]
+            for node_id, node_downloads in downloads.items()
+        }
+        return output_images, output_texts
+
+
+async def fetch_outputs(prompt_id, server_address=None, output_path=None, **options):
+    """Download the outputs of a finished prompt with a client of its own."""
+    async with AsyncComfyUIClient(server_address, **options) as client:
+        return await client.get_outputs(prompt_id, output_path=output_path)
@@ -0,0 +1,238 @@
+import logging
+import mimetypes
+import os
+from urllib.parse import urlencode
+
+from celery import shared_task
+from django.apps import apps
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.http import FileResponse, Http404, HttpResponseBadRequest
+from django.urls import reverse
+from kombu.exceptions import OperationalError
+from PIL import Image, ImageOps
+from rest_framework import permissions, serializers
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from utils.job_images import open_part_file
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels of each derivative, never upscaled
+DERIVATIVE_SIZES = {"thumb": 256, "medium": 1024}
+
+# Encoder options of each derivative format, used when Pillow can write it
+DERIVATIVE_FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 60},
+}
+
+# Image fields that get derivatives, by model
+IMAGE_FIELDS = {
+    "job.DatasetImage": "image",
+    "job.Character": "image",
+    "meal.Food": "image",
+    "user.User": "user_image",
+}
+
+
+def derivative_formats():
+    """The derivative formats the installed Pillow can encode, in order of preference."""
+    Image.init()
+    return [
+        extension
+        for extension, options in DERIVATIVE_FORMATS.items()
+        if options["format"] in Image.SAVE
+    ]
+
+
+def media_name(name, storage=default_storage):
+    """The name of a file relative to the storage, for the names saved as absolute paths."""
+    if os.path.isabs(name):
+        return os.path.relpath(name, storage.location)
+    return name
+
+
+def derivative_name(name, size, extension):
+    """
+    Derivatives are stored alongside the original under its full name, e.g.
+    food_images/pizza.png.thumb.webp, so pizza.png and pizza.jpg don't share them.
+    """
+    return f"{media_name(name)}.{size}.{extension}"
+
+
+def is_derivative_name(name):
+    """Whether a name is that of a derivative, e.g. food_images/pizza.png.thumb.webp."""
+    root, extension = os.path.splitext(name)
+    return extension[1:] in DERIVATIVE_FORMATS and os.path.splitext(root)[1][1:] in DERIVATIVE_SIZES
+
+
+def is_referenced_image(name, storage=default_storage):
+    """Whether an image field of IMAGE_FIELDS points to the image of a name."""
+    names = {name, storage.path(name)}
+    return any(
+        apps.get_model(label).objects.filter(**{f"{field_name}__in": names}).exists()
+        for label, field_name in IMAGE_FIELDS.items()
+    )
+
+
+def missing_derivatives(name, storage=default_storage):
+    return [
+        (size, extension)
+        for size in DERIVATIVE_SIZES
+        for extension in derivative_formats()
+        if not storage.exists(derivative_name(name, size, extension))
+    ]
+
+
+def save_derivative(image, path, extension):
+    """Encode a derivative to a part file renamed into place, so readers never see part of it."""
+    file = open_part_file(os.path.dirname(path))
+    try:
+        with file:
+            image.save(file, **DERIVATIVE_FORMATS[extension])
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+
+
+def generate_derivatives(name, storage=default_storage):
+    """
+    Write the missing derivatives of an image, decoding the original once and
+    scaling the smaller sizes down from the larger ones. Returns the names of
+    the derivatives written.
+    """
+    missing = missing_derivatives(name, storage)
+    if not missing:
+        return []
+
+    written = []
+    with Image.open(storage.path(media_name(name, storage))) as original:
+        # JPEG decodes straight at a fraction of its size when that's enough
+        largest = max(DERIVATIVE_SIZES.values())
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    for size, edge in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        for extension in derivative_formats():
+            if (size, extension) in missing:
+                derivative = derivative_name(name, size, extension)
+                save_derivative(image, storage.path(derivative), extension)
+                written.append(derivative)
+    return written
+
+
+@shared_task
+def generate_derivatives_task(name):
+    """Celery task writing the derivatives of an uploaded or generated image."""
+    return generate_derivatives(name)
+
+
+def schedule_derivatives(name):
+    """Generate the derivatives of an image in a worker once the transaction commits."""
+
+    def enqueue():
+        try:
+            generate_derivatives_task.delay(name)
+        except OperationalError as e:
+            # They are generated on their first request instead
+            logger.warning("Could not schedule the derivatives of %s: %s", name, e)
+
+    transaction.on_commit(enqueue)
+
+
+def schedule_on_save(sender, instance, **kwargs):
+    field_file = getattr(instance, IMAGE_FIELDS[sender._meta.label])
+    if field_file and missing_derivatives(field_file.name):
+        schedule_derivatives(field_file.name)
+
+
+def connect_derivative_signals():
+    for label in IMAGE_FIELDS:
+        post_save.connect(schedule_on_save, sender=label, dispatch_uid=f"derivatives:{label}")
+
+
+def derivative_urls(field_file, request=None):
+    """
+    The URLs of the derivatives of an image by size and format. Those not
+    generated yet point to serve_derivative, which generates them.
+    """
+    if not field_file:
+        return None
+    urls = {}
+    for size in DERIVATIVE_SIZES:
+        urls[size] = {}
+        for extension in derivative_formats():
+            name = derivative_name(field_file.name, size, extension)
+            if field_file.storage.exists(name):
+                url = field_file.storage.url(name)
+            else:
+                query = {"name": media_name(field_file.name), "size": size, "extension": extension}
+                url = f"{reverse('media-derivative')}?{urlencode(query)}"
+            urls[size][extension] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def thumbnail_url(field_file):
+    """
+    The URL of the preferred thumbnail of an image, for previews, or of the
+    image itself when Pillow can't encode any derivative format.
+    """
+    formats = derivative_formats()
+    if not formats:
+        return field_file.url
+    return derivative_urls(field_file)["thumb"][formats[0]]
+
+
+class ImageDerivativesField(serializers.Field):
+    """Read-only URLs of the derivatives of an image field, see derivative_urls."""
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return derivative_urls(value, self.context.get("request"))
+
+
+@api_view(["GET"])
+@authentication_classes([JWTAuthentication, SessionAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def serve_derivative(request):
+    """
+    Serve a derivative of a media image given by ?name=&size=&extension=,
+    generating the derivatives of the image on their first request. Only
+    images an IMAGE_FIELDS field points to have derivatives. Sessions are
+    accepted too, for the <img> previews of the admin.
+    """
+    name = request.GET.get("name", "")
+    size, extension = request.GET.get("size"), request.GET.get("extension")
+    if size not in DERIVATIVE_SIZES or extension not in derivative_formats():
+        return HttpResponseBadRequest("Unknown derivative size or format.")
+
+    try:
+        if (
+            is_derivative_name(name)
+            or not default_storage.exists(name)
+            or not is_referenced_image(name)
+        ):
+            raise Http404("Image not found.")
+        generate_derivatives(name)
+    except (SuspiciousFileOperation, OSError, ValueError, Image.DecompressionBombError):
+        raise Http404("Image not found.")
+
+    path = default_storage.path(derivative_name(name, size, extension))
+    response = FileResponse(
+        open(path, "rb"), content_type=mimetypes.guess_type(path)[0] or "image/webp"
+    )
+    response["Cache-Control"] = "public, max-age=86400"
+    return response
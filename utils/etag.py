@@ -0,0 +1,56 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+from rest_framework import status
+
+
+def conditional_etag(fingerprint):
+    """
+    Give successful GET responses of a viewset action a strong ETag and, when
+    known, a Last-Modified header, and answer requests whose If-None-Match or
+    If-Modified-Since still match with 304 before the view runs.
+
+    fingerprint(view, request, *args, **kwargs) returns a JSON-serializable
+    summary of the data behind the response and its last modification time
+    (or None), or None to leave the response without validators.
+    """
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view_method(self, request, *args, **kwargs)
+
+            fingerprinted = fingerprint(self, request, *args, **kwargs)
+            if fingerprinted is None:
+                return view_method(self, request, *args, **kwargs)
+
+            parts, last_modified = fingerprinted
+            raw = json.dumps(
+                [request.get_host(), get_language(), request.get_full_path(), parts],
+                default=str,
+            )
+            etag = quote_etag(hashlib.sha1(raw.encode("utf-8")).hexdigest())
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+
+            # 304s carry the same validators as the response they stand for
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+            return response
+
+        return wrapper
+
+    return decorator
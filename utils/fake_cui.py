@@ -0,0 +1,240 @@
+import base64
+import hashlib
+import json
+import select
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def encode_frame(payload, opcode=0x1):
+    """Encode an unmasked, unfragmented server-to-client WebSocket frame."""
+    header = bytearray([0x80 | opcode])
+    if len(payload) < 126:
+        header.append(len(payload))
+    elif len(payload) < 1 << 16:
+        header.append(126)
+        header += struct.pack("!H", len(payload))
+    else:
+        header.append(127)
+        header += struct.pack("!Q", len(payload))
+    return bytes(header) + payload
+
+
+class FakeComfyUI:
+    """
+    In-process stand-in for a ComfyUI server, for benchmarks and tests.
+
+    Serves /prompt, /queue, /history/<prompt_id>, /view and /ws. Prompts run
+    workers at a time, like a GPU box running one, or all at once when
+    workers is None. Every running prompt gets the given WebSocket messages
+    replayed, delay seconds apart, with their prompt_id replaced by the
+    queued one and followed by the final "executing" message. Like ComfyUI, messages go to the current socket of
+    the client that queued the prompt and are lost while it is disconnected.
+    Finished prompts report the given outputs in their history, and /view
+    serves images by filename after view_delay seconds, keeping count of the
+    most downloads it served at once.
+    """
+
+    def __init__(
+        self,
+        messages=(),
+        outputs=None,
+        images=None,
+        delay=0,
+        view_delay=0,
+        workers=None,
+        host="127.0.0.1",
+    ):
+        self.messages = list(messages)
+        self.outputs = outputs or {}
+        self.images = images or {}
+        self.delay = delay
+        self.view_delay = view_delay
+        self.active_views = 0
+        self.max_active_views = 0
+        self.lock = threading.Lock()
+        self.sockets = {}
+        self.slots = threading.Semaphore(workers) if workers else nullcontext()
+        self.numbers = 0
+        self.pending = OrderedDict()
+        self.running = OrderedDict()
+        self.finished = set()
+        self.connections = 0
+        self.server = ThreadingHTTPServer((host, 0), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        host, port = self.server.server_address
+        return f"{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.drop_connections()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def drop_connections(self):
+        """Cut every WebSocket connection, as a restarting server would."""
+        with self.lock:
+            sockets = list(self.sockets.values())
+        for connection, _ in sockets:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def send(self, client_id, payload, opcode=0x1):
+        with self.lock:
+            connection, send_lock = self.sockets.get(client_id, (None, None))
+        if connection is None:
+            return
+        try:
+            with send_lock:
+                connection.sendall(encode_frame(payload, opcode))
+        except OSError:
+            pass
+
+    def enqueue(self, prompt_id):
+        with self.lock:
+            self.numbers += 1
+            self.pending[prompt_id] = self.numbers
+
+    def queue_state(self):
+        with self.lock:
+            return {
+                name: [[number, prompt_id, {}, {}, []] for prompt_id, number in items.items()]
+                for name, items in (
+                    ("queue_running", self.running),
+                    ("queue_pending", self.pending),
+                )
+            }
+
+    def replay(self, client_id, prompt_id):
+        with self.slots:
+            with self.lock:
+                self.running[prompt_id] = self.pending.pop(prompt_id)
+            for message in self.messages:
+                time.sleep(self.delay)
+                if isinstance(message, bytes):
+                    self.send(client_id, message, 0x2)
+                    continue
+                message = json.loads(json.dumps(message))
+                if "prompt_id" in message.get("data", {}):
+                    message["data"]["prompt_id"] = prompt_id
+                self.send(client_id, json.dumps(message).encode("utf-8"))
+
+            with self.lock:
+                del self.running[prompt_id]
+                self.finished.add(prompt_id)
+        done = {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}}
+        self.send(client_id, json.dumps(done).encode("utf-8"))
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, body, content_type="application/json"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if urlparse(self.path).path != "/prompt":
+                    return self.send_error(404)
+                prompt_id = str(uuid.uuid4())
+                fake.enqueue(prompt_id)
+                self.send_body(json.dumps({"prompt_id": prompt_id}).encode("utf-8"))
+                threading.Thread(
+                    target=fake.replay,
+                    args=(json.loads(body)["client_id"], prompt_id),
+                    daemon=True,
+                ).start()
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path == "/ws":
+                    return self.serve_websocket(query["clientId"])
+                if url.path == "/queue":
+                    return self.send_body(json.dumps(fake.queue_state()).encode("utf-8"))
+                if url.path.startswith("/history/"):
+                    prompt_id = url.path[len("/history/"):]
+                    history = {}
+                    if prompt_id in fake.finished:
+                        history[prompt_id] = {"outputs": fake.outputs}
+                    return self.send_body(json.dumps(history).encode("utf-8"))
+                if url.path == "/view" and query.get("filename") in fake.images:
+                    return self.serve_view(query["filename"])
+                self.send_error(404)
+
+            def serve_view(self, filename):
+                with fake.lock:
+                    fake.active_views += 1
+                    fake.max_active_views = max(fake.max_active_views, fake.active_views)
+                try:
+                    time.sleep(fake.view_delay)
+                    self.send_body(fake.images[filename], "image/png")
+                finally:
+                    with fake.lock:
+                        fake.active_views -= 1
+
+            def serve_websocket(self, client_id):
+                key = self.headers["Sec-WebSocket-Key"] + WEBSOCKET_GUID
+                accept = base64.b64encode(hashlib.sha1(key.encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.wfile.flush()
+
+                entry = (self.connection, threading.Lock())
+                with fake.lock:
+                    fake.sockets[client_id] = entry
+                    fake.connections += 1
+
+                # Any frame from the client is its close frame
+                try:
+                    select.select([self.connection], [], [])
+                finally:
+                    with fake.lock:
+                        if fake.sockets.get(client_id) is entry:
+                            del fake.sockets[client_id]
+                try:
+                    with entry[1]:
+                        self.connection.sendall(
+                            encode_frame(struct.pack("!H", 1000), 0x8)
+                        )
+                except OSError:
+                    pass
+                self.close_connection = True
+
+        return Handler
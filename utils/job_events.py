@@ -0,0 +1,118 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+
+def channel_name(job_id):
+    return f"job_events:{job_id}"
+
+
+class LocalBroker:
+    """
+    Fan-out between the threads of one process. Subscribers are asyncio
+    queues, fed through their event loop so publishers can be plain threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                pass  # The loop of the subscriber is closed
+
+    async def subscribe(self, channels):
+        return LocalSubscription(self, channels)
+
+
+class LocalSubscription:
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with broker.lock:
+            for channel in channels:
+                broker.subscribers[channel].add(self.subscriber)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.subscriber[1].get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        with self.broker.lock:
+            for channel in self.channels:
+                self.broker.subscribers[channel].discard(self.subscriber)
+                if not self.broker.subscribers[channel]:
+                    del self.broker.subscribers[channel]
+
+
+class RedisBroker:
+    """Fan-out through Redis pub/sub, from Celery workers to every web process."""
+
+    def __init__(self, url):
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channels):
+        subscription = RedisSubscription(self.url)
+        await subscription.pubsub.subscribe(*channels)
+        return subscription
+
+
+class RedisSubscription:
+    def __init__(self, url):
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+
+    async def get(self, timeout):
+        message = await self.pubsub.get_message(timeout=timeout)
+        return json.loads(message["data"]) if message else None
+
+    async def close(self):
+        await self.pubsub.close()
+        await self.client.close()
+
+
+_brokers = {}
+
+
+def get_broker():
+    # Tasks run in Celery workers, so by default events go through the Redis
+    # Celery already requires; only an empty URL keeps them in this process
+    url = getattr(settings, "JOB_EVENTS_REDIS_URL", None)
+    if url is None:
+        url = getattr(settings, "CELERY_BROKER_URL", None)
+    if url not in _brokers:
+        _brokers[url] = RedisBroker(url) if url else LocalBroker()
+    return _brokers[url]
+
+
+def publish_job_event(job_id, event, data):
+    """
+    Push an event of a job to the clients following it. Failing to publish
+    never fails the job; clients still get the state when they reconnect.
+    """
+    message = {"job": job_id, "event": event, "data": data}
+    try:
+        get_broker().publish(channel_name(job_id), message)
+    except redis.RedisError as e:
+        print(f"Could not publish {event} of job {job_id}: {e}")
+
+
+async def subscribe_to_jobs(job_ids):
+    return await get_broker().subscribe([channel_name(job_id) for job_id in job_ids])
@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+# Formats ComfyUI saves outputs in, with the extension their files get
+OUTPUT_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}
+
+
+def read_image_header(image_data):
+    """
+    The format and (width, height) of an encoded image, read from its header
+    alone; the pixels are never decoded. Raises ValueError for anything that
+    isn't a non-empty image in one of the output formats.
+    """
+    return read_file_header(io.BytesIO(image_data))
+
+
+def read_file_header(file):
+    """Like read_image_header, for an image in a file object open for binary reading."""
+    try:
+        with Image.open(file) as image:
+            image_format, size = image.format, image.size
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Invalid output image: {str(e)}")
+    if image_format not in OUTPUT_EXTENSIONS or not all(size):
+        raise ValueError(f"Invalid output image: {image_format} {size[0]}x{size[1]}")
+    return image_format, size
+
+
+def open_part_file(directory):
+    """A temporary file in directory to write an output image to until it is complete."""
+    return tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False)
+
+
+def finish_output_file(part_path, base_path):
+    """
+    Rename a completely written output image to base_path plus the extension
+    of its format, checked from its header. Renaming within the directory is
+    atomic, so a reader never sees part of an image. The part file is removed
+    if it isn't a valid image. Returns the path of the file.
+    """
+    try:
+        with open(part_path, "rb") as file:
+            image_format, _ = read_file_header(file)
+        file_path = f"{base_path}.{OUTPUT_EXTENSIONS[image_format]}"
+        os.replace(part_path, file_path)
+    except BaseException:
+        os.unlink(part_path)
+        raise
+    return file_path
+
+
+def save_output_image(image_data, base_path):
+    """
+    Write an output image to base_path plus the extension of its format,
+    byte for byte as ComfyUI encoded it. Returns the path of the file.
+    """
+    file = open_part_file(os.path.dirname(base_path))
+    try:
+        with file:
+            file.write(image_data)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+    return finish_output_file(file.name, base_path)
@@ -0,0 +1,46 @@
+import time
+
+from job.models.JobLogEntry import JobLogEntry
+
+
+class JobLogBuffer:
+    """
+    Collect log entries of a job and append them to its JobLogEntry records
+    in batches, once max_entries are buffered or max_delay seconds passed
+    since the last flush (checked when an entry is written).
+
+    Use it as a context manager so the rest is flushed when the job
+    completes or fails.
+    """
+
+    def __init__(self, job_id, max_entries=200, max_delay=1.0):
+        self.job_id = job_id
+        self.max_entries = max_entries
+        self.max_delay = max_delay
+        self.entries = []
+        self.last_flush = time.monotonic()
+
+    def write(self, type, payload=None, level="info"):
+        self.entries.append((level, type, payload))
+        if (
+            len(self.entries) >= self.max_entries
+            or time.monotonic() - self.last_flush >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self):
+        if self.entries:
+            JobLogEntry.objects.append(self.job_id, self.entries)
+            self.entries = []
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def log_job(job_id, type, payload=None, level="info"):
+    """Append a single entry to the log of a job."""
+    JobLogEntry.objects.append(job_id, [(level, type, payload)])
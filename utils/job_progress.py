@@ -0,0 +1,90 @@
+import time
+
+from job.models.Job import Job
+from utils.job_events import publish_job_event
+
+
+class JobProgressTracker:
+    """
+    Follow the ComfyUI messages of a prompt and keep Job.progress up to date
+    with the executing node, its sampler steps, the overall percent and an
+    estimate of the remaining time.
+
+    Progress is written with a single UPDATE, and published to the clients
+    following the job, when the executing node changes, when the prompt
+    finishes, and otherwise at most every min_interval seconds, so sampler
+    steps don't turn into a write each.
+    """
+
+    def __init__(self, job_id, prompt_id, prompt, min_interval=0.5):
+        self.job_id = job_id
+        self.prompt_id = prompt_id
+        self.prompt = prompt or {}
+        self.min_interval = min_interval
+        self.node = None
+        self.value = 0
+        self.max = 0
+        self.nodes_done = 0
+        self.finished = False
+        self.started_at = time.monotonic()
+        self.saved_at = None
+
+    def handle(self, message):
+        data = message.get("data") or {}
+        if data.get("prompt_id", self.prompt_id) != self.prompt_id:
+            return
+
+        node_changed = False
+        if message["type"] == "execution_start":
+            self.started_at = time.monotonic()
+        elif message["type"] == "execution_cached":
+            self.nodes_done += len(data.get("nodes", []))
+        elif message["type"] == "executing":
+            if self.node is not None:
+                self.nodes_done += 1
+            self.node = data["node"]
+            self.value = self.max = 0
+            self.finished = self.node is None
+            node_changed = True
+        elif message["type"] == "progress":
+            self.value = data.get("value", 0)
+            self.max = data.get("max", 0)
+        else:
+            return
+
+        now = time.monotonic()
+        if (
+            node_changed
+            or self.saved_at is None
+            or now - self.saved_at >= self.min_interval
+        ):
+            self.save()
+
+    def fraction(self):
+        if self.finished:
+            return 1.0
+        step = self.value / self.max if self.max else 0
+        if not self.prompt:
+            return step
+        return min((self.nodes_done + step) / len(self.prompt), 1.0)
+
+    def state(self):
+        fraction = self.fraction()
+        elapsed = time.monotonic() - self.started_at
+        eta = elapsed * (1 - fraction) / fraction if 0 < fraction < 1 else None
+        return {
+            "node": self.node,
+            "node_type": self.prompt.get(self.node, {}).get("class_type"),
+            "value": self.value,
+            "max": self.max,
+            "nodes_done": self.nodes_done,
+            "node_count": len(self.prompt),
+            "percent": round(fraction * 100, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+    def save(self):
+        state = self.state()
+        Job.objects.filter(pk=self.job_id).update(progress=state)
+        publish_job_event(self.job_id, "progress", state)
+        self.saved_at = time.monotonic()
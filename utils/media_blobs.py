@@ -0,0 +1,173 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils.timezone import now
+
+from utils.job_images import open_part_file
+
+BLOB_DIRECTORY = "blobs"
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Image fields stored as blobs, by model
+BLOB_FIELDS = {
+    "job.DatasetImage": "image",
+    "job.Character": "image",
+    "meal.Food": "image",
+}
+
+
+def blob_name(sha256, extension):
+    """Blobs are sharded by the start of their hash, e.g. blobs/ab/cd/abcd....png."""
+    return os.path.join(BLOB_DIRECTORY, sha256[:2], sha256[2:4], f"{sha256}{extension.lower()}")
+
+
+class BlobStorage(FileSystemStorage):
+    """
+    Media storage keeping each distinct content once, under the sha256 of its
+    bytes rather than the name it is saved as. MediaBlob rows count the
+    references to each blob, and deleting a blob that is still referenced
+    does nothing.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        return self.store(content.chunks(), os.path.splitext(name)[1])
+
+    def store(self, chunks, extension):
+        """Hash and write chunks of bytes in one pass. Returns the name of their blob."""
+        directory = self.path(BLOB_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        digest, size = hashlib.sha256(), 0
+        file = open_part_file(directory)
+        try:
+            with file:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+            return self._commit(file.name, digest.hexdigest(), size, extension)
+        except BaseException:
+            if os.path.exists(file.name):
+                os.unlink(file.name)
+            raise
+
+    def store_file(self, path):
+        """
+        Move a file already in the media directory into its blob, or remove it
+        when an identical blob exists. Returns the name of the blob.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self._commit(
+            path, digest.hexdigest(), os.path.getsize(path), os.path.splitext(path)[1]
+        )
+
+    def _commit(self, path, sha256, size, extension):
+        from job.models.MediaBlob import MediaBlob
+
+        blob, created = MediaBlob.objects.get_or_create(
+            sha256=sha256, defaults={"name": blob_name(sha256, extension), "size": size}
+        )
+        if not created:
+            # Keeps a blob whose last reference just went until the caller
+            # references it, see MediaBlobQuerySet.unreferenced
+            MediaBlob.objects.filter(pk=blob.pk).update(stored_at=now())
+        target = self.path(blob.name)
+        if os.path.exists(target):
+            os.unlink(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        return blob.name
+
+    def delete(self, name, grace=None):
+        """
+        Delete a blob and its derivatives, unless something still references
+        it or it was stored within the grace period. Files of other names are
+        deleted as usual.
+        """
+        from job.models.MediaBlob import MediaBlob
+
+        blobs = MediaBlob.objects.filter(name=name)
+        # The row is deleted in one conditional query, so a blob stored again
+        # since the check that queued this can't be lost
+        if blobs.exists() and not blobs.unreferenced(grace).delete()[0]:
+            return
+        self._delete_files(name)
+
+    def discard(self, names, stored_before=None):
+        """
+        Delete blobs a failed write stored and nothing has referenced since,
+        without the grace period, unless they were stored again after
+        stored_before (now by default).
+        """
+        from job.models.MediaBlob import MediaBlob
+
+        stored_before = stored_before or now()
+        for name in set(names):
+            unreferenced = MediaBlob.objects.filter(
+                name=name, ref_count__lte=0, stored_at__lte=stored_before
+            )
+            if unreferenced.delete()[0]:
+                self._delete_files(name)
+
+    def _delete_files(self, name):
+        from utils.derivatives import DERIVATIVE_FORMATS, DERIVATIVE_SIZES, derivative_name
+
+        for size in DERIVATIVE_SIZES:
+            for extension in DERIVATIVE_FORMATS:
+                super().delete(derivative_name(name, size, extension))
+        super().delete(name)
+
+
+_storage = BlobStorage()
+
+
+def blob_storage():
+    """The storage of the image fields in BLOB_FIELDS."""
+    return _storage
+
+
+def remember_blob(sender, instance, **kwargs):
+    """Before an update, note the blob the row referenced until now."""
+    instance._stored_blob_name = None
+    if not instance._state.adding:
+        instance._stored_blob_name = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list(BLOB_FIELDS[sender._meta.label], flat=True)
+            .first()
+        )
+
+
+def count_blob_references(sender, instance, **kwargs):
+    from job.models.MediaBlob import MediaBlob
+
+    name = getattr(instance, BLOB_FIELDS[sender._meta.label]).name or None
+    previous = getattr(instance, "_stored_blob_name", None)
+    if name != previous:
+        MediaBlob.objects.acquire([name])
+        if previous:
+            MediaBlob.objects.release([previous])
+    instance._stored_blob_name = name
+
+
+def release_blob(sender, instance, **kwargs):
+    from job.models.MediaBlob import MediaBlob
+
+    name = getattr(instance, BLOB_FIELDS[sender._meta.label]).name
+    if name:
+        MediaBlob.objects.release([name])
+
+
+def connect_blob_signals():
+    for label in BLOB_FIELDS:
+        uid = f"blobs:{label}"
+        pre_save.connect(remember_blob, sender=label, dispatch_uid=uid)
+        post_save.connect(count_blob_references, sender=label, dispatch_uid=uid)
+        post_delete.connect(release_blob, sender=label, dispatch_uid=uid)
@@ -15,3 +15,4 @@ class S(D):
     FOOD = "food"
     RATE = "rate"
     UNIQUE = "unique"
+    INDEX = "index"
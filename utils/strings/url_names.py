@@ -9,6 +9,7 @@ class U:
     V1_MEAL = "V1_MEAL"
     V1_COMMENT = "V1_COMMENT"
     V1_RATE = "V1_RATE"
+    V1_CACHE_STATS = "V1_CACHE_STATS"
     """
     User API list
     """
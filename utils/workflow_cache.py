@@ -0,0 +1,82 @@
+import copy
+import hashlib
+import json
+from datetime import timedelta
+
+from django.db.models.signals import post_delete
+
+from job.models.Dataset import Dataset, DatasetImage
+from job.models.MediaBlob import MediaBlob
+from job.models.WorkflowResult import WorkflowResult
+from utils.job_logs import log_job
+
+
+def workflow_cache_key(prompt, outputs):
+    """
+    Hash of a prompt ready for ComfyUI and the workflow outputs its result is
+    mapped to. Node titles in _meta don't change what ComfyUI generates, and
+    keys are sorted so equal graphs hash the same however they were built.
+    """
+    graph = {
+        node_id: {key: value for key, value in node.items() if key != "_meta"}
+        for node_id, node in prompt.items()
+    }
+    canonical = json.dumps(
+        {"prompt": graph, "outputs": outputs},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def complete_from_cache(job, source):
+    """
+    Complete a job with the outputs of an earlier job that ran the same prompt.
+    Its images are linked to the job as new DatasetImages sharing the files,
+    which count as references to their blobs, and the image ids in its result data point to them.
+    """
+    images = list(source.images.all())
+    linked = DatasetImage.objects.bulk_create(
+        DatasetImage(
+            job=job,
+            name=image.name,
+            image=image.image.name,
+            created_by=job.user,
+            negative_prompt=image.negative_prompt,
+            complex_prompt=image.complex_prompt,
+            tag_prompt=image.tag_prompt,
+        )
+        for image in images
+    )
+    MediaBlob.objects.acquire(link.image.name for link in linked)
+    image_ids = {str(image.id): str(link.id) for image, link in zip(images, linked)}
+
+    result_data = copy.deepcopy(source.result_data) or {}
+    for node_outputs in result_data.values():
+        for output in node_outputs.values():
+            if output.get("type") == "image" and output.get("id") in image_ids:
+                output["id"] = image_ids[output["id"]]
+
+    job.result_data = result_data
+    job.status = "completed"
+    job.runtime = timedelta(0)
+    if not job.dataset_id:
+        job.dataset = Dataset.temporary_for(job.user)
+    job.save()
+    log_job(job.id, "cache_hit", {"job": source.id})
+
+
+def drop_results_of_deleted_image(sender, instance, **kwargs):
+    """
+    A job missing one of its images can't be reused, as its result data
+    would point to the deleted image and maybe to a deleted file.
+    """
+    if instance.job_id:
+        WorkflowResult.objects.filter(job_id=instance.job_id).delete()
+
+
+def connect_workflow_cache_signals():
+    post_delete.connect(
+        drop_results_of_deleted_image, sender=DatasetImage, dispatch_uid="workflow_cache"
+    )